@@ -1,6 +1,7 @@
 from azure.storage.blob import BlobServiceClient, generate_blob_sas, BlobSasPermissions
 from datetime import datetime,timedelta
 from utils.config import config
+from idiagnose_common.metrics import timed
 
 config_instance=config()
 
@@ -27,6 +28,7 @@ class CloudInterface:
         
         return sas_url
     
+    @timed('blob')
     def download_latest(self,cont_name):
         blob_service_client = BlobServiceClient(account_url=config_instance.blob_endpoint, credential=config_instance.account_key)
         container_client = blob_service_client.get_container_client(cont_name) 
@@ -36,6 +38,7 @@ class CloudInterface:
         latest_url = self.create_SAS_token(blob_name,cont_name,duration=30)
         return latest_url
     
+    @timed('blob')
     def delete_blob(self,cont_name,blob_name):
         blob_service_client = BlobServiceClient(account_url=config_instance.blob_endpoint, credential=config_instance.account_key)
         blob_client = blob_service_client.get_blob_client(container=cont_name, blob=blob_name)
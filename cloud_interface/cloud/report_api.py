@@ -1,10 +1,12 @@
 from azure.storage.blob import BlobServiceClient
 from datetime import datetime,timedelta
 from utils.config import config
+from idiagnose_common.metrics import timed
 
 config_instance=config()
 
 class ReportMaintainanceStorage:
+    @timed('blob')
     def upload_b64_to_cloud(self, b64_data, filename, type):
         if type == "image":
             container = config_instance.dcmimage_container
@@ -5,6 +5,7 @@ from azure.identity import DefaultAzureCredential
 from azure.core.exceptions import HttpResponseError
 from datetime import datetime,timedelta
 from utils.config import config
+from idiagnose_common.metrics import timed
 
 config_instance=config()
 
@@ -12,6 +13,7 @@ class TestDataStorage:
     def __init__(self):
         pass
     
+    @timed('blob')
     def upload_blob(self,cont_name,filename,file_data):
         blob_service_client = BlobServiceClient(account_url=config_instance.blob_endpoint, credential=config_instance.account_key)
         container_client = blob_service_client.get_container_client(cont_name)
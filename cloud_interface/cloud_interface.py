@@ -17,6 +17,8 @@ from cloud.train_api import TrainDataStorage
 from cloud.test_api import TestDataStorage
 from cloud.report_api import ReportMaintainanceStorage
 from utils.config import config
+from idiagnose_common.metrics import init_metrics, track_dependency
+from idiagnose_common.tracing import init_tracing
 
 
 config_instance=config()
@@ -28,6 +30,8 @@ test_instance=TestDataStorage()
 report_instance=ReportMaintainanceStorage()
 
 app = Flask(__name__)
+init_metrics(app)
+init_tracing(app, 'cloud_interface')
 with open('config/auth_config.yaml', 'r') as config_file:
     config = yaml.safe_load(config_file)
 app.config['JWT_SECRET_KEY'] = config['development']['jwt_secret_key']
@@ -39,28 +43,37 @@ ap = argparse.ArgumentParser()
 ap.add_argument("-local","--docker_image",help="Docker images for training")
 args = vars(ap.parse_args())
 
+def get_upload_stream():
+    """
+    Returns the uploaded zip as a stream for the blob upload, without saving it
+    to disk first. A raw application/zip body (sent in chunks by the gateway)
+    is passed through as it arrives; a multipart 'file' part is still accepted.
+    """
+    if request.mimetype == 'application/zip':
+        return request.stream, None
+    if 'file' not in request.files:
+        return None, (jsonify({'message': 'No file part in the request'}), 400)
+
+    file = request.files['file']
+    
+    if file.filename == '':
+        return None, (jsonify({'message': 'No selected file'}), 400)
+    return file.stream, None
+
 @app.route('/cloud-api/test-data/lungs-xray', methods=['POST'])
 @jwt_required()
 def test_data_lungs():
     try:
         current_user = get_jwt_identity() 
         app.logger.info(f"logged in as:{current_user}")
-        if 'file' not in request.files:
-            return jsonify({'message': 'No file part in the request'}), 400
-
-        file = request.files['file']
-        
-        if file.filename == '':
-            return jsonify({'message': 'No selected file'}), 400
-        
-        temp_file_path = os.path.join(os.getcwd(), file.filename)
-        file.save(temp_file_path)
+        file_data, error = get_upload_stream()
+        if error is not None:
+            return error
    
         try:
             blob_name,test_storage_id,timestamp_str=test_instance.generate_name(prefix="test_data")
-            with open(temp_file_path, 'rb') as file_data:
-                blob_url= test_instance.upload_blob(config_instance.train_container,blob_name,file_data)
-                result=Mongo_collect.Test_data_DB_update(test_storage_id,blob_url,blob_name,timestamp_str)
+            blob_url= test_instance.upload_blob(config_instance.train_container,blob_name,file_data)
+            result=Mongo_collect.Test_data_DB_update(test_storage_id,blob_url,blob_name,timestamp_str)
                     
             app.logger.info(f"File uploaded to Azure Blob Storage with name: {blob_name}")
             response_data = { 'test_storage_id': test_storage_id}
@@ -81,21 +94,13 @@ def train_data_lungs():
     try:
         current_user = get_jwt_identity() 
         app.logger.info(f"logged in as:{current_user}")     
-        if 'file' not in request.files:
-            return jsonify({'message': 'No file part in the request'}), 400
-
-        file = request.files['file']
-        
-        if file.filename == '':
-            return jsonify({'message': 'No selected file'}), 400
-        
-        temp_file_path = os.path.join(os.getcwd(), file.filename)
-        file.save(temp_file_path)   
+        file_data, error = get_upload_stream()
+        if error is not None:
+            return error
         try:
             blob_name,train_storage_id,timestamp_str=train_instance.generate_name(prefix="train_data")
-            with open(temp_file_path, 'rb') as file_data:
-                blob_url=train_instance.upload_blob(config_instance.train_container,blob_name,file_data)
-                inserted_id = Mongo_collect.Train_data_DB_update(train_storage_id, blob_url, blob_name,timestamp_str)
+            blob_url=train_instance.upload_blob(config_instance.train_container,blob_name,file_data)
+            inserted_id = Mongo_collect.Train_data_DB_update(train_storage_id, blob_url, blob_name,timestamp_str)
              
             app.logger.info(f"File uploaded to Azure Blob Storage with name: {blob_name}")
             response_data = { 'train_storage_id': train_storage_id}
@@ -119,9 +124,10 @@ def get_report():
         patient_id = data['PatientID']
         series_id = data['SeriesUID']
         # Check if the patient ID already exists
-        patient_data = Mongo_collect.report_mongo_collection.find({"Patient_ID": patient_id})
-        patient_list = list(patient_data)
-        series_data = Mongo_collect.report_mongo_collection.find_one({"Patient_ID": patient_id, "SeriesUID": series_id}) #To check if series ID belongs to the patient ID
+        with track_dependency('mongo', 'get_report'):
+            patient_data = Mongo_collect.report_mongo_collection.find({"Patient_ID": patient_id})
+            patient_list = list(patient_data)
+            series_data = Mongo_collect.report_mongo_collection.find_one({"Patient_ID": patient_id, "SeriesUID": series_id}) #To check if series ID belongs to the patient ID
         if patient_list:
             if series_data:
                 return_data = Mongo_collect.build_dicom_return_json(series_data)
@@ -143,8 +149,9 @@ def check_report():
         data = request.get_json()
         patient_id = data['PatientID']
 
-        patient_data = Mongo_collect.report_mongo_collection.find({"Patient_ID": patient_id})
-        patient_list = list(patient_data)
+        with track_dependency('mongo', 'check_report'):
+            patient_data = Mongo_collect.report_mongo_collection.find({"Patient_ID": patient_id})
+            patient_list = list(patient_data)
         
         pacs_series_uids = data['SeriesUID']
         mongo_series_uids = [item['SeriesUID'] for item in patient_list]
@@ -318,7 +325,9 @@ def study_list_handler():
         app.logger.info(f"logged in as:{current_user}")
         if (request.method == 'GET'):
             app.logger.info("Getting PACS studies list from database")
-            if Mongo_collect.dicomstudies_mongo_collection.count_documents({}) == 0:
+            with track_dependency('mongo', 'count_dicom_studies'):
+                study_count = Mongo_collect.dicomstudies_mongo_collection.count_documents({})
+            if study_count == 0:
                 return jsonify({"message": "Dicom Studies list is empty"}), 204
             else:
                 out = Mongo_collect.get_dicom_study_list()
@@ -327,7 +336,8 @@ def study_list_handler():
         elif (request.method == 'POST'):
             app.logger.info("Updating new PACS studies list to Database")
             data = request.get_json()
-            out = Mongo_collect.dicomstudies_mongo_collection.insert_many(data["series"])
+            with track_dependency('mongo', 'insert_dicom_studies'):
+                out = Mongo_collect.dicomstudies_mongo_collection.insert_many(data["series"])
             if out.acknowledged:
                 return jsonify({"message":"Series list added to DB successfully"}), 200
             else:
@@ -1,4 +1,5 @@
 from pymongo import MongoClient
+from idiagnose_common.metrics import timed
 from cloud.api import CloudInterface
 from cloud.test_api import TestDataStorage
 from flask import jsonify
@@ -25,6 +26,7 @@ class  MongoCollection:
         self.report_mongo_collection=self.mongo_db[self.collection_name_reports]
         self.dicomstudies_mongo_collection=self.mongo_db[self.collection_name_dicomstudies]
     
+    @timed('mongo')
     def Train_data_DB_update(self, train_id, blob_url, blob_name,timestamp):
         try:
             
@@ -40,6 +42,7 @@ class  MongoCollection:
         except Exception as e:
             return print("Error in updating the Mongodb")
         
+    @timed('mongo')
     def Test_data_DB_update(self,test_storage_id,blob_url,blob_name,timestamp_str):
         try:
             test_data_info = {
@@ -53,6 +56,7 @@ class  MongoCollection:
         except Exception as e:
             return print("Error in updating the mongodb")
         
+    @timed('mongo')
     def download_link(self,version_id):
         model_info = self.model_mongo_collection.find_one({"version_id": version_id})
         if model_info:
@@ -60,12 +64,14 @@ class  MongoCollection:
             download_url = cloud_interface_instance.create_SAS_token(blob_name,config_instance.model_container,duration=30)
         return download_url
     
+    @timed('mongo')
     def get_model_info(self):
         field_name = "verion_id"
         list_version_ids = self.model_mongo_collection.find({}, {field_name: 1, 'model_name': 1, 'timestamp': 1, '_id': 0})
         version_ids = [{"version_id": doc[field_name], "model_name": doc.get('model_name', ''), "timestamp": doc.get('timestamp', '')} for doc in list_version_ids]
         return version_ids 
     
+    @timed('mongo')
     def get_patient_records(self):
         check_isfalsepositive = self.report_mongo_collection.find_one({'is_false_positive': True})
 
@@ -88,6 +94,7 @@ class  MongoCollection:
         
         return return_body
 
+    @timed('mongo')
     def update_record(self, patient_id, series_id, inference_results, report_blob_name, image_blob_name):
         query = {"Patient_ID": patient_id, "SeriesUID": series_id}
         update = {"$set": {"Inference": inference_results, "Blobname": report_blob_name, "ImageStoragePath": image_blob_name}}
@@ -96,6 +103,7 @@ class  MongoCollection:
         return_data = self.build_dicom_return_json(patient_data)
         return return_data
     
+    @timed('mongo')
     def get_test_url(self,test_id):
         test_info = self.test_mongo_collection.find_one({"test_id": test_id})
         if test_info:
@@ -104,6 +112,7 @@ class  MongoCollection:
 
         return download_url
     
+    @timed('mongo')
     def delete_record(self, data):
         train_info = self.train_mongo_collection.find_one({"train_id": data['train_id']})
         test_info = self.test_mongo_collection.find_one({"test_id": data['test_id']})
@@ -125,6 +134,7 @@ class  MongoCollection:
             self.model_mongo_collection.delete_one({"version_id": data['version_id']})
         print("Successfully deleted the record")
 
+    @timed('mongo')
     def post_feedback(self, patient_id, series_uid, user_inference):
         criteria = {'Patient_ID': patient_id, 'SeriesUID': series_uid}
         matched_document = self.report_mongo_collection.find_one(criteria)
@@ -139,6 +149,7 @@ class  MongoCollection:
         else:
             return jsonify({"error": "No document found matching the criteria."}), 404
 
+    @timed('mongo')
     def search_db_record(self, patient_id, series_uid):
         criteria = {'Patient_ID': patient_id, 'SeriesUID': series_uid}
         matched_document = self.report_mongo_collection.find_one(criteria)
@@ -154,6 +165,7 @@ class  MongoCollection:
         else:
             return None
         
+    @timed('mongo')
     def get_dicom_study_list(self):
         full_cursor = self.dicomstudies_mongo_collection.find({}, {"_id":0})
         existing_studies = list(full_cursor)
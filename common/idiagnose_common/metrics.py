@@ -0,0 +1,225 @@
+import hmac
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from flask import Response, request, g
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, float('inf'))
+
+def _format_labels(labelnames, labels, extra=None):
+    pairs = list(zip(labelnames, labels))
+    if extra is not None:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = [(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+               for (name, value) in pairs]
+    return "{" + ",".join(f'{name}="{value}"' for (name, value) in escaped) + "}"
+
+def _format_value(value):
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value))
+
+class Histogram:
+    """ Prometheus histogram, one set of cumulative buckets per label combination. """
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {} # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[i] += 1
+            entry[-2] += value
+            entry[-1] += 1
+
+    def samples(self, labels):
+        with self._lock:
+            return list(self._values.get(labels, []))
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            values = sorted(self._values.items())
+            for labels, entry in values:
+                for bound, count in zip(self.buckets, entry):
+                    label_str = _format_labels(self.labelnames, labels, ("le", _format_value(bound)))
+                    lines.append(f"{self.name}_bucket{label_str} {count}")
+                label_str = _format_labels(self.labelnames, labels)
+                lines.append(f"{self.name}_sum{label_str} {_format_value(entry[-2])}")
+                lines.append(f"{self.name}_count{label_str} {entry[-1]}")
+        return lines
+
+class Gauge:
+    """ Prometheus gauge, one value per label combination. """
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+    def value(self, *labels):
+        with self._lock:
+            return self._values.get(labels, 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = []
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def gauge(self, name, documentation, labelnames=()):
+        metric = Gauge(name, documentation, labelnames)
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = MetricsRegistry()
+REQUEST_LATENCY = REGISTRY.histogram("http_request_duration_seconds",
+                                     "Latency of the HTTP requests served by this service, per route.",
+                                     ("method", "route", "status"))
+REQUESTS_IN_FLIGHT = REGISTRY.gauge("http_requests_in_flight",
+                                    "HTTP requests currently being served, per route.",
+                                    ("method", "route"))
+DEPENDENCY_LATENCY = REGISTRY.histogram("dependency_request_duration_seconds",
+                                        "Latency of the calls to outbound dependencies (PACS, Mongo, blob storage, HTTP services, model).",
+                                        ("dependency", "operation", "outcome"))
+DEPENDENCY_IN_FLIGHT = REGISTRY.gauge("dependency_requests_in_flight",
+                                      "Calls to outbound dependencies currently in progress.",
+                                      ("dependency", "operation"))
+
+class DependencyCall:
+    """ Yielded by track_dependency: set 'outcome' to 'error' for a failure reported without raising. """
+    def __init__(self):
+        self.outcome = "ok"
+
+    def record_status(self, status):
+        if isinstance(status, int) and status >= 400:
+            self.outcome = "error"
+
+@contextmanager
+def track_dependency(dependency, operation):
+    """
+    Times the enclosed call to an outbound dependency, e.g.
+    with track_dependency('pacs', 'c-find') as call: ...
+    The outcome label is 'error' when the block raises or sets call.outcome
+    (e.g. with call.record_status(response.status_code)), 'ok' otherwise.
+    """
+    DEPENDENCY_IN_FLIGHT.inc(dependency, operation)
+    start = time.perf_counter()
+    call = DependencyCall()
+    outcome = "error"
+    try:
+        yield call
+        outcome = call.outcome
+    finally:
+        DEPENDENCY_IN_FLIGHT.dec(dependency, operation)
+        DEPENDENCY_LATENCY.observe(time.perf_counter() - start, dependency, operation, outcome)
+
+def _status(result):
+    """ HTTP-like status of a returned value: {'status': ...}, (body, status) or a response. """
+    if isinstance(result, dict):
+        status = result.get('status')
+    elif isinstance(result, tuple) and len(result) > 1:
+        status = result[1]
+    else:
+        status = getattr(result, 'status_code', None)
+    return status
+
+def timed(dependency, operation=None):
+    """
+    Decorator form of track_dependency; the operation defaults to the function
+    name. Functions reporting failures in their return value rather than by
+    raising (e.g. {'status': 500, ...}) are recorded as 'error' for a status
+    of 400 and above.
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with track_dependency(dependency, operation or fn.__name__) as call:
+                result = fn(*args, **kwargs)
+                call.record_status(_status(result))
+                return result
+        return wrapper
+    return decorator
+
+def _route():
+    return request.url_rule.rule if request.url_rule is not None else "unmatched"
+
+def init_metrics(app, token=None):
+    """
+    Records the latency and in-flight count of every request served by 'app'
+    and exposes all metrics of the process on GET /metrics in the Prometheus
+    text format. Streamed responses are timed until the response is returned.
+
+    /metrics requires 'Authorization: Bearer <token>', the token defaulting to
+    the METRICS_TOKEN environment variable; without a token it only answers
+    requests from the loopback interface.
+    """
+    token = token or os.environ.get("METRICS_TOKEN")
+
+    @app.before_request
+    def _start_timer():
+        g._metrics_start = time.perf_counter()
+        g._metrics_route = _route()
+        REQUESTS_IN_FLIGHT.inc(request.method, g._metrics_route)
+
+    @app.after_request
+    def _record_status(response):
+        g._metrics_status = response.status_code
+        return response
+
+    @app.teardown_request
+    def _stop_timer(exc):
+        start = g.pop('_metrics_start', None)
+        if start is None:
+            return
+        route = g.pop('_metrics_route')
+        status = g.pop('_metrics_status', 500)
+        REQUESTS_IN_FLIGHT.dec(request.method, route)
+        REQUEST_LATENCY.observe(time.perf_counter() - start, request.method, route, str(status))
+
+    def metrics():
+        if token:
+            allowed = hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}")
+        else:
+            allowed = request.remote_addr in ("127.0.0.1", "::1")
+        if not allowed:
+            return Response("Forbidden\n", status=403, mimetype="text/plain")
+        return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
+    app.add_url_rule('/metrics', 'metrics', metrics, methods=['GET'])
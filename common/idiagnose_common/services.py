@@ -0,0 +1,17 @@
+import requests
+from idiagnose_common.metrics import track_dependency
+from idiagnose_common.tracing import client_span
+
+def call_service(dependency, method, url, **kwargs):
+    """
+    Sends an HTTP request to another service, records its latency under
+    'dependency' (an error status counts as an error outcome) and propagates
+    the correlation id of the current request.
+    """
+    with track_dependency(dependency, method.upper()) as call, \
+         client_span(f"{method.upper()} {dependency}", {"http.url": url}) as span:
+        kwargs["headers"] = span.headers(kwargs.get("headers"))
+        response = getattr(requests, method)(url, **kwargs)
+        span.attributes["http.status_code"] = response.status_code
+        call.record_status(response.status_code)
+        return response
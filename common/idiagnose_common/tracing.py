@@ -0,0 +1,291 @@
+import abc
+import contextvars
+import hashlib
+import json
+import os
+import queue
+import re
+import threading
+import time
+import urllib.request
+import uuid
+from contextlib import contextmanager
+from flask import request, g
+
+REQUEST_ID_HEADER = "X-Request-ID"
+PARENT_SPAN_HEADER = "X-Parent-Span-ID"
+
+TRACE_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$") # OTLP traceId
+SPAN_ID_PATTERN = re.compile(r"^[0-9a-f]{16}$") # OTLP spanId
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+class Span:
+    """
+    One timed hop of a request. 'trace_id' is the correlation id shared by all
+    the spans of a request across services (the X-Request-ID header).
+    """
+    def __init__(self, name, kind, service, trace_id, parent_id=None, attributes=None):
+        self.name = name
+        self.kind = kind
+        self.service = service
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.attributes = dict(attributes or {})
+        self.status = "ok"
+        self.start = time.time()
+        self.end = None
+
+    def finish(self, error=None):
+        self.end = time.time()
+        if error is not None:
+            self.status = "error"
+            self.attributes["error"] = str(error)
+
+    def headers(self, headers=None):
+        """ Returns a copy of 'headers' carrying the correlation id and this span as parent. """
+        headers = dict(headers or {})
+        headers[REQUEST_ID_HEADER] = self.trace_id
+        headers[PARENT_SPAN_HEADER] = self.span_id
+        return headers
+
+    def to_dict(self):
+        return {"trace_id": self.trace_id, "span_id": self.span_id, "parent_id": self.parent_id,
+                "name": self.name, "kind": self.kind, "service": self.service,
+                "start": self.start, "end": self.end,
+                "duration_ms": None if self.end is None else round((self.end - self.start) * 1000, 3),
+                "status": self.status, "attributes": self.attributes}
+
+class NoopExporter:
+    """ Drops the spans: the default when tracing is not configured. """
+    def export(self, span):
+        pass
+
+class InMemoryExporter:
+    """ Keeps the finished spans in a list, e.g. for tests. """
+    def __init__(self):
+        self.spans = []
+
+    def export(self, span):
+        self.spans.append(span)
+
+class BatchExporter(abc.ABC):
+    """
+    Hands the finished spans to a background thread which sends them in
+    batches with send(spans), so the request path only does a queue put.
+    Spans are dropped, not queued without bound, when the sink falls behind.
+    """
+    def __init__(self, batch_size=64, flush_interval=2.0, max_queue=4096):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = threading.Thread(target=self._worker, daemon=True)
+        self._thread.start()
+
+    def export(self, span):
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            pass
+
+    def flush(self):
+        """ Waits until every span exported so far was sent (or dropped by a failed send). """
+        self._queue.join()
+
+    def _worker(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get(timeout=max(0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            try:
+                self.send(batch)
+            except Exception:
+                pass
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    @abc.abstractmethod
+    def send(self, spans):
+        """ Writes one batch of finished spans to the sink. """
+
+class JsonFileExporter(BatchExporter):
+    """
+    Appends the finished spans to 'path', one JSON object per line, from the
+    batching thread. The file stays open; once it exceeds 'max_bytes' it is
+    rotated to '<path>.1', so at most twice 'max_bytes' are kept on disk.
+    """
+    def __init__(self, path, max_bytes=64 * 1024 * 1024, **kwargs):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._file = None
+        super().__init__(**kwargs)
+
+    def send(self, spans):
+        if self._file is None:
+            self._file = open(self.path, "a")
+        self._file.write("".join(json.dumps(span.to_dict(), default=str) + "\n" for span in spans))
+        self._file.flush()
+        if self._file.tell() > self.max_bytes:
+            self._file.close()
+            self._file = None
+            os.replace(self.path, self.path + ".1")
+
+def _otlp_id(value, length):
+    if re.fullmatch(f"[0-9a-f]{{{length}}}", value or ""):
+        return value
+    return hashlib.sha256((value or "").encode()).hexdigest()[:length]
+
+class OtlpJsonExporter(BatchExporter):
+    """
+    Sends spans in batches to an OTLP/HTTP collector ('<endpoint>/v1/traces',
+    JSON encoding).
+    """
+    KINDS = {"internal": 1, "server": 2, "client": 3}
+
+    def __init__(self, endpoint, **kwargs):
+        self.url = endpoint.rstrip("/") + "/v1/traces"
+        super().__init__(**kwargs)
+
+    def send(self, spans):
+        body = json.dumps(self.encode(spans)).encode()
+        req = urllib.request.Request(self.url, data=body, headers={"Content-Type": "application/json"})
+        urllib.request.urlopen(req, timeout=5).close()
+
+    def encode(self, spans):
+        by_service = {}
+        for span in spans:
+            by_service.setdefault(span.service, []).append({
+                "traceId": _otlp_id(span.trace_id, 32),
+                "spanId": span.span_id,
+                "parentSpanId": span.parent_id or "",
+                "name": span.name,
+                "kind": self.KINDS.get(span.kind, 1),
+                "startTimeUnixNano": str(int(span.start * 1e9)),
+                "endTimeUnixNano": str(int((span.end or span.start) * 1e9)),
+                "attributes": [{"key": "request.id", "value": {"stringValue": span.trace_id}}] +
+                              [{"key": k, "value": {"stringValue": str(v)}} for (k, v) in span.attributes.items()],
+                "status": {"code": 2 if span.status == "error" else 1}})
+        return {"resourceSpans": [{"resource": {"attributes": [{"key": "service.name", "value": {"stringValue": service}}]},
+                                   "scopeSpans": [{"scope": {"name": "idiagnose"}, "spans": otlp_spans}]}
+                                  for (service, otlp_spans) in by_service.items()]}
+
+def create_exporter(conf=None, service="unknown"):
+    """
+    Builds the span exporter from a config dict: {"type": "otlp", "endpoint": ...}
+    or {"type": "file", "path": ...} ('<service>_spans.jsonl' by default).
+    Without a config it is read from the environment: OTEL_EXPORTER_OTLP_ENDPOINT
+    or TRACING_FILE. When neither is set tracing is off: spans are still created
+    to propagate the correlation id, but not recorded.
+    """
+    conf = conf or {}
+    if not conf and os.environ.get("OTEL_EXPORTER_OTLP_ENDPOINT"):
+        conf = {"type": "otlp", "endpoint": os.environ["OTEL_EXPORTER_OTLP_ENDPOINT"]}
+    elif not conf and os.environ.get("TRACING_FILE"):
+        conf = {"type": "file", "path": os.environ["TRACING_FILE"]}
+    if conf.get("type") == "otlp":
+        return OtlpJsonExporter(conf["endpoint"])
+    if conf.get("type") == "file":
+        return JsonFileExporter(conf.get("path", f"{service}_spans.jsonl"),
+                                conf.get("max_bytes", 64 * 1024 * 1024))
+    return NoopExporter()
+
+class Tracer:
+    def __init__(self, service="unknown", exporter=None):
+        self.service = service
+        self.exporter = exporter
+
+    @contextmanager
+    def span(self, name, kind="internal", attributes=None):
+        """
+        Records a span around the enclosed block as a child of the current
+        span, or as the root of a new trace when there is none (e.g. in a
+        scheduler thread).
+        """
+        parent = _current_span.get()
+        trace_id = parent.trace_id if parent is not None else uuid.uuid4().hex
+        span = Span(name, kind, self.service, trace_id, parent.span_id if parent is not None else None, attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except Exception as e:
+            span.finish(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            if span.end is None:
+                span.finish()
+            self.export(span)
+
+    def export(self, span):
+        if self.exporter is not None:
+            self.exporter.export(span)
+
+TRACER = Tracer()
+
+def current_span():
+    return _current_span.get()
+
+def client_span(name, attributes=None):
+    """ Span of an outbound call; use span.headers() to propagate the correlation id. """
+    return TRACER.span(name, "client", attributes)
+
+def bind_context(fn):
+    """
+    Wraps 'fn' so that it runs with the trace context of the caller, e.g. when
+    it is submitted to a thread pool.
+    """
+    ctx = contextvars.copy_context()
+    def run(*args, **kwargs):
+        return ctx.copy().run(fn, *args, **kwargs)
+    return run
+
+def init_tracing(app, service, exporter=None):
+    """
+    Starts a server span for every request served by 'app', joining the trace
+    of the caller from the X-Request-ID / X-Parent-Span-ID headers (a new id is
+    generated otherwise), and echoes the correlation id in the response.
+    """
+    TRACER.service = service
+    TRACER.exporter = exporter if exporter is not None else create_exporter(None, service)
+
+    @app.before_request
+    def _start_span():
+        # client supplied ids are echoed, logged and exported: only well-formed ones are kept
+        trace_id = request.headers.get(REQUEST_ID_HEADER, "")
+        if not TRACE_ID_PATTERN.match(trace_id):
+            trace_id = uuid.uuid4().hex
+        parent_id = request.headers.get(PARENT_SPAN_HEADER, "")
+        route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        span = Span(f"{request.method} {route}", "server", service, trace_id,
+                    parent_id if SPAN_ID_PATTERN.match(parent_id) else None)
+        g._trace_span = span
+        g._trace_token = _current_span.set(span)
+
+    @app.after_request
+    def _add_request_id(response):
+        span = g.get('_trace_span')
+        if span is not None:
+            span.attributes["http.status_code"] = response.status_code
+            response.headers[REQUEST_ID_HEADER] = span.trace_id
+        return response
+
+    @app.teardown_request
+    def _end_span(exc):
+        span = g.pop('_trace_span', None)
+        if span is None:
+            return
+        token = g.pop('_trace_token')
+        try:
+            _current_span.reset(token)
+        except (ValueError, RuntimeError):
+            _current_span.set(None)
+        span.finish(exc)
+        TRACER.export(span)
+
+    return TRACER
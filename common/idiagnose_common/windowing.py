@@ -0,0 +1,128 @@
+from functools import lru_cache
+import numpy as np
+
+VOI_FUNCTIONS = ("LINEAR", "LINEAR_EXACT", "SIGMOID")
+
+def _first(value):
+    """ First value of a multi-valued element (e.g. several WindowCenter values). """
+    if hasattr(value, '__getitem__') and not isinstance(value, (str, bytes)):
+        return value[0]
+    return value
+
+def _window(x, center, width, function="LINEAR"):
+    """
+    Maps the float array 'x' (modality units) in place to 0..255 with the VOI
+    window of DICOM PS3.3 C.11.2.1.2. Both the lookup tables and the float
+    fallback go through this function.
+    """
+    if function == "SIGMOID" and width > 0:
+        np.subtract(x, center, out=x)
+        np.multiply(x, -4.0 / width, out=x)
+        np.exp(x, out=x)
+        np.add(x, 1.0, out=x)
+        np.divide(255.0, x, out=x)
+        return x
+    if function == "LINEAR_EXACT":
+        low, scale = center, width
+    else:
+        low, scale = center - 0.5, width - 1
+    if scale <= 0:
+        x[...] = (x > low) * 255.0
+        return x
+    np.subtract(x, low, out=x)
+    np.multiply(x, 1.0 / scale, out=x)
+    np.add(x, 0.5, out=x)
+    np.clip(x, 0.0, 1.0, out=x)
+    np.multiply(x, 255.0, out=x)
+    return x
+
+@lru_cache(maxsize=64)
+def window_lut(dtype, center, width, function="LINEAR", slope=1.0, intercept=0.0, invert=False):
+    """
+    Lookup table mapping every stored value of an 8 or 16 bit integer 'dtype'
+    to its 8-bit display value: rescale, VOI window and MONOCHROME1 inversion
+    in one table (256 or 65536 entries) indexed by the stored value viewed as
+    unsigned. Tables are cached, so all the images of a modality sharing a
+    window reuse the same one.
+    """
+    dtype = np.dtype(dtype)
+    stored = np.arange(2 ** (8 * dtype.itemsize), dtype=f"u{dtype.itemsize}").view(f"{dtype.kind}{dtype.itemsize}")
+    x = stored.astype(np.float64)
+    np.multiply(x, slope, out=x)
+    np.add(x, intercept, out=x)
+    _window(x, center, width, function)
+    if invert:
+        np.subtract(255.0, x, out=x)
+    lut = np.rint(x, out=x).astype(np.uint8)
+    lut.flags.writeable = False
+    return lut
+
+def is_color(pixel_array, ds=None):
+    if ds is not None:
+        return int(ds.get('SamplesPerPixel') or 1) > 1
+    return pixel_array.ndim == 3 and pixel_array.shape[-1] in (3, 4)
+
+def window_params(ds=None):
+    """
+    Returns (center, width, function, slope, intercept, invert) read from the
+    DICOM data set 'ds'; center and width are None when it has no window.
+    """
+    if ds is None:
+        return (None, None, "LINEAR", 1.0, 0.0, False)
+    center, width = ds.get('WindowCenter'), ds.get('WindowWidth')
+    if center is not None and width is not None:
+        center, width = float(_first(center)), float(_first(width))
+    else:
+        center = width = None
+    function = str(ds.get('VOILUTFunction') or "LINEAR").upper()
+    if function not in VOI_FUNCTIONS:
+        function = "LINEAR"
+    slope = float(ds.get('RescaleSlope') or 1.0)
+    intercept = float(ds.get('RescaleIntercept') or 0.0)
+    invert = ds.get('PhotometricInterpretation') == 'MONOCHROME1'
+    return (center, width, function, slope, intercept, invert)
+
+def to_uint8(pixel_array, ds=None):
+    """
+    Converts stored pixel data to an 8-bit display image with the rescale,
+    window and photometric interpretation of the DICOM data set 'ds'. Without
+    a window (or without 'ds') the range of the image is stretched to 0..255.
+
+    8 and 16 bit integer images (almost every DICOM) are converted with a
+    single lookup in a cached window_lut, which allocates nothing but the
+    uint8 result. Other data types are windowed in one float32 copy. Color
+    images are returned as uint8 unchanged.
+    """
+    pixel_array = np.asarray(pixel_array)
+    if is_color(pixel_array, ds):
+        return pixel_array.astype(np.uint8, copy=False)
+    (center, width, function, slope, intercept, invert) = window_params(ds)
+    if center is None:
+        low, high = sorted((float(pixel_array.min()) * slope + intercept,
+                            float(pixel_array.max()) * slope + intercept))
+        (center, width, function) = ((low + high) / 2, high - low, "LINEAR_EXACT")
+    dtype = pixel_array.dtype
+    if dtype.kind in "iu" and dtype.itemsize <= 2:
+        lut = window_lut(f"{dtype.kind}{dtype.itemsize}", center, width, function, slope, intercept, invert)
+        # fancy indexing with the unsigned view, unlike take(), does not make an intp copy of the indices
+        return lut[pixel_array.view(np.dtype(f"u{dtype.itemsize}").newbyteorder(dtype.byteorder))]
+    x = pixel_array.astype(np.float32)
+    if slope != 1.0 or intercept != 0.0:
+        np.multiply(x, slope, out=x)
+        np.add(x, intercept, out=x)
+    _window(x, center, width, function)
+    if invert:
+        np.subtract(255.0, x, out=x)
+    return np.rint(x, out=x).astype(np.uint8)
+
+def stretch(image, in_place=False):
+    """
+    Min/max stretch of an image to 0..255 floats, e.g. for a training
+    pre-processing step working on float images. With 'in_place' a float
+    image is overwritten instead of copied. A constant image becomes 0.
+    """
+    image = np.asarray(image)
+    if not (in_place and image.dtype.kind == "f"):
+        image = image.astype(np.float32)
+    low, high = float(image.min()), float(image.max())
+    return _window(image, (low + high) / 2, high - low, "LINEAR_EXACT")
@@ -0,0 +1,92 @@
+import os
+import unittest
+from unittest.mock import patch
+from flask import Flask
+from idiagnose_common.metrics import (MetricsRegistry, init_metrics, track_dependency, timed, DEPENDENCY_LATENCY,
+                                      DEPENDENCY_IN_FLIGHT)
+
+
+class TestMetrics(unittest.TestCase):
+
+    def test_histogram_render(self):
+        registry = MetricsRegistry()
+        histogram = registry.histogram("test_seconds", "Test latency.", ("route",), buckets=(0.1, 1.0, float('inf')))
+        histogram.observe(0.05, "/a")
+        histogram.observe(0.5, "/a")
+        text = registry.render()
+        self.assertIn('test_seconds_bucket{route="/a",le="0.1"} 1', text)
+        self.assertIn('test_seconds_bucket{route="/a",le="1.0"} 2', text)
+        self.assertIn('test_seconds_bucket{route="/a",le="+Inf"} 2', text)
+        self.assertIn('test_seconds_count{route="/a"} 2', text)
+
+    def test_track_dependency(self):
+        before = DEPENDENCY_LATENCY.samples(("test_dep", "op", "error"))
+        with self.assertRaises(RuntimeError):
+            with track_dependency("test_dep", "op"):
+                self.assertEqual(DEPENDENCY_IN_FLIGHT.value("test_dep", "op"), 1)
+                raise RuntimeError("failed")
+        self.assertEqual(DEPENDENCY_IN_FLIGHT.value("test_dep", "op"), 0)
+        after = DEPENDENCY_LATENCY.samples(("test_dep", "op", "error"))
+        self.assertEqual(after[-1], (before[-1] if before else 0) + 1)
+
+        @timed("test_dep")
+        def lookup():
+            return 42
+        self.assertEqual(lookup(), 42)
+        self.assertEqual(DEPENDENCY_LATENCY.samples(("test_dep", "lookup", "ok"))[-1], 1)
+
+    def test_timed_status_outcome(self):
+        @timed("test_status_dep")
+        def c_find(status):
+            return {"status": status, "message": "..."}
+
+        @timed("test_status_dep")
+        def feedback(status):
+            return {"message": "..."}, status
+
+        c_find(500)
+        c_find(200)
+        feedback(404)
+        self.assertEqual(DEPENDENCY_LATENCY.samples(("test_status_dep", "c_find", "error"))[-1], 1)
+        self.assertEqual(DEPENDENCY_LATENCY.samples(("test_status_dep", "c_find", "ok"))[-1], 1)
+        self.assertEqual(DEPENDENCY_LATENCY.samples(("test_status_dep", "feedback", "error"))[-1], 1)
+
+        with track_dependency("test_status_dep", "http") as call:
+            call.record_status(503)
+        self.assertEqual(DEPENDENCY_LATENCY.samples(("test_status_dep", "http", "error"))[-1], 1)
+
+    def test_metrics_endpoint_protected(self):
+        with patch.dict(os.environ, {}, clear=True):
+            app = Flask(__name__)
+            init_metrics(app)
+        client = app.test_client()
+        self.assertEqual(client.get('/metrics').status_code, 200)  # loopback
+        self.assertEqual(client.get('/metrics', environ_base={"REMOTE_ADDR": "10.0.0.5"}).status_code, 403)
+
+        app = Flask(__name__)
+        init_metrics(app, token="secret")
+        client = app.test_client()
+        self.assertEqual(client.get('/metrics').status_code, 403)
+        self.assertEqual(client.get('/metrics', headers={"Authorization": "Bearer wrong"}).status_code, 403)
+        self.assertEqual(client.get('/metrics', headers={"Authorization": "Bearer secret"}).status_code, 200)
+
+    def test_metrics_endpoint(self):
+        app = Flask(__name__)
+        init_metrics(app, token="secret")
+
+        @app.route('/api/items/<item_id>')
+        def item(item_id):
+            return {"id": item_id}
+
+        client = app.test_client()
+        client.get('/api/items/1')
+        client.get('/api/items/2')
+        response = client.get('/metrics', headers={"Authorization": "Bearer secret"})
+        self.assertEqual(response.status_code, 200)
+        text = response.get_data(as_text=True)
+        self.assertIn('http_request_duration_seconds_count{method="GET",route="/api/items/<item_id>",status="200"} 2', text)
+        self.assertIn('http_requests_in_flight{method="GET",route="/api/items/<item_id>"} 0.0', text)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,24 @@
+import unittest
+from unittest.mock import patch, Mock
+from idiagnose_common.services import call_service
+from idiagnose_common.metrics import DEPENDENCY_LATENCY
+from idiagnose_common.tracing import TRACER, REQUEST_ID_HEADER
+
+
+class TestCallService(unittest.TestCase):
+
+    @patch('requests.get')
+    def test_call_service(self, mock_get):
+        mock_get.return_value = Mock(status_code=500)
+        with TRACER.span("search") as parent:
+            response = call_service('test_service_dep', 'get', "http://localhost:5000/api/query",
+                                    headers={"Authorization": "Bearer token"})
+        self.assertEqual(response.status_code, 500)
+        headers = mock_get.call_args.kwargs["headers"]
+        self.assertEqual(headers["Authorization"], "Bearer token")
+        self.assertEqual(headers[REQUEST_ID_HEADER], parent.trace_id)
+        self.assertEqual(DEPENDENCY_LATENCY.samples(("test_service_dep", "GET", "error"))[-1], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
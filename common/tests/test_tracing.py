@@ -0,0 +1,127 @@
+import unittest
+import json
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+from flask import Flask
+from idiagnose_common.tracing import (Tracer, BatchExporter, JsonFileExporter, OtlpJsonExporter, InMemoryExporter, NoopExporter,
+                                      create_exporter, init_tracing, client_span, bind_context, current_span,
+                                      REQUEST_ID_HEADER, PARENT_SPAN_HEADER)
+
+
+class TestTracing(unittest.TestCase):
+
+    def test_nested_spans(self):
+        exporter = InMemoryExporter()
+        tracer = Tracer("test", exporter)
+        with tracer.span("root") as root:
+            with tracer.span("child", "client") as child:
+                headers = child.headers({"Authorization": "Bearer token"})
+        self.assertIsNone(current_span())
+        self.assertEqual([span.name for span in exporter.spans], ["child", "root"])
+        self.assertEqual(child.trace_id, root.trace_id)
+        self.assertEqual(child.parent_id, root.span_id)
+        self.assertEqual(headers, {"Authorization": "Bearer token", REQUEST_ID_HEADER: root.trace_id,
+                                   PARENT_SPAN_HEADER: child.span_id})
+
+    def test_error_status(self):
+        exporter = InMemoryExporter()
+        tracer = Tracer("test", exporter)
+        with self.assertRaises(ValueError):
+            with tracer.span("failing"):
+                raise ValueError("boom")
+        self.assertEqual(exporter.spans[0].status, "error")
+        self.assertEqual(exporter.spans[0].attributes["error"], "boom")
+
+    def test_bind_context(self):
+        tracer = Tracer("test")
+        with tracer.span("root") as root:
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                parents = list(executor.map(bind_context(lambda _: current_span()), range(4)))
+        self.assertTrue(all(parent is root for parent in parents))
+
+    def test_json_file_exporter(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "spans.jsonl")
+            exporter = JsonFileExporter(path, flush_interval=0.01)
+            tracer = Tracer("test", exporter)
+            with tracer.span("first"):
+                pass
+            with tracer.span("second"):
+                pass
+            exporter.flush()
+            with open(path) as f:
+                records = [json.loads(line) for line in f]
+        self.assertEqual([record["name"] for record in records], ["first", "second"])
+        self.assertEqual(records[0]["service"], "test")
+        self.assertGreaterEqual(records[0]["duration_ms"], 0)
+
+    def test_batch_exporter_is_abstract(self):
+        with self.assertRaises(TypeError):
+            BatchExporter()
+
+    def test_json_file_rotation(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "spans.jsonl")
+            exporter = JsonFileExporter(path, max_bytes=1, flush_interval=0.01)
+            tracer = Tracer("test", exporter)
+            with tracer.span("first"):
+                pass
+            exporter.flush()
+            with tracer.span("second"):
+                pass
+            exporter.flush()
+            self.assertFalse(os.path.exists(path))
+            with open(path + ".1") as f:
+                self.assertEqual(json.loads(f.read())["name"], "second")
+
+    def test_create_exporter(self):
+        with patch.dict(os.environ, {}, clear=True):
+            self.assertIsInstance(create_exporter(None, "test"), NoopExporter)
+            with tempfile.TemporaryDirectory() as tmp:
+                exporter = create_exporter({"type": "file", "path": os.path.join(tmp, "spans.jsonl")}, "test")
+                self.assertIsInstance(exporter, JsonFileExporter)
+                with patch.dict(os.environ, {"TRACING_FILE": os.path.join(tmp, "env.jsonl")}):
+                    self.assertEqual(create_exporter(None, "test").path, os.path.join(tmp, "env.jsonl"))
+
+    def test_otlp_encoding(self):
+        tracer = Tracer("test")
+        with tracer.span("root") as root:
+            pass
+        exporter = OtlpJsonExporter.__new__(OtlpJsonExporter)
+        encoded = exporter.encode([root])
+        otlp_span = encoded["resourceSpans"][0]["scopeSpans"][0]["spans"][0]
+        self.assertEqual(otlp_span["traceId"], root.trace_id)
+        self.assertEqual(otlp_span["kind"], 1)
+
+    def test_request_id_propagation(self):
+        app = Flask(__name__)
+        exporter = InMemoryExporter()
+        init_tracing(app, "test_service", exporter)
+
+        @app.route('/api/hop')
+        def hop():
+            with client_span("GET downstream") as span:
+                return span.headers()
+
+        client = app.test_client()
+        trace_id, parent_id = "0af7651916cd43dd8448eb211c80319c", "b7ad6b7169203331"
+        response = client.get('/api/hop', headers={REQUEST_ID_HEADER: trace_id, PARENT_SPAN_HEADER: parent_id})
+        self.assertEqual(response.headers[REQUEST_ID_HEADER], trace_id)
+        self.assertEqual(response.get_json()[REQUEST_ID_HEADER], trace_id)
+        (client_hop, server_hop) = exporter.spans
+        self.assertEqual((server_hop.kind, server_hop.parent_id), ("server", parent_id))
+        self.assertEqual(server_hop.name, "GET /api/hop")
+        self.assertEqual(client_hop.parent_id, server_hop.span_id)
+
+        response = client.get('/api/hop')
+        self.assertTrue(response.headers[REQUEST_ID_HEADER])
+
+        response = client.get('/api/hop', headers={REQUEST_ID_HEADER: "req-1 <script>", PARENT_SPAN_HEADER: "abc"})
+        self.assertRegex(response.headers[REQUEST_ID_HEADER], r"^[0-9a-f]{32}$")
+        self.assertIsNone(exporter.spans[-1].parent_id)
+
+
+if __name__ == '__main__':
+    unittest.main()
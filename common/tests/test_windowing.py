@@ -0,0 +1,72 @@
+import unittest
+import numpy as np
+from pydicom.dataset import Dataset
+from pydicom.pixel_data_handlers.util import apply_modality_lut, apply_windowing
+from idiagnose_common.windowing import to_uint8, window_lut, stretch
+
+
+def ct_dataset():
+    ds = Dataset()
+    ds.Modality = "CT"
+    ds.PhotometricInterpretation = "MONOCHROME2"
+    ds.SamplesPerPixel = 1
+    ds.BitsAllocated = 16
+    ds.BitsStored = 16
+    ds.PixelRepresentation = 1
+    ds.RescaleSlope = 1
+    ds.RescaleIntercept = -1024
+    ds.WindowCenter = 300
+    ds.WindowWidth = 2000
+    return ds
+
+
+class TestWindowing(unittest.TestCase):
+
+    def setUp(self):
+        self.ds = ct_dataset()
+        self.pixel_array = np.linspace(-2012, 2428, 128 * 128).reshape(128, 128).astype(np.int16)
+
+    def test_matches_pydicom_window(self):
+        pixel_array = self.pixel_array
+        windowed = apply_windowing(apply_modality_lut(pixel_array, self.ds), self.ds)
+        expected = (windowed - windowed.min()) / (windowed.max() - windowed.min()) * 255
+        result = to_uint8(pixel_array, self.ds)
+        self.assertEqual(result.dtype, np.uint8)
+        self.assertEqual(result.shape, pixel_array.shape)
+        self.assertLessEqual(np.abs(result - expected).max(), 1)
+        # the float fallback and the lookup table give the same image
+        np.testing.assert_array_equal(to_uint8(pixel_array.astype(np.float32), self.ds), result)
+
+    def test_lut_cached_per_window(self):
+        window_lut.cache_clear()
+        to_uint8(self.pixel_array, self.ds)
+        to_uint8(self.pixel_array[::-1].copy(), self.ds)
+        self.assertEqual(window_lut.cache_info().misses, 1)
+        self.assertEqual(window_lut.cache_info().hits, 1)
+        self.assertFalse(window_lut("u2", 300.0, 2000.0).flags.writeable)
+
+    def test_monochrome1_inverted(self):
+        normal = to_uint8(self.pixel_array, self.ds)
+        self.ds.PhotometricInterpretation = "MONOCHROME1"
+        np.testing.assert_array_equal(to_uint8(self.pixel_array, self.ds), 255 - normal)
+
+    def test_without_window(self):
+        image = np.arange(256, dtype=np.uint8).reshape(16, 16)
+        np.testing.assert_array_equal(to_uint8(image), image)
+        np.testing.assert_array_equal(to_uint8(image.astype(np.int16) * 4 - 100), image)
+        self.assertEqual(to_uint8(np.full((4, 4), 7, np.uint16)).max(), 0)
+
+    def test_color_unchanged(self):
+        image = np.random.randint(0, 256, (8, 8, 3), dtype=np.uint8)
+        self.assertIs(to_uint8(image), image)
+
+    def test_stretch(self):
+        image = np.array([[1.0, 2.0], [3.0, 5.0]])
+        np.testing.assert_allclose(stretch(image), [[0, 63.75], [127.5, 255]])
+        self.assertEqual(image[1, 1], 5.0)
+        self.assertIs(stretch(image, in_place=True), image)
+        np.testing.assert_array_equal(stretch(np.ones((2, 2))), np.zeros((2, 2)))
+
+
+if __name__ == '__main__':
+    unittest.main()
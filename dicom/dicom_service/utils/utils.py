@@ -3,6 +3,7 @@ from pynetdicom import AE, build_role, evt
 import pydicom
 from io import BytesIO
 import os
+from idiagnose_common.metrics import timed
 
 class DicomService():
     def __init__(self):
@@ -30,6 +31,7 @@ class DicomService():
             setattr(ds, key, value)
         return ds
     
+    @timed('pacs', 'c-find')
     def c_find_pacs(self, ds, hostname, port):
         """
         Sends C-FIND request to PACS Server to look for DICOM data matching the query parameters
@@ -84,6 +86,7 @@ class DicomService():
         else:
             return {'status':500, 'message': 'Failed to establish association with PACS server'}
         
+    @timed('pacs', 'c-get')
     def c_get_pacs(self, ds, hostname, port):
         """
         Sends C-GET request to PACS Server to retrieve DICOM data matching the query parameters
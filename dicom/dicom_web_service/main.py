@@ -8,6 +8,9 @@ from apscheduler.schedulers.background import BackgroundScheduler
 import logging
 import yaml
 from flask_jwt_extended import JWTManager, jwt_required, get_jwt_identity
+from idiagnose_common.metrics import init_metrics
+from idiagnose_common.tracing import init_tracing
+from idiagnose_common.services import call_service
 
 config = yaml.safe_load(open('config/auth_config.yaml', 'r'))
 service_cfg = json.load(open('config/microservice_conf.json', 'r'))
@@ -17,6 +20,8 @@ class DicomConfig:
         self.params = {}
 
 app = Flask(__name__)
+init_metrics(app)
+init_tracing(app, 'dicom_web_service')
 app.config['JWT_SECRET_KEY'] = config['development']['jwt_secret_key']
 
 ssl_enabled = config['development']['ssl_enabled']
@@ -74,7 +79,7 @@ def dcmweb_ping_server():
     url = f"{cfg.params['url']}/{cfg.params['root']}/series"
     auth= (cfg.params['auth'][0],cfg.params['auth'][1]) 
     try:
-        response = requests.get(url, auth = auth)
+        response = call_service('pacs', 'get', url, auth=auth)
         if response.status_code == 200:
             return {'message': 'DICOMWeb Server Connection Verified'}, 200
         else:
@@ -142,7 +147,7 @@ def get_dataset_dicomweb():
     dicom_query_url = scheme + dicom_ip+':'+str(dicom_port)+'/api/query'
     if access_token is not None:
         headers = {'Authorization': 'Bearer ' + access_token}
-        dcm_query_out = requests.get(url = dicom_query_url, json=query_req,headers=headers)
+        dcm_query_out = call_service('dicom_server', 'get', dicom_query_url, json=query_req, headers=headers)
         queries = []
         for patient in dcm_query_out.json():
             for study in patient['studies']:
@@ -156,7 +161,7 @@ def get_dataset_dicomweb():
         cloud_db_extract_url = scheme + cloud_ip+':'+str(cloud_port)+'/client-api/report/get-patient-records'
         dicom_retrieve_url = scheme + dicom_ip+':'+str(dicom_port)+'/api/retrieve'
     
-        db_records_resp = requests.get(url = cloud_db_extract_url,headers=headers)
+        db_records_resp = call_service('cloud_server', 'get', cloud_db_extract_url, headers=headers)
         if db_records_resp.status_code == 200:
             db_records = db_records_resp.json()["patient_id_record"]
         else:
@@ -164,7 +169,7 @@ def get_dataset_dicomweb():
         for record in db_records:
             for query in queries:
                 if (record["pid"] == query["PatientID"]) and (record["series_uid"]==query["SeriesInstanceUID"]):
-                    dcm_retrieve_out = requests.get(dicom_retrieve_url, json=query)
+                    dcm_retrieve_out = call_service('dicom_server', 'get', dicom_retrieve_url, json=query)
                     if (dcm_retrieve_out.status_code == 200) or (dcm_retrieve_out.status_code == 201):
                         services.create_folder_and_write_file("tmp", record["Inference"], record["series_uid"]+".dcm", dcm_retrieve_out.content)
                     else:
@@ -199,11 +204,11 @@ def infer_new_data():
 
     if access_token is not None:
         headers = {'Authorization': 'Bearer ' + access_token}
-        get_resp = requests.get(db_manage_url, headers = headers)
+        get_resp = call_service('cloud_server', 'get', db_manage_url, headers=headers)
         if get_resp.status_code == 200:
             existing_series = get_resp.json()['series']
         elif get_resp.status_code == 204:
-            post_resp = requests.post(db_manage_url, json = {"series":current_series}, headers=headers)
+            post_resp = call_service('cloud_server', 'post', db_manage_url, json={"series":current_series}, headers=headers)
             if post_resp.status_code == 200:
                 app.logger.info("Pushed list of current PACS data to DB. New data received henceforth shall be sent automatically for inferencing")
                 return jsonify({"message" : "Collection created"}), 201
@@ -228,7 +233,7 @@ def infer_new_data():
                                                 "SeriesInstanceUID": patient["SeriesInstanceUID"]},
                                 "AI_enabled":True}
                 app.logger.info("Sending data for inferencing")
-                inf_response = requests.post(url = searchpost_url, json=request_body, headers=headers)
+                inf_response = call_service('rest_server', 'post', searchpost_url, json=request_body, headers=headers)
                 if inf_response.status_code == 200:
                     app.logger.info("Data sent successfully for inferencing")
                     successful.append(patient)
@@ -236,7 +241,7 @@ def infer_new_data():
                     app.logger.info("Unable to send data for inferencing")
                     fail.append(patient)
 
-        resp = requests.post(db_manage_url, json = {"series": new_series}, headers=headers)
+        resp = call_service('cloud_server', 'post', db_manage_url, json={"series": new_series}, headers=headers)
         if resp.status_code != 200:
             app.logger.info("Could not update data to DB")
             return jsonify({"message": "Internal Server Error"}), 500
@@ -3,6 +3,7 @@ import os
 import pydicom
 import io
 import re
+from idiagnose_common.metrics import timed
 
 class DicomwebService():
     def __init__(self):
@@ -19,6 +20,7 @@ class DicomwebService():
         with open(file_path, 'wb') as file:
             file.write(content)
 
+    @timed('pacs', 'qido-rs')
     def dicom_web_query(self, seriesurl, request_body, auth):
         """
         Queries for available DICOM data from DicomWeb Server using set of DICOM Tags and corresponsing values (PatientID is mandatory). 
@@ -67,6 +69,7 @@ class DicomwebService():
         formatted_result = [{"PatientID": patient["PatientID"], "studies": patient["studies"]} for patient in result.values()]
         return {"message": formatted_result, "status":200}
 
+    @timed('pacs', 'wado-rs')
     def dicom_web_retrieve(self, request_body, base_url, auth):
         """
         Retrieves DICOM series from DicomWeb Server using SeriesInstanceUID tag and anyother optional DICOM Tag if required. 
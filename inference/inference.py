@@ -14,6 +14,8 @@ import argparse
 import shutil
 import os
 from utils.config import Config
+from idiagnose_common.metrics import init_metrics, track_dependency
+from idiagnose_common.tracing import init_tracing
 import yaml
 import logging
 from flask_jwt_extended import JWTManager, jwt_required, get_jwt_identity
@@ -30,6 +32,8 @@ def parse_args():
 
 class_list = ['Consolidation', 'Mass', 'Infiltration', 'No_Finding', 'Hernia', 'Pneumonia', 'Effusion', 'Edema', 'Pleural_Thickening', 'Emphysema', 'Atelectasis', 'Nodule', 'Fibrosis', 'Cardiomegaly', 'Pneumothorax']
 app = Flask(__name__)
+init_metrics(app)
+init_tracing(app, 'inference')
 with open('config/auth_config.yaml', 'r') as config_file:
     config = yaml.safe_load(config_file)
 app.config['JWT_SECRET_KEY'] = config['development']['jwt_secret_key']
@@ -45,12 +49,20 @@ args = parse_args()
 def infer_xray():
     ''' Return the dummy data of the patient. '''
     try:
+        global trt
         current_user = get_jwt_identity()
         app.logger.info(f"logged in as:{current_user}")
-        file = request.get_json()['patient_dicom'][2:-1] ## byte file
-        dtype = request.get_json()['dtype']
-        input = pr.img_proc(file, dtype)
-        result = trt.predictor(input)
+        if request.mimetype == 'application/octet-stream':
+            # Raw tensor bytes, dtype and shape are passed as headers.
+            dtype = request.headers['X-Tensor-Dtype']
+            shape = tuple(int(dim) for dim in request.headers['X-Tensor-Shape'].split(','))
+            input = pr.tensor_proc(request.get_data(), shape, dtype)
+        else:
+            file = request.get_json()['patient_dicom'][2:-1] ## byte file
+            dtype = request.get_json()['dtype']
+            input = pr.img_proc(file, (args.img_height, args.img_width), dtype)
+        with track_dependency('tensorflow', 'predict'):
+            result = trt.predictor(input)
         res = pr.get_argmax_res(result)
 
         if os.path.exists("./model"):
@@ -68,6 +80,26 @@ def infer_xray():
         print(e)
         return jsonify({'message': 'ERROR WITH INFERENCE'}), 404
 
+@app.route('/api/infer/lungs-xray/batch', methods=['POST'])
+@jwt_required()
+def infer_xray_batch():
+    ''' Classify a batch of preprocessed images sent as one (N, height, width) tensor. '''
+    try:
+        current_user = get_jwt_identity()
+        app.logger.info(f"logged in as:{current_user}")
+        dtype = request.headers['X-Tensor-Dtype']
+        shape = tuple(int(dim) for dim in request.headers['X-Tensor-Shape'].split(','))
+        input = pr.batch_tensor_proc(request.get_data(), shape, dtype)
+        with track_dependency('tensorflow', 'predict'):
+            result = trt.predictor(input)
+        res = pr.get_argmax_batch(result)
+
+        return jsonify({'ai_results': [class_list[r] for r in res]})
+    except Exception as e:
+        print(traceback.format_exc())
+        print(e)
+        return jsonify({'message': 'ERROR WITH INFERENCE'}), 404
+
 if __name__ == '__main__':
 
 
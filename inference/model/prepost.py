@@ -11,16 +11,27 @@ class PrePost:
 
         file = bytes(file, encoding='utf-8')         
         image = base64.b64decode(file)         
-        image_np = np.frombuffer(image, dtype=dtype)         
-        #image_np = image_np.astype("float32")         
-        image_np = np.reshape(image_np, (shape[0], shape[1])) / np.iinfo(dtype).max         
-        image_np = image_np.astype('float32')         
-        img = np.zeros((224,224, 3), dtype="float32")         
-        img[:,:, 0] = image_np         
-        img[:,:, 1] = image_np         
-        img[:,:, 2] = image_np         
-        image_np = np.expand_dims(img, axis=0)
-        input = tf.convert_to_tensor(image_np, dtype="float32")
+        return self.tensor_proc(image, shape, dtype)
+
+    def tensor_proc(self, buffer, shape, dtype):
+        """
+        Builds the model input from a raw image buffer (e.g. the body of an
+        application/octet-stream request). The buffer is wrapped with
+        np.frombuffer, so it is not copied before normalization.
+        """
+        return self.batch_tensor_proc(buffer, (1, shape[0], shape[1]), dtype)
+
+    def batch_tensor_proc(self, buffer, shape, dtype):
+        """
+        Same as tensor_proc for a buffer holding a batch of images of
+        shape (N, height, width). Returns a (N, height, width, 3) tensor.
+        """
+        image_np = np.frombuffer(buffer, dtype=dtype).reshape((shape[0], shape[1], shape[2]))
+        img = np.empty((shape[0], shape[1], shape[2], 3), dtype="float32")
+        np.multiply(image_np, np.float32(1.0 / np.iinfo(dtype).max), out=img[:, :, :, 0], casting='unsafe')
+        img[:, :, :, 1] = img[:, :, :, 0]
+        img[:, :, :, 2] = img[:, :, :, 0]
+        input = tf.convert_to_tensor(img, dtype="float32")
 
         return input
 
@@ -29,4 +40,10 @@ class PrePost:
             pred = result[key]
         
         res = int(np.argmax(pred, axis=1)[0])
-        return res
\ No newline at end of file
+        return res
+
+    def get_argmax_batch(self, result):
+        for key in result:
+            pred = result[key]
+
+        return [int(res) for res in np.argmax(pred, axis=1)]
@@ -20,5 +20,29 @@ class TestPrePost(unittest.TestCase):
         # Perform assertions to verify the output
         self.assertEqual(argmax_res, 1)  # Check if the argmax result matches the expected output
 
+    def test_tensor_proc(self):
+        image = np.arange(224 * 224, dtype=np.uint16).reshape((224, 224))
+        input = self.pre_post.tensor_proc(image.tobytes(), (224, 224), "uint16")
+        self.assertEqual(tuple(input.shape), (1, 224, 224, 3))
+        expected = (image / np.iinfo(np.uint16).max).astype("float32")
+        np.testing.assert_allclose(input.numpy()[0, :, :, 2], expected, rtol=1e-6)
+
+    def test_img_proc_matches_tensor_proc(self):
+        image = np.random.randint(0, 255, size=(224, 224), dtype=np.uint8)
+        b64_input = self.pre_post.img_proc(str(base64.b64encode(image))[2:-1], (224, 224), "uint8")
+        raw_input = self.pre_post.tensor_proc(image.tobytes(), (224, 224), "uint8")
+        np.testing.assert_array_equal(b64_input.numpy(), raw_input.numpy())
+
+    def test_batch_tensor_proc(self):
+        images = np.random.randint(0, 255, size=(3, 224, 224), dtype=np.uint8)
+        input = self.pre_post.batch_tensor_proc(images.tobytes(), (3, 224, 224), "uint8")
+        self.assertEqual(tuple(input.shape), (3, 224, 224, 3))
+        single = self.pre_post.tensor_proc(images[1].tobytes(), (224, 224), "uint8")
+        np.testing.assert_array_equal(input.numpy()[1], single.numpy()[0])
+
+    def test_get_argmax_batch(self):
+        result = {"prediction": np.array([[0.1, 0.9, 0.2], [0.7, 0.1, 0.2]])}
+        self.assertEqual(self.pre_post.get_argmax_batch(result), [1, 0])
+
 if __name__ == "__main__":
     unittest.main()
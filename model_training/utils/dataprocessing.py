@@ -4,7 +4,7 @@ from azure.storage.blob import BlobServiceClient
 from zipfile import ZipFile
 import shutil
 from pymongo import MongoClient
-import numpy as np
+from idiagnose_common.windowing import stretch
 
 
 class Dataset:
@@ -25,9 +25,8 @@ class Dataset:
         self.get_augment_generator()
 
     def histogram_stretching(self, image):
-        min_intensity, max_intensity = np.min(image), np.max(image)
-        stretched_image = np.clip((image - min_intensity) / (max_intensity - min_intensity) * 255, 0, 255)
-        return stretched_image
+        # the augmented float image is stretched in place (a constant image becomes 0)
+        return stretch(image, in_place=True)
 
     def get_augment_generator(self):
         self.train_datagen = tf.keras.preprocessing.image.ImageDataGenerator(
@@ -4,8 +4,12 @@ import base64
 from flask_jwt_extended import JWTManager, jwt_required, get_jwt_identity
 import yaml
 import logging
+from idiagnose_common.metrics import init_metrics
+from idiagnose_common.tracing import init_tracing
 
 app = Flask(__name__)
+init_metrics(app)
+init_tracing(app, 'reporting')
 with open('config/auth_config.yaml', 'r') as config_file:
     config = yaml.safe_load(config_file)
 app.config['JWT_SECRET_KEY'] = config['development']['jwt_secret_key']
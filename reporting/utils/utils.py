@@ -5,10 +5,10 @@ from pydicom.sequence import Sequence
 from pydicom.uid import UID
 from pydicom.filebase import DicomFileLike
 from datetime import datetime
-import numpy as np
 from io import BytesIO
 import base64
 import spacy
+from idiagnose_common.windowing import to_uint8
 
 
 class InvalidFileFormatError(Exception):
@@ -78,21 +78,42 @@ class ReportGeneration:
         else:
             raise ValueError("No file data provided")
 
-    def numpy_to_image(self, pixel_array):
+    def numpy_to_image(self, pixel_array, ds=None):
         """
-        Convert a NumPy array representing pixel data to an image.
+        Convert a NumPy array representing pixel data to an 8-bit image.
 
         Parameters:
         - pixel_array (numpy.ndarray): The NumPy array containing pixel data.
+        - ds (pydicom.Dataset, optional): The DICOM data set of the pixels, whose
+          rescale, window and photometric interpretation are applied. Without it
+          the range of the pixels is stretched to 0..255.
 
         Returns:
         PIL.Image.Image: The image created from the pixel array.
         """
-        pixel_array = pixel_array.astype(np.float32)
-        pixel_array = (pixel_array / np.max(pixel_array)) * 255
-        pixel_array = pixel_array.astype(np.uint8)
-        image = Image.fromarray(pixel_array) # numpy array to image
-        return image
+        return Image.fromarray(to_uint8(pixel_array, ds)) # numpy array to image
+
+    def dcm_to_image(self, dicom_data):
+        """
+        Convert DICOM data to a windowed 8-bit image, parsing the data only once.
+
+        Parameters:
+        - dicom_data (bytes): The byte data of the DICOM file.
+
+        Returns:
+        PIL.Image.Image: The image of the DICOM pixel data.
+
+        Raises:
+        - InvalidFileFormatError: If the provided data is not in DICOM format.
+        - ValueError: If no file data is provided.
+        """
+        if dicom_data is None:
+            raise ValueError("No file data provided")
+        try:
+            ds = pydicom.dcmread(BytesIO(dicom_data), force=True)
+        except pydicom.errors.InvalidDicomError:
+            raise InvalidFileFormatError("Invalid file format. Expected DICOM file")
+        return self.numpy_to_image(ds.pixel_array, ds)
     
     def overlay_text(self, dicom_data, inference_result, position=(50, 60), font_size=90, font_color="White", font_path=None):
         """
@@ -115,8 +136,7 @@ class ReportGeneration:
         """
         self.inference = inference_result
         try:
-            pixel_array = self.dcm_to_numpy(dicom_data)
-            image = self.numpy_to_image(pixel_array)
+            image = self.dcm_to_image(dicom_data)
             image = image.convert("RGB")
             draw = ImageDraw.Draw(image)
             if font_path:
@@ -148,8 +168,7 @@ class ReportGeneration:
             gender = dicom_info['PatientGender']
             physician = dicom_info['ReferringPhysician']
             study_date_time = dicom_info['StudyDateTime']
-            pixel_array = self.dcm_to_numpy(dicom_data) #get pixel array
-            image = self.numpy_to_image(pixel_array)
+            image = self.dcm_to_image(dicom_data) #get windowed image
             image.thumbnail((380, 450))  # resize image data
             text_image = self.overlay_text(dicom_data, inference_results, position=(50,60), font_size=90, font_color="White", font_path=None)
             # create a blank pdf
@@ -0,0 +1,172 @@
+from pymongo import MongoClient, UpdateOne
+from datetime import datetime, timedelta, timezone
+import re
+import threading
+import time
+from idiagnose_common.metrics import track_dependency
+
+class InMemoryState:
+    """
+    Deployment state kept in the gateway process. Only suitable when the
+    gateway runs as a single process.
+    """
+    def __init__(self):
+        self._values = {}
+        self._namespaces = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            (value, expires) = self._values.get(key, (default, None))
+            if expires is not None and expires <= time.monotonic():
+                return default
+            return value
+
+    def get_many(self, keys):
+        """ Returns {key: value} for the keys that are set. """
+        values = {}
+        for key in keys:
+            value = self.get(key, self)
+            if value is not self:
+                values[key] = value
+        return values
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._values[key] = (value, None if ttl is None else time.monotonic() + ttl)
+
+    def set_many(self, values, ttl=None):
+        for (key, value) in values.items():
+            self.set(key, value, ttl)
+
+    def find_keys(self, prefixes):
+        """ Returns the keys that start with one of 'prefixes'. """
+        now = time.monotonic()
+        with self._lock:
+            return [key for (key, (value, expires)) in self._values.items()
+                    if key.startswith(tuple(prefixes)) and (expires is None or expires > now)]
+
+    def namespace(self, name, cache_ttl=None):
+        """ Separate state for one kind of keys, see GatewayState.namespace. """
+        with self._lock:
+            if name not in self._namespaces:
+                self._namespaces[name] = InMemoryState()
+            return self._namespaces[name]
+
+class GatewayState:
+    """
+    Deployment state shared by every gateway worker process (active PACS type,
+    class list of the training set, ...), stored in MongoDB so that all workers
+    behind the load balancer see the same values. Reads are cached in the
+    process for 'cache_ttl' seconds (0 disables the cache), keeping at most
+    'cache_size' keys.
+    """
+    def __init__(self, collection=None, cache_ttl=1.0, cache_size=1024):
+        if collection is None:
+            self.mongo_uri = "mongodb://localhost:27017/"
+            self.database_name = "local"
+            self.mongo_client = MongoClient(self.mongo_uri)
+            self.mongo_db = self.mongo_client[self.database_name]
+            self.collection_name_state = "gateway_state"
+            collection = self.mongo_db[self.collection_name_state]
+        self.state_collection = collection
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self._cache = {}
+        self._namespaces = {}
+        self._ttl_index = False
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        now = time.monotonic()
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None and cached[1] > now:
+                return default if cached[0] is self else cached[0]
+
+        with track_dependency('mongo', 'gateway_state.find_one'):
+            record = self.state_collection.find_one({'_id': key})
+        self._cache_value(key, record['value'] if record else self, now) # misses are cached too
+        return record['value'] if record else default
+
+    def get_many(self, keys):
+        """ Returns {key: value} for the keys that are set, reading the uncached ones in one query. """
+        now = time.monotonic()
+        values, missing = {}, []
+        with self._lock:
+            for key in keys:
+                cached = self._cache.get(key)
+                if cached is not None and cached[1] > now:
+                    if cached[0] is not self:
+                        values[key] = cached[0]
+                else:
+                    missing.append(key)
+        if not missing:
+            return values
+
+        with track_dependency('mongo', 'gateway_state.find'):
+            found = {record['_id']: record['value'] for record in self.state_collection.find({'_id': {'$in': missing}})}
+        values.update(found)
+        for key in missing:
+            self._cache_value(key, found.get(key, self), now) # misses are cached too
+        return values
+
+    def set(self, key, value, ttl=None):
+        """ Stores 'value'; with a 'ttl' in seconds MongoDB removes it once expired. """
+        update = {'value': value}
+        if ttl is not None:
+            self._ensure_ttl_index()
+            update['expires_at'] = datetime.now(timezone.utc) + timedelta(seconds=ttl)
+        with track_dependency('mongo', 'gateway_state.update_one'):
+            self.state_collection.update_one({'_id': key}, {'$set': update}, upsert=True)
+        self._cache_value(key, value, time.monotonic())
+
+    def set_many(self, values, ttl=None):
+        """ Stores several keys in one bulk write; each key is its own upsert, so concurrent writers never overwrite each other. """
+        if not values:
+            return
+        update = {}
+        if ttl is not None:
+            self._ensure_ttl_index()
+            update['expires_at'] = datetime.now(timezone.utc) + timedelta(seconds=ttl)
+        with track_dependency('mongo', 'gateway_state.bulk_write'):
+            self.state_collection.bulk_write([UpdateOne({'_id': key}, {'$set': dict(update, value=value)}, upsert=True)
+                                              for (key, value) in values.items()], ordered=False)
+        now = time.monotonic()
+        for (key, value) in values.items():
+            self._cache_value(key, value, now)
+
+    def find_keys(self, prefixes):
+        """ Returns the keys that start with one of 'prefixes', always read from MongoDB (anchored regexes use the _id index). """
+        query = {'_id': {'$in': [re.compile('^' + re.escape(prefix)) for prefix in prefixes]}}
+        with track_dependency('mongo', 'gateway_state.find'):
+            return [record['_id'] for record in self.state_collection.find(query, {'_id': 1})]
+
+    def namespace(self, name, cache_ttl=None):
+        """
+        State of one kind of keys in its own collection 'name' of the same
+        database, e.g. large caches that would otherwise crowd out the
+        deployment settings. 'cache_ttl' defaults to the one of this state.
+        """
+        with self._lock:
+            if name not in self._namespaces:
+                self._namespaces[name] = GatewayState(self.state_collection.database[name],
+                                                      self.cache_ttl if cache_ttl is None else cache_ttl,
+                                                      self.cache_size)
+            return self._namespaces[name]
+
+    def _cache_value(self, key, value, now):
+        if self.cache_ttl <= 0:
+            return
+        with self._lock:
+            self._cache.pop(key, None)
+            self._cache[key] = (value, now + self.cache_ttl)
+            while len(self._cache) > self.cache_size:
+                del self._cache[next(iter(self._cache))] # oldest entry first
+
+    def _ensure_ttl_index(self):
+        if self._ttl_index:
+            return
+        with track_dependency('mongo', 'gateway_state.create_index'):
+            self.state_collection.create_index('expires_at', expireAfterSeconds=0)
+        self._ttl_index = True
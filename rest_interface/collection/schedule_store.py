@@ -0,0 +1,89 @@
+from pymongo import MongoClient, ReturnDocument
+import copy
+import threading
+from idiagnose_common.metrics import track_dependency
+
+class InMemoryScheduleStore:
+    """
+    Auto-inferencing job definitions kept in the gateway process. Only
+    suitable when the gateway runs as a single process.
+    """
+    def __init__(self):
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def put(self, job_id, user, tags, next_run):
+        with self._lock:
+            lease_until = self._jobs[job_id]["lease_until"] if job_id in self._jobs else 0
+            self._jobs[job_id] = {"_id": job_id, "user": user, "tags": copy.deepcopy(tags),
+                                  "next_run": next_run, "lease_until": lease_until}
+
+    def find(self, user=None):
+        with self._lock:
+            return [copy.deepcopy(job) for job in self._jobs.values() if user is None or job["user"] == user]
+
+    def delete(self, job_id, user=None):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or (user is not None and job["user"] != user):
+                return False
+            del self._jobs[job_id]
+            return True
+
+    def claim_due(self, now, lease_until, next_run):
+        with self._lock:
+            for job in self._jobs.values():
+                if job["next_run"] <= now and job["lease_until"] <= now:
+                    job.update(next_run=next_run, lease_until=lease_until)
+                    return copy.deepcopy(job)
+            return None
+
+    def release(self, job_id):
+        with self._lock:
+            if job_id in self._jobs:
+                self._jobs[job_id]["lease_until"] = 0
+
+class MongoScheduleStore:
+    """
+    Auto-inferencing job definitions stored in MongoDB, shared by every gateway
+    worker process and kept across restarts. A due job is claimed with a single
+    find_one_and_update, so only one worker starts each run.
+    """
+    def __init__(self, collection=None):
+        if collection is None:
+            self.mongo_uri = "mongodb://localhost:27017/"
+            self.database_name = "local"
+            self.mongo_client = MongoClient(self.mongo_uri)
+            self.mongo_db = self.mongo_client[self.database_name]
+            self.collection_name_schedules = "infer_schedules"
+            collection = self.mongo_db[self.collection_name_schedules]
+        self.schedules_collection = collection
+
+    def put(self, job_id, user, tags, next_run):
+        with track_dependency('mongo', 'infer_schedules.update_one'):
+            self.schedules_collection.update_one({'_id': job_id},
+                                                 {'$set': {'user': user, 'tags': tags, 'next_run': next_run},
+                                                  '$setOnInsert': {'lease_until': 0}},
+                                                 upsert=True)
+
+    def find(self, user=None):
+        with track_dependency('mongo', 'infer_schedules.find'):
+            return list(self.schedules_collection.find({} if user is None else {'user': user}))
+
+    def delete(self, job_id, user=None):
+        query = {'_id': job_id}
+        if user is not None:
+            query['user'] = user
+        with track_dependency('mongo', 'infer_schedules.delete_one'):
+            return self.schedules_collection.delete_one(query).deleted_count == 1
+
+    def claim_due(self, now, lease_until, next_run):
+        with track_dependency('mongo', 'infer_schedules.find_one_and_update'):
+            return self.schedules_collection.find_one_and_update(
+                {'next_run': {'$lte': now}, 'lease_until': {'$lte': now}},
+                {'$set': {'next_run': next_run, 'lease_until': lease_until}},
+                return_document=ReturnDocument.AFTER)
+
+    def release(self, job_id):
+        with track_dependency('mongo', 'infer_schedules.update_one'):
+            self.schedules_collection.update_one({'_id': job_id}, {'$set': {'lease_until': 0}})
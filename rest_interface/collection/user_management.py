@@ -3,6 +3,7 @@ from flask_jwt_extended import JWTManager, create_access_token
 from werkzeug.security import generate_password_hash, check_password_hash
 from pymongo import MongoClient
 import json
+from idiagnose_common.metrics import track_dependency
 
 app = Flask(__name__)
 jwt = JWTManager(app)
@@ -18,13 +19,17 @@ class UserManagement:
   
     def register_user(self, username, password):
         hashed_password = generate_password_hash(password)
-        if self.users_collection.find_one({'username': username}):
+        with track_dependency('mongo', 'reg_user.find_one'):
+            existing_user = self.users_collection.find_one({'username': username})
+        if existing_user:
             return jsonify({'message': f"Username '{username}' already exists"}), 400
-        self.users_collection.insert_one({'username': username, 'password': hashed_password})
+        with track_dependency('mongo', 'reg_user.insert_one'):
+            self.users_collection.insert_one({'username': username, 'password': hashed_password})
         return jsonify({'message': f"User '{username}' registered successfully"}), 200
 
     def login_user(self, username, password):
-        user = self.users_collection.find_one({'username': username})
+        with track_dependency('mongo', 'reg_user.find_one'):
+            user = self.users_collection.find_one({'username': username})
         if not user or not check_password_hash(user['password'], password):
             return jsonify({'message': "Invalid username or password"}), 401
         access_token = create_access_token(identity=username)
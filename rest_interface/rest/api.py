@@ -1,36 +1,163 @@
 from flask import jsonify, send_file,request
 import requests
 from utils.image_utils.preprocessing import ImageProcessing
-from utils.image_utils.image_validator import ImageQualityValidation
+from utils.image_utils.image_validator import ImageQualityValidation, ScreeningCache, read_image_size
 from utils.image_utils.dicom2pdf import PdfGeneration
+from utils.image_utils.decoded_image import DecodedImage
+from utils.image_utils.dedupe import DedupeIndex
+from utils.image_utils.preview import render_previews, PREVIEW_SIZES
 from utils.exceptions import *
+from utils.http_client import SessionRegistry
+from utils.worker_pool import CpuWorkerPool
+from collection.gateway_state import InMemoryState
+from utils.ttl_cache import TTLCache
+from utils.disk_cache import DiskCache
+from idiagnose_common.tracing import bind_context
 import base64
 import io
 import numpy as np
 import json
+import pydicom
 from pydicom.valuerep import PersonName
 import shutil
 from zipfile import ZipFile
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import itertools
+import tempfile
+
+
+def prepare_image(img_data, imtype='dcm'):
+    """
+    Decodes, validates and resizes one image. The image is decoded once and the
+    same DecodedImage is used for validation and preprocessing. Kept at module
+    level so it can be sent to the CPU worker processes.
+    """
+    ip = ImageProcessing()
+    iv = ImageQualityValidation()
+
+    if hasattr(img_data, 'read'):
+        img_data = img_data.read()
+    # Reject low resolution images from the header, before the pixel data is decoded
+    if imtype in ['dcm', 'jpg', 'png', 'bmp'] and not iv.check_resolution(*read_image_size(img_data, imtype)):
+        raise ValueError("Image Resolution is not valid")
+    decoded_image = DecodedImage.from_data(img_data, imtype)
+    iDiagnoseRestAPI.validate_image(decoded_image, iv)
+
+    img_npy = ip.decoded_to_array(decoded_image)
+
+    if not ip.validate_img_size((224, 224), img_npy.shape):
+        img_npy = ip.resize_array(img_npy, (224, 224))
+        #img_npy = ip.normalize_img(img_npy)
+    return img_npy
 
 
 class iDiagnoseRestAPI:
     
-    def __init__(self, dicom, reporting, inference_server, cloud_server, scheme):
-        (self.dicom_ip, self.dicom_port) = dicom
+    def __init__(self, dicom, reporting, inference_server, cloud_server, scheme, http_conf=None, gateway_conf=None, pacs_servers=None, state=None):
+        self.default_dicom = dicom # PACS interface used until a PACS type is configured
         (self.reporting_ip, self.reporting_port) = reporting
         (self.infer_ip, self.infer_port) = inference_server
         (self.cloud_ip, self.cloud_port) = cloud_server
 
-        self.CLASSES_LIST = []
         self.dcm_as_pdf = True # default flag to convert DICOM image data as pdf
         self.scheme = scheme
+        self.pacs_servers = pacs_servers or {} # pacsType -> (server name, ip, port) of the PACS interfaces
+        self.state = state if state is not None else InMemoryState() # deployment state shared by all gateway workers
+        self.http = SessionRegistry(http_conf) # pooled keep-alive sessions per downstream service
+        gateway_conf = gateway_conf or {}
+        self.search_sr_concurrency = gateway_conf.get('search_sr_concurrency', 8) # max parallel cloud lookups per search-sr request
+        self.pacs_retrieve_concurrency = gateway_conf.get('pacs_retrieve_concurrency', 4) # max parallel PACS retrieves per train-data export
+        self.retrieve_spool_size = gateway_conf.get('retrieve_spool_size', 32 * 1024 * 1024) # bytes kept in memory per retrieve before spilling to a temp file
+        self.tensor_transport = gateway_conf.get('tensor_transport', 'binary') # 'binary' (octet-stream) or 'json' (base64) towards inference
+        self.infer_batch_size = gateway_conf.get('infer_batch_size', 32) # images per batched inference request
+        self.batch_preprocess_workers = gateway_conf.get('batch_preprocess_workers', 4) # threads validating/preprocessing a batch
+        self.cpu_pool = CpuWorkerPool(gateway_conf.get('cpu_workers', 0)) # processes for decoding, screening and PDF rendering, 0 runs inline
+        self.search_cache = TTLCache(gateway_conf.get('search_cache_ttl', 30),
+                                     gateway_conf.get('search_cache_max_bytes', 16 * 1024 * 1024)) # patient search results of this worker, keyed by PACS and patient; other workers only see a change once their entry expires
+        self.pdf_cache = TTLCache(gateway_conf.get('pdf_cache_ttl', 3600),
+                                  gateway_conf.get('pdf_cache_max_bytes', 64 * 1024 * 1024)) # rendered PDFs by SOPInstanceUID and transfer syntax
+        self.preview_cache = DiskCache(gateway_conf.get('preview_cache_dir', './preview_cache'),
+                                       gateway_conf.get('preview_cache_max_bytes', 256 * 1024 * 1024)) # thumbnails by SOPInstanceUID, shared by the workers
+        self.dedupe_phash_distance = gateway_conf.get('dedupe_phash_distance', None) # max Hamming distance of near duplicate uploads (0-3), None to disable
+        self.screening_cache = ScreeningCache(self.state.namespace('screening_cache', cache_ttl=0),
+                                              ttl=gateway_conf.get('screening_cache_ttl', 30 * 24 * 3600)) if gateway_conf.get('screening_cache', True) else None # screening results by file hash, reused by re-uploads
+        self.zip_limits = {"max_members": gateway_conf.get('zip_max_members', 100000),
+                           "max_uncompressed_size": gateway_conf.get('zip_max_uncompressed_bytes', 16 * 1024 ** 3),
+                           "max_compression_ratio": gateway_conf.get('zip_max_compression_ratio', 100)} # checked on the zip central directory of uploads
+
+    def get_pacs(self):
+        """
+        Returns (server name, ip, port) of the PACS interface selected through
+        /api/configure-pacs, read from the shared state.
+        """
+        pacs_type = self.state.get('pacs_type')
+        if pacs_type in self.pacs_servers:
+            return self.pacs_servers[pacs_type]
+        return ('dicom_server',) + tuple(self.default_dicom)
+
+    def set_pacs_type(self, pacs_type):
+        if pacs_type not in self.pacs_servers:
+            raise ValueError("Unknown Server Type")
+        self.state.set('pacs_type', pacs_type)
+        self.search_cache.clear()
+
+    def dicom_base_url(self):
+        (_, ip, port) = self.get_pacs()
+        return self.scheme+ip+':'+str(port)
+
+    @property
+    def dicom_server(self):
+        return self.get_pacs()[0]
+
+    @property
+    def dicom_ip(self):
+        return self.get_pacs()[1]
+
+    @property
+    def dicom_port(self):
+        return self.get_pacs()[2]
+
+    @property
+    def CLASSES_LIST(self):
+        return self.state.get('classes_list', [])
+
+    @CLASSES_LIST.setter
+    def CLASSES_LIST(self, classes_list):
+        self.state.set('classes_list', list(classes_list))
+
+    @property
+    def NUM_CLASSES(self):
+        return len(self.CLASSES_LIST)
+
+    def dedupe_index(self, project):
+        """ Hash index of the images already uploaded to 'project', kept in the shared state. """
+        return DedupeIndex(self.state.namespace('dedupe', cache_ttl=0), project, self.dedupe_phash_distance)
+
+    @property
+    def dicom_session(self):
+        return self.http.session(self.dicom_server)
+
+    @property
+    def reporting_session(self):
+        return self.http.session('reporting_server')
+
+    @property
+    def infer_session(self):
+        return self.http.session('infer_server')
+
+    @property
+    def cloud_session(self):
+        return self.http.session('cloud_server')
         
     def feedback_request(self, data):
         dicom_url = self.scheme+self.cloud_ip+':'+str(self.cloud_port)+'/cloud-api/feedback'
         access_token = request.headers.get('Authorization').replace('Bearer ', '')
         if access_token:
             headers = {'Authorization': 'Bearer ' + access_token}
-            response = requests.post(dicom_url, json=data,headers=headers)
+            response = self.cloud_session.post(dicom_url, json=data,headers=headers)
+            for feedback in data:
+                for record in feedback.get("records", []):
+                    self.invalidate_patient(record.get("PID"))
             return response
         else:
         # Handle the case when Authorization header is not present
@@ -42,7 +169,7 @@ class iDiagnoseRestAPI:
         if access_token:
             headers = {'Authorization': 'Bearer ' + access_token}
             headers.update({'Content-Type': 'application/json'})
-            response = requests.post(url=api_url, json=data, headers=headers)
+            response = self.cloud_session.post(url=api_url, json=data, headers=headers)
             return response
         else:
             return jsonify({'error': 'Authorization header not found'}), 401
@@ -54,28 +181,44 @@ class iDiagnoseRestAPI:
         if access_token:
             headers = {'Authorization': 'Bearer ' + access_token}
             headers.update({'Content-Type': 'application/json'})
-            response = requests.post(url=api_url, json=data, headers=headers)
+            response = self.cloud_session.post(url=api_url, json=data, headers=headers)
             return response
         else:
             return jsonify({'error': 'Authorization header not found'}), 401
     
+    def upload_dataset(self, path, chunks, access_token):
+        """
+        Forwards a zipped data set to cloud_interface as an application/zip
+        request body, sent chunk by chunk from the iterable 'chunks', so the
+        archive is never held in memory or copied to disk by the gateway.
+        """
+        upload_url = self.scheme + self.cloud_ip+':'+str(self.cloud_port)+path
+        headers = {'Authorization': 'Bearer ' + access_token, 'Content-Type': 'application/zip'}
+        return self.cloud_session.post(upload_url, data=chunks, headers=headers)
+
     def examine_request(self, data):
-        api_url = self.scheme+self.dicom_ip+':'+str(self.dicom_port)+'/api/examined-training-data'
+        api_url = self.dicom_base_url()+'/api/examined-training-data'
         access_token = request.headers.get('Authorization').replace('Bearer ', '')
         if access_token:
             headers = {'Authorization': 'Bearer ' + access_token}
-            response = requests.get(url=api_url, json=data,headers=headers)
+            response = self.dicom_session.get(url=api_url, json=data,headers=headers)
             return response
         else:
             return jsonify({'error': 'Authorization header not found'}), 401
 
     def download_from_pacs(self, data):
-        query_url = self.scheme+self.dicom_ip+':'+str(self.dicom_port)+'/api/query'
-        retrieve_url = self.scheme+self.dicom_ip+':'+str(self.dicom_port)+'/api/retrieve'
+        """
+        Queries the PACS for all series matching 'data' and returns a generator
+        of (filename, file object) pairs, one per retrieved series. The series
+        are retrieved lazily while the generator is consumed, see iter_retrieved_series.
+        """
+        dicom_url = self.dicom_base_url()
+        query_url = dicom_url+'/api/query'
+        retrieve_url = dicom_url+'/api/retrieve'
         access_token = request.headers.get('Authorization').replace('Bearer ', '')
         if access_token:
             headers = {'Authorization': 'Bearer ' + access_token}
-            response = requests.get(url=query_url, json=data, headers=headers)
+            response = self.dicom_session.get(url=query_url, json=data, headers=headers)
 
             queries = []
             for patient in response.json():
@@ -88,16 +231,49 @@ class iDiagnoseRestAPI:
                     
                         queries.append(query_dict)
 
-            files = []
-            for query in queries:
-                response = requests.get(url=retrieve_url, json=query, headers=headers)
-                if response.status_code == 200:
-                    files.append((f"{query['PatientID']}_{query['StudyInstanceUID']}_{query['SeriesInstanceUID']}", response.content))
-            
-            return files
+            return self.iter_retrieved_series(retrieve_url, queries, headers)
         else:
             return jsonify({'error': 'Authorization header not found'}), 401
 
+    def iter_retrieved_series(self, retrieve_url, queries, headers):
+        """
+        Retrieves the series in 'queries' with at most 'pacs_retrieve_concurrency'
+        retrieves in flight and yields (filename, file object) in completion order.
+        Each body is streamed into a private spooled temp file, so memory use is
+        bounded by the concurrency and not by the size of the cohort. Series that
+        fail to retrieve are skipped.
+        """
+        def retrieve(query):
+            response = self.dicom_session.get(url=retrieve_url, json=query, headers=headers, stream=True)
+            with response:
+                if response.status_code != 200:
+                    return query, None
+                buffer = tempfile.SpooledTemporaryFile(max_size=self.retrieve_spool_size)
+                for chunk in response.iter_content(chunk_size=1024 * 1024):
+                    buffer.write(chunk)
+            buffer.seek(0)
+            return query, buffer
+
+        retrieve = bind_context(retrieve)
+        queries = iter(queries)
+        workers = max(1, self.pacs_retrieve_concurrency)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            pending = {executor.submit(retrieve, query) for query in itertools.islice(queries, workers)}
+            try:
+                while pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        next_query = next(queries, None)
+                        if next_query is not None:
+                            pending.add(executor.submit(retrieve, next_query))
+                        query, buffer = future.result()
+                        if buffer is not None:
+                            with buffer:
+                                yield (f"{query['PatientID']}_{query['StudyInstanceUID']}_{query['SeriesInstanceUID']}", buffer)
+            finally:
+                for future in pending:
+                    future.cancel()
+
         
     def infer_request(self, data):
         api_url = self.scheme + self.infer_ip+':'+str(self.infer_port)+'/api/infer/lungs-xray'
@@ -105,19 +281,19 @@ class iDiagnoseRestAPI:
         if access_token:
             headers = {'Authorization': 'Bearer ' + access_token}
             headers.update({'Content-Type': 'application/json'})
-            response = requests.post(url=api_url, json=data, headers=headers)
+            response = self.infer_session.post(url=api_url, json=data, headers=headers)
             return response
         else:
             return jsonify({'error': 'Authorization header not found'}), 401
 
     def search_get_request(self, pid):
-        dicom_url = self.scheme+self.dicom_ip+':'+str(self.dicom_port)+'/api/query'
+        dicom_url = self.dicom_base_url()+'/api/query'
         report_url = self.scheme+self.cloud_ip+':'+str(self.cloud_port)+'/cloud-api/report/check-record'
         access_token = request.headers.get('Authorization').replace('Bearer ', '')
         headers = {'Authorization': 'Bearer ' + access_token}
         request_body = {"PatientID":str(pid)}
 		
-        response = requests.get(dicom_url, json=request_body, headers = headers)
+        response = self.dicom_session.get(dicom_url, json=request_body, headers = headers)
         report_req = {
             "PatientID": str(pid),
             "SeriesUID" : None
@@ -135,59 +311,156 @@ class iDiagnoseRestAPI:
                     "PatientID": str(pid),
                     "SeriesUID": series_uids
                 }
-        report_resp = requests.post(report_url, json=report_req,headers=headers)
+        report_resp = self.cloud_session.post(report_url, json=report_req,headers=headers)
         return response, report_resp
 
 
     def search_post_request(self, data):
         pid = data['pid']
-        self.request_body = data['series_data']
+        request_body = data['series_data']
 
         report_req = {
             "PatientID": str(pid),
-            "SeriesUID": self.request_body['SeriesInstanceUID']
+            "SeriesUID": request_body['SeriesInstanceUID']
         }
 
-        api_url = self.scheme+self.dicom_ip+':'+str(self.dicom_port)+'/api/retrieve'
+        api_url = self.dicom_base_url()+'/api/retrieve'
         report_url = self.scheme+self.cloud_ip+':'+str(self.cloud_port)+'/cloud-api/report/get-report'
         access_token = request.headers.get('Authorization').replace('Bearer ', '')
         headers = {'Authorization': 'Bearer ' + access_token}
-        response = requests.get(api_url, json=self.request_body,headers=headers)
+        response = self.dicom_session.get(api_url, json=request_body,headers=headers)
         if response.status_code == 200:
-            report_resp = requests.post(report_url, json=report_req,headers=headers)
+            report_resp = self.cloud_session.post(report_url, json=report_req,headers=headers)
         else:
             response, report_resp = None, None
             
         return response, report_resp
 
-    def validate_image(self, image_data, iv):
+    @staticmethod
+    def validate_image(decoded_image, iv):
 
-        if (iv.check_image_resolution_file(image_data) == False):
+        if (iv.check_image_resolution_decoded(decoded_image) == False):
             raise ValueError("Image Resolution is not valid")
-        elif(iv.is_not_blank_image_file(image_data) == False):
+        elif(iv.blank_image_screening_decoded(decoded_image) == False):
             raise(InvalidImageDataError("Image Data is blank."))
         return True
 
 
-    def image_processing(self, img_data, imtype='dcm'):
-        ip = ImageProcessing()
-        iv = ImageQualityValidation()
+    def image_to_tensor(self, img_data, imtype='dcm'):
+        """
+        Validates the image and returns it as a (224, 224) numpy array in its
+        original dtype, ready to be sent to the inference service. Decoding,
+        screening and resizing run on the CPU worker pool.
+        """
+        return self.cpu_pool.run(prepare_image, img_data, imtype)
 
-        self.validate_image(img_data, iv)
-
-        img_npy = ip.image_to_array(img_data, imtype)
-        
-    
-        if (ip.validate_img_size((224, 224), img_npy.shape)):
-            img_npy = ip.resize_array(img_npy, (224, 224))
-            #img_npy = ip.normalize_img(img_npy)
+    def image_processing(self, img_data, imtype='dcm'):
+        img_npy = self.image_to_tensor(img_data, imtype)
+        return self.encode_tensor(img_npy)
 
-            b64_img = base64.b64encode(img_npy)
-            if img_npy.dtype == np.int16:
-                dtype="int16"
-            else:
-                dtype="uint8"
-            return b64_img, dtype
+    def encode_tensor(self, img_npy):
+        b64_img = base64.b64encode(img_npy)
+        if img_npy.dtype == np.int16:
+            dtype="int16"
+        else:
+            dtype="uint8"
+        return b64_img, dtype
+
+    def infer_tensor(self, img_npy):
+        """
+        Sends a preprocessed image array to the inference service.
+
+        With 'binary' transport the raw array bytes are posted as
+        application/octet-stream with X-Tensor-Dtype / X-Tensor-Shape headers,
+        which the inference service wraps with np.frombuffer. With 'json'
+        transport the array is base64 encoded in the JSON body as before.
+        """
+        api_url = self.scheme + self.infer_ip+':'+str(self.infer_port)+'/api/infer/lungs-xray'
+        access_token = request.headers.get('Authorization').replace('Bearer ', '')
+        headers = {'Authorization': 'Bearer ' + access_token}
+        if self.tensor_transport == 'binary':
+            img_npy = np.ascontiguousarray(img_npy)
+            headers.update({'Content-Type': 'application/octet-stream',
+                            'X-Tensor-Dtype': img_npy.dtype.name,
+                            'X-Tensor-Shape': ','.join(str(dim) for dim in img_npy.shape)})
+            return self.infer_session.post(url=api_url, data=img_npy.tobytes(), headers=headers)
+        else:
+            b64_img, dtype = self.encode_tensor(img_npy)
+            headers.update({'Content-Type': 'application/json'})
+            return self.infer_session.post(url=api_url, json={'patient_dicom': str(b64_img), 'dtype': dtype}, headers=headers)
+
+    def infer_tensor_batch(self, batch_npy):
+        """
+        Sends a (N, 224, 224) batch of preprocessed images to the batch
+        inference endpoint as one application/octet-stream request.
+        """
+        api_url = self.scheme + self.infer_ip+':'+str(self.infer_port)+'/api/infer/lungs-xray/batch'
+        access_token = request.headers.get('Authorization').replace('Bearer ', '')
+        batch_npy = np.ascontiguousarray(batch_npy)
+        headers = {'Authorization': 'Bearer ' + access_token,
+                   'Content-Type': 'application/octet-stream',
+                   'X-Tensor-Dtype': batch_npy.dtype.name,
+                   'X-Tensor-Shape': ','.join(str(dim) for dim in batch_npy.shape)}
+        return self.infer_session.post(url=api_url, data=batch_npy.tobytes(), headers=headers)
+
+    def preprocess_batch_item(self, filename, img_data):
+        """
+        Validates and preprocesses one image of a batch.
+        Returns (img_npy, None) on success, or (None, error message).
+        """
+        imtype = filename.rsplit('.', 1)[-1].lower()
+        try:
+            if imtype not in ['jpg', 'bmp', 'png', 'dcm']:
+                raise FileFormatError("Provided file format "+imtype+' is not supported.')
+            return self.image_to_tensor(img_data, imtype), None
+        except Exception as e:
+            return None, str(e)
+
+    def infer_batch(self, images):
+        """
+        Runs inference on an iterable of (filename, image bytes or ZipMember).
+
+        Images are validated and preprocessed in parallel, 'infer_batch_size'
+        at a time, and each chunk is sent to the inference service as one
+        batched tensor per dtype, filled into a buffer reused by every chunk.
+        Returns one entry per image, in input order, holding either
+        'ai_result' or 'error'.
+        """
+        images = iter(images)
+        results = []
+        ip = ImageProcessing()
+        buffers = {} # dtype -> (infer_batch_size, 224, 224) array reused by every chunk
+        with ThreadPoolExecutor(max_workers=max(1, self.batch_preprocess_workers)) as executor:
+            while True:
+                chunk = list(itertools.islice(images, max(1, self.infer_batch_size)))
+                if not chunk:
+                    break
+                processed = list(executor.map(lambda item: self.preprocess_batch_item(*item), chunk))
+                chunk_results = [{"filename": filename} for filename, _ in chunk]
+
+                groups = {}
+                for index, (img_npy, error) in enumerate(processed):
+                    if error is not None:
+                        chunk_results[index]["error"] = error
+                    else:
+                        groups.setdefault(img_npy.dtype.name, []).append(index)
+
+                for (dtype, indices) in groups.items():
+                    if dtype not in buffers:
+                        buffers[dtype] = np.empty((max(1, self.infer_batch_size), 224, 224), dtype=dtype)
+                    (batch_npy, _) = ip.batch_to_array([processed[index][0] for index in indices],
+                                                       out=buffers[dtype][:len(indices)])
+                    try:
+                        response = self.infer_tensor_batch(batch_npy)
+                        if response.status_code != 200:
+                            raise ValueError(response.json())
+                        for index, ai_result in zip(indices, response.json()['ai_results']):
+                            chunk_results[index]["ai_result"] = ai_result
+                    except Exception as e:
+                        for index in indices:
+                            chunk_results[index]["error"] = str(e)
+                results.extend(chunk_results)
+        return results
 
     def generate_report(self, dicom_data, ai_result):
         url = self.scheme+self.reporting_ip+':'+str(self.reporting_port)+'/report/create-interim-report'
@@ -196,7 +469,7 @@ class iDiagnoseRestAPI:
         files = {'dicom_data': ('dicom_data', dicom_data)}
         data = {'inference_results': json.dumps(ai_result)}
         headers = {'Authorization': 'Bearer ' + access_token}
-        response = requests.post(url, files=files, data=data,headers=headers)
+        response = self.reporting_session.post(url, files=files, data=data,headers=headers)
 
         try:
             result = response.json()
@@ -208,16 +481,12 @@ class iDiagnoseRestAPI:
             return f"Failed to decode JSON: {e}"
 
 
-    def inference_dicom(self, dicom_image, dtype):
+    def inference_dicom(self, img_npy):
         '''
             This function works for performing the inferncine
         '''
-        api_url = self.scheme+self.infer_ip+':'+str(self.infer_port)+'/api/infer/lungs-xray'
-        access_token = request.headers.get('Authorization').replace('Bearer ', '')
-        headers = {'Authorization': 'Bearer ' + access_token}
         try:
-            response = requests.post(
-                url=api_url, json={'patient_dicom': str(dicom_image), 'dtype':dtype, 'fromSearch': True}, headers=headers) 
+            response = self.infer_tensor(img_npy)
 
             if response.status_code == 200:
                 return response.json()
@@ -230,7 +499,7 @@ class iDiagnoseRestAPI:
             
     
     def search_sr(self, data):
-        dicom_query_url = self.scheme+self.dicom_ip+':'+str(self.dicom_port)+'/api/query'
+        dicom_query_url = self.dicom_base_url()+'/api/query'
         cloud_url = self.scheme+self.cloud_ip+':'+str(self.cloud_port)+'/cloud-api/report/get-patient-inference'
 
         pn = PersonName.from_named_components(family_name = data.get("lastname",""), given_name = data.get("firstname",""),
@@ -241,7 +510,7 @@ class iDiagnoseRestAPI:
         access_token = request.headers.get('Authorization').replace('Bearer ', '')
         headers = {'Authorization': 'Bearer ' + access_token}
         
-        dicom_resp = requests.get(dicom_query_url, json=dicom_query_body, headers=headers)
+        dicom_resp = self.dicom_session.get(dicom_query_url, json=dicom_query_body, headers=headers)
         if dicom_resp.status_code == 200:
             dicom_studies = dicom_resp.json()
             if not dicom_studies:
@@ -256,16 +525,16 @@ class iDiagnoseRestAPI:
                     for study_data in patient_data['studies']:
                         for series_data in study_data['series']:
                             series_uids.append(series_data['series_uid'])
+            series_uids = list(dict.fromkeys(series_uids))
             
             inferences = []
             images = []
             
-            for id in series_uids:
-                series_request = {"PatientID": data["pid"], "SeriesInstanceUID": id}
-                report_resp = requests.get(cloud_url, json = series_request, headers = headers)
-                if report_resp.status_code == 200:
-                    current_inference = report_resp.json()["inference"]
-                    current_image = report_resp.json()["image_path"]
+            series_requests = [{"PatientID": data["pid"], "SeriesInstanceUID": id} for id in series_uids]
+            for report in self.get_patient_inferences(cloud_url, series_requests, headers):
+                if report is not None:
+                    current_inference = report["inference"]
+                    current_image = report["image_path"]
                     if current_inference not in inferences:
                         inferences.append(current_inference)
                     if current_image not in images:
@@ -279,6 +548,27 @@ class iDiagnoseRestAPI:
             return jsonify(dicom_resp.json())
     
 
+    def get_patient_inferences(self, cloud_url, series_requests, headers):
+        """
+        Fetches the stored inference of every series concurrently, with at most
+        'search_sr_concurrency' requests in flight for one search.
+
+        Returns the report json (or None when not found) per series, in the
+        same order as 'series_requests'.
+        """
+        if not series_requests:
+            return []
+
+        def fetch(series_request):
+            report_resp = self.cloud_session.get(cloud_url, json = series_request, headers = headers)
+            if report_resp.status_code == 200:
+                return report_resp.json()
+            return None
+
+        workers = max(1, min(self.search_sr_concurrency, len(series_requests)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(bind_context(fetch), series_requests))
+
     def isAIEnabled(self, data):
         try:
             if data['AI_enabled'] is True:
@@ -290,15 +580,89 @@ class iDiagnoseRestAPI:
         return ai_infer
     
     
+    def render_pdf(self, dicom_bytes):
+        """
+        Renders a DICOM file as PDF on the CPU worker pool. Rendered PDFs are
+        kept in an LRU cache keyed by SOPInstanceUID and transfer syntax, so
+        repeat views of the same instance skip the rendering.
+        """
+        key = PdfGeneration.cache_key(dicom_bytes)
+        pdf = self.pdf_cache.get(key) if key is not None else None
+        if pdf is None:
+            pdf = self.cpu_pool.run(PdfGeneration().byte_to_pdf, dicom_bytes)
+            if key is not None:
+                self.pdf_cache.put(key, pdf, len(pdf))
+        return pdf
+
+    @staticmethod
+    def preview_key(sop_instance_uid, size, fmt):
+        return f"{sop_instance_uid}/{size}.{fmt}"
+
+    def get_preview(self, series_data, size, fmt):
+        """
+        Returns a windowed thumbnail of a series (its first instance) that fits
+        in a size x size box, in 'jpeg' or 'png' format, or None if the series
+        cannot be retrieved.
+
+        Thumbnails are kept in a disk cache keyed by SOPInstanceUID. All sizes
+        of PREVIEW_SIZES are rendered from one retrieve, and the series is
+        mapped to the SOPInstanceUID read from the retrieved file, so later
+        requests skip the PACS entirely.
+        """
+        series_key = f"series/{series_data['SeriesInstanceUID']}"
+        cached_uid = self.preview_cache.get(series_key)
+        sop_instance_uid = cached_uid.decode() if cached_uid is not None else None
+        if sop_instance_uid is not None:
+            preview = self.preview_cache.get(self.preview_key(sop_instance_uid, size, fmt))
+            if preview is not None:
+                return preview
+
+        api_url = self.dicom_base_url()+'/api/retrieve'
+        access_token = request.headers.get('Authorization').replace('Bearer ', '')
+        headers = {'Authorization': 'Bearer ' + access_token}
+        response = self.dicom_session.get(api_url, json=series_data, headers=headers)
+        if response.status_code != 200:
+            return None
+
+        ds = pydicom.dcmread(io.BytesIO(response.content), force=True, stop_before_pixels=True)
+        sop_instance_uid = str(ds.get('SOPInstanceUID', series_data['SeriesInstanceUID']))
+        previews = self.cpu_pool.run(render_previews, response.content, PREVIEW_SIZES, fmt)
+        for preview_size, preview in previews.items():
+            self.preview_cache.put(self.preview_key(sop_instance_uid, preview_size, fmt), preview)
+        self.preview_cache.put(series_key, sop_instance_uid.encode())
+        return previews[size]
+
+    @staticmethod
+    def normalize_pid(pid):
+        return str(pid).strip()
+
+    def search_key(self, pid):
+        """ Search cache key of a patient on the active PACS. """
+        return (self.dicom_base_url(), self.normalize_pid(pid))
+
+    def invalidate_patient(self, pid):
+        """
+        Drops the cached search result of a patient whose records changed.
+        Only the cache of this worker is cleared: the other workers keep
+        theirs until 'search_cache_ttl' expires.
+        """
+        if pid is not None:
+            self.search_cache.invalidate(self.search_key(pid))
+
     def search_get(self, request):
         pid = request.json['pid']
+        cache_key = self.search_key(pid)
+        cached = self.search_cache.get(cache_key)
+        if cached is not None:
+            return jsonify(cached), 200
+
         response,  report_resp = self.search_get_request(pid)
         if response.status_code == 200 and report_resp.status_code == 200:
             if len(response.json()) == 0:
                 if report_resp.json()['record_available']:
-                    return jsonify({"PACS_RESPONSE": "No record found in Query, but got the SR in Report Database. Please raise the request to clear the report."}), 200
+                    return_resp = {"PACS_RESPONSE": "No record found in Query, but got the SR in Report Database. Please raise the request to clear the report."}
                 else:
-                    return jsonify({"PACS_RESPONSE": "No Patient Data available, Please check the Patient ID passed in request."}), 200
+                    return_resp = {"PACS_RESPONSE": "No Patient Data available, Please check the Patient ID passed in request."}
             else: 
                 if report_resp.json()['record_available']:
                     return_resp = {
@@ -310,7 +674,8 @@ class iDiagnoseRestAPI:
                         "PACS_RESPONSE": response.json(),
                         "REPORT_CHECK": None
                     }
-                return jsonify(return_resp), 200
+            self.search_cache.put(cache_key, return_resp, len(response.content) + len(report_resp.content))
+            return jsonify(return_resp), 200
 
         else:
             if response.status_code != 200:
@@ -333,22 +698,21 @@ class iDiagnoseRestAPI:
                 return jsonify({"Message":"Something wrong with the /api/retrieve"}), 200
             
             if self.dcm_as_pdf:
-                dcm2pdf = PdfGeneration()
-                image_data = dcm2pdf.byte_to_pdf(response.content)
+                image_data = self.render_pdf(response.content)
                 mimetype = 'application/pdf'
-                filename = f"{self.request_body['SeriesInstanceUID']}.pdf"
+                filename = f"{data['series_data']['SeriesInstanceUID']}.pdf"
             else:
                 image_data = response.content
                 mimetype = 'image/dicom'
-                filename = f"{self.request_body['SeriesInstanceUID']}.dcm"
+                filename = f"{data['series_data']['SeriesInstanceUID']}.dcm"
 
             b64_dicom_file = base64.b64encode(image_data).decode('utf-8')
 
             reporting_response = reporting_resp.json()
             if ai_infer:
                 if not reporting_response['record_available']:
-                    b64_img, dtype = self.image_processing(response.content)
-                    res = self.inference_dicom(b64_img, dtype)
+                    img_npy = self.image_to_tensor(response.content)
+                    res = self.inference_dicom(img_npy)
                     resp = self.generate_report(response.content, res)
                     json_payload = {
                         "imagefile" : b64_dicom_file,
@@ -359,7 +723,8 @@ class iDiagnoseRestAPI:
                     
                     try:
                         url = self.scheme+self.cloud_ip+':'+str(self.cloud_port)+'/cloud-api/report/update-interim-report'
-                        response=requests.post(url,json=json_payload,headers=headers)
+                        response=self.cloud_session.post(url,json=json_payload,headers=headers)
+                        self.invalidate_patient(data['pid'])
                         if response.status_code == 200:
                             return response.json()
                         elif response.status_code == 404:
@@ -393,7 +758,7 @@ class iDiagnoseRestAPI:
                 request_body = {"query": query, "conditions": self.CLASSES_LIST,"inference":inference}
                 api_url = self.scheme+self.reporting_ip+':'+str(self.reporting_port)+'/api/handle-query'
                 headers = {'Authorization': 'Bearer ' + access_token}
-                response = requests.get(url=api_url, json=request_body,headers=headers) 
+                response = self.reporting_session.get(url=api_url, json=request_body,headers=headers) 
                 return response
             else:
                 return None
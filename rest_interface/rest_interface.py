@@ -1,22 +1,27 @@
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, request, jsonify, send_file, Response, stream_with_context
 from utils.config import Config
 from rest.api import iDiagnoseRestAPI
-from utils.zip_utils import ZipManager
+from utils.zip_utils import ZipManager, stream_zip, iter_zip_members
+import zipfile
+import tempfile
+import os
 from utils.image_utils.image_validator import ImageQualityValidation
+from utils.image_utils.preview import PREVIEW_SIZES, PREVIEW_FORMATS
 from utils.exceptions import *
-import requests
-import os
-import shutil
-from apscheduler.schedulers.background import BackgroundScheduler
 import yaml
 from flask_jwt_extended import JWTManager, jwt_required, get_jwt_identity, create_refresh_token
 from collection.user_management import UserManagement
+from collection.gateway_state import GatewayState
+from collection.schedule_store import MongoScheduleStore
+from utils.job_manager import JobManager
+from utils.infer_scheduler import InferenceScheduler
+from idiagnose_common.metrics import init_metrics
+from idiagnose_common.tracing import init_tracing, create_exporter, TRACER
 import logging
 from datetime import timedelta
-import io
-from zipfile import ZipFile
 
 app = Flask(__name__)
+init_metrics(app)
 
 cfg = Config("./config/microservice_conf.json")
 dicom_ip, dicom_port = cfg.get_server_port_ip('dicom_server')
@@ -24,6 +29,8 @@ dicomweb_ip, dicomweb_port = cfg.get_server_port_ip('dicomweb_server')
 reporting_ip, reporting_port = cfg.get_server_port_ip('reporting_server')
 infer_ip, infer_port = cfg.get_server_port_ip('infer_server')
 cloud_ip, cloud_port = cfg.get_server_port_ip('cloud_server')
+http_conf = cfg.get_http_client_conf()
+gateway_conf = cfg.get_gateway_conf()
 
 with open('config/auth_config.yaml', 'r') as config_file:
     config = yaml.safe_load(config_file)
@@ -36,7 +43,20 @@ rest = iDiagnoseRestAPI((None, None),
                         (reporting_ip, reporting_port), 
                         (infer_ip, infer_port), 
                         (cloud_ip, cloud_port),
-                        scheme)
+                        scheme,
+                        http_conf,
+                        gateway_conf,
+                        {"dimse": ('dicom_server', dicom_ip, dicom_port),
+                         "dicomweb": ('dicomweb_server', dicomweb_ip, dicomweb_port)},
+                        GatewayState())
+init_tracing(app, 'rest_interface', create_exporter(gateway_conf.get("tracing"), 'rest_interface'))
+jobs = JobManager(rest.state, gateway_conf.get("job_workers", 2), gateway_conf.get("job_retention_seconds", 7 * 24 * 3600),
+                  gateway_conf.get("job_stale_seconds", 600))
+infer_scheduler = InferenceScheduler(MongoScheduleStore(),
+                                     gateway_conf.get("auto_infer_interval_minutes", 60),
+                                     gateway_conf.get("auto_infer_jitter_seconds", 300),
+                                     gateway_conf.get("auto_infer_poll_seconds", 30),
+                                     gateway_conf.get("auto_infer_lease_seconds", 3600))
 
 app.secret_key = config['development']['jwt_secret_key']
 app.config['JWT_SECRET_KEY'] = config['development']['jwt_secret_key']
@@ -73,16 +93,10 @@ def configure_pacs():
         if access_token:
             headers = {'Authorization': 'Bearer ' + access_token}
             data = request.get_json()
-            if data["pacsType"] == "dicomweb":
-                rest.dicom_ip = dicomweb_ip
-                rest.dicom_port = dicomweb_port
-                url = scheme + dicomweb_ip + ":" + str(dicomweb_port) + "/api/configure"
-                response = requests.post(url, json = data["config"], headers = headers)
-            elif data["pacsType"] == "dimse":
-                rest.dicom_ip = dicom_ip
-                rest.dicom_port = dicom_port
-                url = scheme + dicom_ip + ":" + str(dicom_port) + "/api/configure"
-                response = requests.post(url, json = data["config"], headers = headers)
+            if data["pacsType"] in ["dicomweb", "dimse"]:
+                rest.set_pacs_type(data["pacsType"])
+                url = rest.dicom_base_url() + "/api/configure"
+                response = rest.dicom_session.post(url, json = data["config"], headers = headers)
             else:
                 return jsonify({"message": "Unknown Server Type"}), 500
             
@@ -125,6 +139,38 @@ def search_patient():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/search/cache-stats', methods=['GET'])
+@jwt_required()
+def search_cache_stats():
+    try:
+        current_user = get_jwt_identity()
+        app.logger.info(f"logged in as:{current_user}")
+        return jsonify(rest.search_cache.stats()), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/search/preview/<study_uid>/<series_uid>', methods=['GET'])
+@jwt_required()
+def search_preview(study_uid, series_uid):
+    try:
+        current_user = get_jwt_identity()
+        app.logger.info(f"logged in as:{current_user}")
+        size = request.args.get('size', 256, type=int)
+        fmt = request.args.get('format', 'jpeg').lower()
+        if size not in PREVIEW_SIZES:
+            return jsonify({'message': f'Preview size must be one of {list(PREVIEW_SIZES)}'}), 400
+        if fmt not in PREVIEW_FORMATS:
+            return jsonify({'message': f'Preview format must be one of {list(PREVIEW_FORMATS)}'}), 400
+        series_data = {"StudyInstanceUID": study_uid, "SeriesInstanceUID": series_uid}
+        preview = rest.get_preview(series_data, size, fmt)
+        if preview is None:
+            return jsonify({"Message":"Something wrong with the /api/retrieve"}), 404
+        response = Response(preview, mimetype=PREVIEW_FORMATS[fmt][1])
+        response.headers['Cache-Control'] = 'private, max-age=3600'
+        return response, 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/infer/lungs-xray', methods=['POST'])
 @jwt_required()
 def infer_lungs():
@@ -135,8 +181,9 @@ def infer_lungs():
         if data['fromSearch'] == False:
             files = request.files['file']
             if data['img_type'] in ['jpg', 'bmp', 'png', 'dcm']:
-                b64_img, dtype = rest.image_processing(files, data['img_type'])
-                data = {'patient_dicom': str(b64_img), 'dtype':dtype}
+                img_npy = rest.image_to_tensor(files, data['img_type'])
+                response = rest.infer_tensor(img_npy)
+                return jsonify(response.json()), 200
             else:
                 raise FileFormatError("Provided file format "+data['img_type']+' is not supported.')
 
@@ -149,6 +196,32 @@ def infer_lungs():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
         
+@app.route('/api/infer/lungs-xray/batch', methods=['POST'])
+@jwt_required()
+def infer_lungs_batch():
+    try:
+        current_user = get_jwt_identity()
+        app.logger.info(f"logged in as:{current_user}")
+        files = request.files.getlist('file')
+        if not files:
+            return jsonify({'message': 'No file part in the request'}), 400
+
+        if len(files) == 1 and zipfile.is_zipfile(files[0].stream):
+            zip = ZipManager(files[0], **rest.zip_limits)
+            try:
+                zip.validate_limits() # central directory only, nothing is decompressed yet
+            except (ValueError, zipfile.BadZipFile) as e:
+                return jsonify({'message': str(e)}), 400
+            images = iter_zip_members(zip.source()) # inflated on the CPU workers
+        else:
+            images = ((file.filename, file.read()) for file in files)
+
+        results = rest.infer_batch(images)
+        return jsonify({'results': results}), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/train', methods=['POST'])
 @jwt_required()
 def train_lungs():
@@ -165,6 +238,74 @@ def train_lungs():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def ingest_dataset(progress, zip, dataset_type, access_token, project='lungs-xray'):
+    """
+    Validates a zipped 'train' or 'test' data set (image quality screening,
+    duplicates of the images already uploaded to 'project', class folders)
+    and forwards it to cloud_interface. The archive itself was validated by
+    handle_dataset_upload. The images are added to the dedupe index of the
+    project once the upload succeeded.
+    Returns the storage id payload of cloud_interface; raises on any failure.
+    """
+    iv = ImageQualityValidation()
+    dedupe = rest.dedupe_index(project)
+    res = iv.quality_validation_screening_zip(zip.source(), progress, rest.cpu_pool, dedupe, rest.screening_cache)
+    dir_list = zip.list_classes()
+    if dataset_type == 'train':
+        rest.CLASSES_LIST = dir_list
+    if (res['status'] != 200):
+        raise InvalidImageDataset(res['message'], res.get('removed_files'))
+
+    if dataset_type == 'test':
+        if len(dir_list) != rest.NUM_CLASSES:
+            raise FileNotFoundError("Directory Structure is invalid.")
+        if sorted(dir_list) != sorted(rest.CLASSES_LIST):
+            raise FileNotFoundError("Directory Structure is invalid.")
+
+    response = rest.upload_dataset(f'/cloud-api/{dataset_type}-data/{project}', zip.iter_chunks(), access_token)
+    if response.status_code != 200:
+        raise DatasetUploadError(f'Error uploading file to the other endpoint: {response.text}')
+    dedupe.commit()
+    storage_key = f'{dataset_type}_storage_id'
+    return {storage_key: response.json().get(storage_key, None)}
+
+def run_ingest_job(progress, zip, dataset_type, access_token):
+    try:
+        return ingest_dataset(progress, zip, dataset_type, access_token)
+    finally:
+        os.remove(zip.filename)
+
+def handle_dataset_upload(dataset_type, current_user, access_token):
+    """
+    Shared POST handler of the train/test data endpoints. With '?async=true'
+    the upload is spooled to a temporary file and processed as a background
+    job: the response is 202 with the job id to poll on /api/jobs/<job_id>.
+    """
+    if 'file' not in request.files:
+        return jsonify({'message': 'No file part in the request'}), 400
+
+    file = request.files['file']
+    if file.filename == '':
+        return jsonify({'message': 'No selected file'}), 400
+
+    zip = ZipManager(file, **rest.zip_limits)
+    try:
+        zip.validate_members() # central directory only, nothing is decompressed yet
+    except (ValueError, zipfile.BadZipFile) as e:
+        return jsonify({'message': str(e)}), 400
+
+    if request.args.get('async', '').lower() in ('1', 'true'):
+        spool = tempfile.NamedTemporaryFile(suffix='.zip', delete=False)
+        spool.close()
+        zip.write(spool.name)
+        job_id = jobs.submit(f'{dataset_type}-data', current_user, run_ingest_job, zip, dataset_type, access_token, spool=spool.name)
+        return jsonify({'job_id': job_id, 'status_url': f'/api/jobs/{job_id}'}), 202, {'Location': f'/api/jobs/{job_id}'}
+
+    try:
+        return jsonify(ingest_dataset(None, zip, dataset_type, access_token)), 200
+    except DatasetUploadError as e:
+        return jsonify({'message': str(e)}), 500
+
 @app.route('/api/train-data/lungs-xray', methods=['POST','GET'])
 @jwt_required()
 def train_data_lungs():
@@ -179,53 +320,14 @@ def train_data_lungs():
                 return jsonify(response.json()), response.status_code
             else:
                 response = rest.download_from_pacs(data)
-                if isinstance(response, list):
-                    with io.BytesIO() as b:
-                        with ZipFile(b, 'w') as zip_file:
-                            for filename, content in response:
-                                zip_file.writestr(filename, content)
-                        zip_data = b.getvalue()
-                
-                    with open('data.zip', 'wb') as f:
-                        f.write(zip_data)
-                    return send_file('data.zip', as_attachment=True, download_name='extracted_data.zip'), 200
-                else:
+                if isinstance(response, tuple):
                     return response
+                return Response(stream_with_context(stream_zip(response)),
+                                mimetype='application/zip',
+                                headers={'Content-Disposition': 'attachment; filename=extracted_data.zip'}), 200
         
         elif (request.method == 'POST'):
-            if 'file' not in request.files:
-                return jsonify({'message': 'No file part in the request'}), 400
-    
-            file = request.files['file']
-            if file.filename == '':
-                return jsonify({'message': 'No selected file'}), 400
-    
-            temp_file_path = os.path.join(os.getcwd(), 'train_data.zip')
-            
-            zip = ZipManager(file)
-            zip.write(temp_file_path)
-            zip.extract('train_data/')
-            zip.validate_dataset()
-            
-            iv = ImageQualityValidation()
-            res = iv.quality_validation_screening_training_dataset("./train_data/")
-            rest.CLASSES_LIST = os.listdir('train_data/')
-            if (res['status'] != 200):
-                raise InvalidImageDataset(res['message'])
-    
-            upload_url = scheme + cloud_ip+':'+str(cloud_port)+'/cloud-api/train-data/lungs-xray'
-            if access_token is not None:
-                headers = {'Authorization': 'Bearer ' + access_token}
-                with open(temp_file_path, 'rb') as file:
-                    files = {'file': file}
-                    response = requests.post(upload_url, files=files,headers=headers)
-
-                    if response.status_code == 200:
-                        train_id = response.json().get('train_storage_id', None)
-                        shutil.rmtree('train_data/')
-                        return jsonify({'train_storage_id': train_id}), 200
-                    else:
-                        return jsonify({'message': f'Error uploading file to the other endpoint: {response.text}'}), 500
+            return handle_dataset_upload('train', current_user, access_token)
     
     except Exception as e:
         app.logger.error(f"Error in train_data_lungs(): {str(e)}")
@@ -254,50 +356,25 @@ def test_data_lungs():
         current_user = get_jwt_identity()
         app.logger.info(f"logged in as:{current_user}")
         access_token = request.headers.get('Authorization').replace('Bearer ', '')
-        if 'file' not in request.files:
-            return jsonify({'message': 'No file part in the request'}), 400
- 
-        file = request.files['file']
- 
-        if file.filename == '':
-            return jsonify({'message': 'No selected file'}), 400
- 
-        temp_file_path = os.path.join(os.getcwd(), 'test_data.zip')
-        
-        zip = ZipManager(file)
-        zip.write(temp_file_path)
-        zip.extract('./test_data/')
-        zip.validate_dataset()
-        
-        iv = ImageQualityValidation()
-        res = iv.quality_validation_screening_training_dataset("./test_data/")
-        if (res['status'] != 200):
-            raise InvalidImageDataset(res['message'])
-
-        dir_list = os.listdir("./test_data/")
-        if len(dir_list) != rest.NUM_CLASSES:
-            raise FileNotFoundError("Directory Structure is invalid.")
-        if sorted(dir_list) != sorted(rest.CLASSES_LIST):
-            raise FileNotFoundError("Directory Structure is invalid.")
- 
-        upload_url = scheme + cloud_ip+':'+str(cloud_port)+'/cloud-api/test-data/lungs-xray'
-        if access_token is not None:
-            headers = {'Authorization': 'Bearer ' + access_token}
-        
-            with open(temp_file_path, 'rb') as file:
-                files = {'file': file}
-                response = requests.post(upload_url, files=files,headers=headers)
-            
-                if response.status_code == 200:
-                    test_id = response.json().get('test_storage_id', None)
-                    
-                    return jsonify({'test_storage_id': test_id}), 200
-                else:
-                    return jsonify({'message': f'Error uploading file to the other endpoint: {response.text}'}), 500
+        return handle_dataset_upload('test', current_user, access_token)
  
     except Exception as e:
         return jsonify({'message': 'Internal server error'}), 500
 
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+@jwt_required()
+def job_status(job_id):
+    try:
+        current_user = get_jwt_identity()
+        app.logger.info(f"logged in as:{current_user}")
+        job = jobs.get(job_id)
+        if job is None or job.get('owner') != current_user:
+            return jsonify({'message': 'Job not found'}), 404
+        return jsonify(job), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/ai-feedback/lungs-xray', methods=['POST'])
 @jwt_required()
 def feedback_lungs():
@@ -341,20 +418,40 @@ def set_inference_context():
         data = request.get_json()
         access_token = request.headers.get('Authorization').replace('Bearer ', '')
         if access_token:
-            sched = BackgroundScheduler()
-            sched.add_job(auto_inferencing,'interval', minutes = 60, args=[data, current_user])
-            sched.start()
-            return jsonify({"message":"Scheduler configured successfully"}), 200
+            job_id = infer_scheduler.schedule(current_user, data)
+            return jsonify({"message":"Scheduler configured successfully", "job_id": job_id}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/infer-context', methods = ["GET"])
+@jwt_required()
+def list_inference_contexts():
+    try:
+        current_user = get_jwt_identity()
+        app.logger.info(f"logged in as:{current_user}")
+        return jsonify({"jobs": infer_scheduler.list_jobs(current_user)}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/infer-context/<job_id>', methods = ["DELETE"])
+@jwt_required()
+def cancel_inference_context(job_id):
+    try:
+        current_user = get_jwt_identity()
+        app.logger.info(f"logged in as:{current_user}")
+        if not infer_scheduler.cancel(job_id, current_user):
+            return jsonify({'message': 'Job not found'}), 404
+        return jsonify({"message": "Scheduler job cancelled", "job_id": job_id}), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 def auto_inferencing(tag_data, user):
-    with app.app_context():
+    with app.app_context(), TRACER.span("auto_inferencing", attributes={"user": user}):
         try:
             refresh_token = create_refresh_token(user)
-            find_new_url = scheme + rest.dicom_ip+':'+str(rest.dicom_port)+'/api/infer-new-data'
+            find_new_url = rest.dicom_base_url()+'/api/infer-new-data'
             headers = {'Authorization': 'Bearer ' + refresh_token}
-            response = requests.get(url = find_new_url, json={"tags":tag_data}, headers=headers)
+            response = rest.dicom_session.get(url = find_new_url, json={"tags":tag_data}, headers=headers)
             if response.status_code == 200:
                 success = response.json()["success"]
                 failed = response.json()["failed"]
@@ -368,5 +465,8 @@ def auto_inferencing(tag_data, user):
         except Exception as e:
             app.logger.info(e)
 
+jobs.start()
+infer_scheduler.start(auto_inferencing)
+
 if __name__ == '__main__':
     app.run(host="0.0.0.0", port=6000, debug=True)
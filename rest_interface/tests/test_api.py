@@ -0,0 +1,262 @@
+import unittest
+import time
+from unittest.mock import Mock, MagicMock, patch
+import numpy as np
+from flask import Flask
+from rest.api import iDiagnoseRestAPI
+from collection.gateway_state import GatewayState, InMemoryState
+from utils.disk_cache import DiskCache
+import tempfile
+
+
+class TestiDiagnoseRestAPI(unittest.TestCase):
+
+    def setUp(self):
+        self.rest = iDiagnoseRestAPI(("localhost", 5000), ("localhost", 5010), ("localhost", 7000),
+                                     ("localhost", 8050), "http://", gateway_conf={"search_sr_concurrency": 4})
+
+    def test_get_patient_inferences_keeps_order(self):
+        def fake_get(url, json, headers):
+            series_uid = json["SeriesInstanceUID"]
+            time.sleep(0.01 * (5 - int(series_uid)))  # later series answer first
+            resp = Mock()
+            resp.status_code = 404 if series_uid == "2" else 200
+            resp.json.return_value = {"inference": "inf" + series_uid, "image_path": "img" + series_uid}
+            return resp
+
+        series_requests = [{"PatientID": "P1", "SeriesInstanceUID": str(i)} for i in range(5)]
+        with patch.object(self.rest.cloud_session, 'get', side_effect=fake_get) as mock_get:
+            reports = self.rest.get_patient_inferences("http://cloud", series_requests, {})
+        self.assertEqual(mock_get.call_count, 5)
+        self.assertEqual([r["inference"] if r else None for r in reports], ["inf0", "inf1", None, "inf3", "inf4"])
+
+    def test_get_patient_inferences_empty(self):
+        self.assertEqual(self.rest.get_patient_inferences("http://cloud", [], {}), [])
+
+    def test_iter_retrieved_series(self):
+        self.rest.pacs_retrieve_concurrency = 2
+        def fake_get(url, json, headers, stream):
+            resp = Mock()
+            resp.__enter__ = Mock(return_value=resp)
+            resp.__exit__ = Mock(return_value=False)
+            resp.status_code = 404 if json["SeriesInstanceUID"] == "S2" else 200
+            resp.iter_content.return_value = [json["SeriesInstanceUID"].encode(), b"-data"]
+            return resp
+
+        queries = [{"PatientID": "P1", "StudyInstanceUID": "ST1", "SeriesInstanceUID": "S" + str(i)} for i in range(5)]
+        with patch.object(self.rest.dicom_session, 'get', side_effect=fake_get) as mock_get:
+            files = {name: fileobj.read() for name, fileobj in self.rest.iter_retrieved_series("http://dicom", queries, {})}
+        self.assertEqual(mock_get.call_count, 5)
+        self.assertNotIn("P1_ST1_S2", files)
+        self.assertEqual(len(files), 4)
+        self.assertEqual(files["P1_ST1_S3"], b"S3-data")
+
+    def test_infer_tensor_binary(self):
+        img_npy = np.arange(224 * 224, dtype=np.uint16).reshape((224, 224))
+        with Flask(__name__).test_request_context(headers={'Authorization': 'Bearer token'}):
+            with patch.object(self.rest.infer_session, 'post') as mock_post:
+                self.rest.infer_tensor(img_npy)
+        kwargs = mock_post.call_args.kwargs
+        self.assertEqual(kwargs['headers']['Content-Type'], 'application/octet-stream')
+        self.assertEqual(kwargs['headers']['X-Tensor-Dtype'], 'uint16')
+        self.assertEqual(kwargs['headers']['X-Tensor-Shape'], '224,224')
+        self.assertEqual(kwargs['headers']['Authorization'], 'Bearer token')
+        np.testing.assert_array_equal(np.frombuffer(kwargs['data'], dtype=np.uint16).reshape((224, 224)), img_npy)
+
+    def test_infer_tensor_json_fallback(self):
+        self.rest.tensor_transport = 'json'
+        img_npy = np.zeros((224, 224), dtype=np.uint8)
+        with Flask(__name__).test_request_context(headers={'Authorization': 'Bearer token'}):
+            with patch.object(self.rest.infer_session, 'post') as mock_post:
+                self.rest.infer_tensor(img_npy)
+        kwargs = mock_post.call_args.kwargs
+        self.assertEqual(kwargs['json']['dtype'], 'uint8')
+        self.assertTrue(kwargs['json']['patient_dicom'].startswith("b'"))
+
+    def test_infer_batch(self):
+        self.rest.infer_batch_size = 3
+        def fake_preprocess(img_data, imtype):
+            if img_data == b"bad":
+                raise ValueError("Image Data is blank.")
+            dtype = np.uint16 if imtype == "dcm" else np.uint8
+            return np.full((224, 224), int(img_data), dtype=dtype)
+
+        def fake_infer(batch_npy):
+            resp = Mock()
+            resp.status_code = 200
+            resp.json.return_value = {"ai_results": ["class" + str(img[0, 0]) for img in batch_npy]}
+            return resp
+
+        images = [("1.dcm", b"1"), ("2.jpg", b"2"), ("3.gif", b"3"), ("4.dcm", b"bad"), ("5.png", b"5")]
+        with patch.object(self.rest, 'image_to_tensor', side_effect=fake_preprocess):
+            with patch.object(self.rest, 'infer_tensor_batch', side_effect=fake_infer) as mock_infer:
+                results = self.rest.infer_batch(iter(images))
+        self.assertEqual(mock_infer.call_count, 3)  # two dtypes in the first chunk, one in the second
+        self.assertEqual([r["filename"] for r in results], ["1.dcm", "2.jpg", "3.gif", "4.dcm", "5.png"])
+        self.assertEqual(results[0]["ai_result"], "class1")
+        self.assertEqual(results[1]["ai_result"], "class2")
+        self.assertIn("not supported", results[2]["error"])
+        self.assertEqual(results[3]["error"], "Image Data is blank.")
+        self.assertEqual(results[4]["ai_result"], "class5")
+
+    def test_infer_batch_inference_failure(self):
+        resp = Mock()
+        resp.status_code = 404
+        resp.json.return_value = {"message": "ERROR WITH INFERENCE"}
+        with patch.object(self.rest, 'image_to_tensor', return_value=np.zeros((224, 224), dtype=np.uint8)):
+            with patch.object(self.rest, 'infer_tensor_batch', return_value=resp):
+                results = self.rest.infer_batch([("1.jpg", b"1"), ("2.jpg", b"2")])
+        self.assertTrue(all("ERROR WITH INFERENCE" in r["error"] for r in results))
+
+    def test_image_to_tensor(self):
+        img_npy = self.rest.image_to_tensor(open("tests/datas/IMG001.dcm", "rb").read(), "dcm")
+        self.assertEqual(img_npy.shape, (224, 224))
+        self.assertEqual(img_npy.dtype, np.uint8)
+
+        img_npy = self.rest.image_to_tensor("tests/datas/IMG001.jpg", "jpg")
+        self.assertEqual(img_npy.shape, (224, 224))
+
+        with self.assertRaises(ValueError):
+            self.rest.image_to_tensor("tests/datas/IMG003.jpg", "jpg")
+
+    def test_pacs_type_shared_between_workers(self):
+        state = InMemoryState()
+        pacs_servers = {"dimse": ('dicom_server', "dimse-host", 5000), "dicomweb": ('dicomweb_server', "web-host", 5001)}
+        worker_a = iDiagnoseRestAPI((None, None), ("localhost", 5010), ("localhost", 7000), ("localhost", 8050),
+                                    "http://", pacs_servers=pacs_servers, state=state)
+        worker_b = iDiagnoseRestAPI((None, None), ("localhost", 5010), ("localhost", 7000), ("localhost", 8050),
+                                    "http://", pacs_servers=pacs_servers, state=state)
+        worker_a.set_pacs_type("dicomweb")
+        self.assertEqual(worker_b.dicom_base_url(), "http://web-host:5001")
+        self.assertEqual(worker_b.dicom_server, "dicomweb_server")
+        with self.assertRaises(ValueError):
+            worker_b.set_pacs_type("unknown")
+
+        worker_a.CLASSES_LIST = ["class A", "class B"]
+        self.assertEqual(worker_b.CLASSES_LIST, ["class A", "class B"])
+        self.assertEqual(worker_b.NUM_CLASSES, 2)
+
+    def test_default_pacs(self):
+        self.assertEqual(self.rest.dicom_base_url(), "http://localhost:5000")
+        self.assertEqual(self.rest.CLASSES_LIST, [])
+
+    def test_gateway_state_store(self):
+        collection = Mock()
+        collection.find_one.return_value = {'_id': 'pacs_type', 'value': 'dimse'}
+        state = GatewayState(collection, cache_ttl=60)
+        self.assertEqual(state.get('pacs_type'), 'dimse')
+        self.assertEqual(state.get('pacs_type'), 'dimse')
+        self.assertEqual(collection.find_one.call_count, 1)  # second read served from cache
+
+        state.set('pacs_type', 'dicomweb')
+        collection.update_one.assert_called_with({'_id': 'pacs_type'}, {'$set': {'value': 'dicomweb'}}, upsert=True)
+        self.assertEqual(state.get('pacs_type'), 'dicomweb')
+
+        collection.find_one.return_value = None
+        self.assertEqual(state.get('classes_list', []), [])
+
+    def test_gateway_state_batched_and_bounded(self):
+        collection = MagicMock()
+        collection.find.return_value = [{'_id': 'a', 'value': 1}]
+        state = GatewayState(collection, cache_ttl=60, cache_size=2)
+        self.assertEqual(state.get_many(['a', 'b']), {'a': 1})
+        collection.find.assert_called_once_with({'_id': {'$in': ['a', 'b']}})
+        self.assertEqual(state.get_many(['a', 'b']), {'a': 1})  # misses are cached too
+        self.assertEqual(collection.find.call_count, 1)
+        state.set('c', 3)
+        self.assertEqual(list(state._cache), ['b', 'c'])
+
+        cache = state.namespace('screening_cache', cache_ttl=0)
+        cache.set('key', 'value', ttl=60)
+        cache_collection = collection.database['screening_cache']
+        cache_collection.create_index.assert_called_once_with('expires_at', expireAfterSeconds=0)
+        self.assertIn('expires_at', cache_collection.update_one.call_args[0][1]['$set'])
+        self.assertEqual(cache._cache, {})
+        self.assertIs(state.namespace('screening_cache'), cache)
+
+        state.set_many({'dedupe:p:phash0:0123:0123456789abcdef': True})
+        collection.bulk_write.assert_called_once()
+        collection.find.return_value = [{'_id': 'dedupe:p:phash0:0123:0123456789abcdef'}]
+        self.assertEqual(state.find_keys(['dedupe:p:phash0:0123:']), ['dedupe:p:phash0:0123:0123456789abcdef'])
+
+    def test_in_memory_state_ttl(self):
+        state = InMemoryState()
+        state.set('a', 1)
+        state.set('b', 2, ttl=0)
+        self.assertEqual(state.get_many(['a', 'b', 'c']), {'a': 1})
+        self.assertIs(state.namespace('dedupe'), state.namespace('dedupe'))
+
+    def test_search_get_cached_and_invalidated(self):
+        pacs_resp = Mock(status_code=200, content=b"[...]")
+        pacs_resp.json.return_value = [{"PatientID": "P1", "studies": []}]
+        report_resp = Mock(status_code=200, content=b"{...}")
+        report_resp.json.return_value = {"record_available": False}
+        app = Flask(__name__)
+        with patch.object(self.rest, 'search_get_request', return_value=(pacs_resp, report_resp)) as mock_search:
+            for pid in ["P1", " P1 "]:
+                with app.test_request_context(json={"pid": pid}) as ctx:
+                    body, status = self.rest.search_get(ctx.request)
+                    self.assertEqual(status, 200)
+                    self.assertEqual(body.get_json()["PACS_RESPONSE"], pacs_resp.json.return_value)
+            self.assertEqual(mock_search.call_count, 1)
+
+            with app.test_request_context(json=[{"records": [{"PID": "P1", "SeriesUID": "S1"}], "hcpInput": "x"}],
+                                          headers={'Authorization': 'Bearer token'}):
+                with patch.object(self.rest.cloud_session, 'post'):
+                    self.rest.feedback_request([{"records": [{"PID": "P1", "SeriesUID": "S1"}], "hcpInput": "x"}])
+            with app.test_request_context(json={"pid": "P1"}) as ctx:
+                self.rest.search_get(ctx.request)
+            self.assertEqual(mock_search.call_count, 2)
+        self.assertEqual(self.rest.search_cache.stats()["hits"], 1)
+
+    def test_search_cache_keyed_by_pacs(self):
+        pacs_resp = Mock(status_code=200, content=b"[...]")
+        pacs_resp.json.return_value = [{"PatientID": "P1", "studies": []}]
+        report_resp = Mock(status_code=200, content=b"{...}")
+        report_resp.json.return_value = {"record_available": False}
+        pacs_servers = {"dimse": ('dicom_server', "dimse-host", 5000), "dicomweb": ('dicomweb_server', "web-host", 5001)}
+        state = InMemoryState()
+        worker_a = iDiagnoseRestAPI((None, None), ("localhost", 5010), ("localhost", 7000), ("localhost", 8050),
+                                    "http://", pacs_servers=pacs_servers, state=state)
+        worker_b = iDiagnoseRestAPI((None, None), ("localhost", 5010), ("localhost", 7000), ("localhost", 8050),
+                                    "http://", pacs_servers=pacs_servers, state=state)
+        worker_a.set_pacs_type("dimse")
+        app = Flask(__name__)
+        with patch.object(iDiagnoseRestAPI, 'search_get_request', return_value=(pacs_resp, report_resp)) as mock_search:
+            for worker in (worker_a, worker_b):
+                with app.test_request_context(json={"pid": "P1"}) as ctx:
+                    worker.search_get(ctx.request)
+            worker_a.set_pacs_type("dicomweb")
+            for worker in (worker_a, worker_b):
+                with app.test_request_context(json={"pid": "P1"}) as ctx:
+                    worker.search_get(ctx.request)
+        self.assertEqual(mock_search.call_count, 4)  # no worker serves the previous PACS's result
+
+
+    def test_render_pdf_cached(self):
+        with open("tests/datas/I10", "rb") as f:
+            dicom_bytes = f.read()
+        with patch.object(self.rest.cpu_pool, 'run', return_value=b'%PDF-1.4') as mock_run:
+            self.assertEqual(self.rest.render_pdf(dicom_bytes), b'%PDF-1.4')
+            self.assertEqual(self.rest.render_pdf(dicom_bytes), b'%PDF-1.4')
+        self.assertEqual(mock_run.call_count, 1)
+        self.assertEqual(self.rest.pdf_cache.stats()["hits"], 1)
+
+    def test_get_preview_cached(self):
+        with open("tests/datas/I10", "rb") as f:
+            dicom_bytes = f.read()
+        retrieved = Mock(status_code=200, content=dicom_bytes)
+        series_data = {"StudyInstanceUID": "1", "SeriesInstanceUID": "2"}
+        with tempfile.TemporaryDirectory() as tmp:
+            self.rest.preview_cache = DiskCache(tmp)
+            app = Flask(__name__)
+            with app.test_request_context(headers={"Authorization": "Bearer token"}), \
+                 patch.object(self.rest.dicom_session, 'get', return_value=retrieved) as mock_get:
+                first = self.rest.get_preview(series_data, 256, "jpeg")
+                second = self.rest.get_preview(series_data, 128, "jpeg")
+            self.assertEqual(mock_get.call_count, 1)
+            self.assertTrue(first.startswith(b"\xff\xd8"))
+            self.assertLess(len(second), len(first))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import unittest
+import numpy as np
+import io
+from utils.image_utils.decoded_image import DecodedImage
+from utils.image_utils.image_validator import ImageQualityValidation
+from utils.image_utils.preprocessing import ImageProcessing
+from utils.exceptions import FileFormatError, DicomNumpyConversionError, ImageNumpyConversionError
+
+
+class TestDecodedImage(unittest.TestCase):
+
+    def test_from_dicom_path(self):
+        decoded = DecodedImage.from_data("tests/datas/ct.dcm", "dcm")
+        self.assertEqual(decoded.source_format, "dcm")
+        self.assertEqual(decoded.shape, (decoded.header.Rows, decoded.header.Columns))
+        self.assertEqual(decoded.dtype, decoded.pixel_array.dtype)
+
+    def test_from_dicom_bytes_and_fileobj(self):
+        data = open("tests/datas/IMG001.dcm", "rb").read()
+        from_bytes = DecodedImage.from_data(data, "dcm")
+        from_fileobj = DecodedImage.from_data(io.BytesIO(data), "dcm")
+        self.assertTrue(np.array_equal(from_bytes.pixel_array, from_fileobj.pixel_array))
+
+    def test_from_raster(self):
+        decoded = DecodedImage.from_data("tests/datas/IMG001.jpg", "jpg")
+        self.assertIsNone(decoded.header)
+        self.assertEqual(decoded.source_format, "jpg")
+        self.assertEqual(decoded.shape[2], 3)
+
+    def test_invalid_data(self):
+        with self.assertRaises(FileFormatError):
+            DecodedImage.from_data(b"data", "gif")
+        with self.assertRaises(ImageNumpyConversionError):
+            DecodedImage.from_data(b"not an image", "png")
+        with self.assertRaises(DicomNumpyConversionError):
+            DecodedImage.from_data(b"not a dicom", "dcm")
+
+    def test_shared_by_validator_and_preprocessor(self):
+        decoded = DecodedImage.from_data("tests/datas/IMG001.jpg", "jpg")
+        iv = ImageQualityValidation()
+        self.assertTrue(iv.check_image_resolution_decoded(decoded))
+        self.assertTrue(iv.blank_image_screening_decoded(decoded))
+        img_array = ImageProcessing().decoded_to_array(decoded)
+        self.assertEqual(img_array.shape, decoded.shape[:2])
+
+        low_res = DecodedImage.from_data("tests/datas/IMG003.jpg", "jpg")
+        self.assertFalse(iv.check_image_resolution_decoded(low_res))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import unittest
+import cv2
+import numpy as np
+from collection.gateway_state import InMemoryState
+from utils.image_utils.dedupe import DedupeIndex, image_hashes, perceptual_hash, pixel_hash, hamming_distance
+
+
+def gradient(size=64):
+    x = np.linspace(0, 255, size)
+    return (np.add.outer(x, x) / 2 + 20 * np.sin(np.arange(size) / 3)[:, None]).astype(np.uint8)
+
+
+class TestDedupe(unittest.TestCase):
+
+    def test_hashes(self):
+        img = gradient()
+        hashes = image_hashes(b"file", img, "1.2.3")
+        self.assertEqual(hashes["sop"], "1.2.3")
+        self.assertEqual(len(hashes["phash"]), 16)
+        self.assertEqual(hashes["pixel"], pixel_hash(img.copy()))
+        self.assertNotEqual(hashes["pixel"], pixel_hash(img.astype(np.uint16)))
+
+    def test_perceptual_hash_survives_bit_depth_and_resize(self):
+        img = gradient(128)
+        resized = cv2.resize(img, (96, 96), interpolation=cv2.INTER_AREA)
+        self.assertEqual(hamming_distance(perceptual_hash(img), perceptual_hash(img.astype(np.uint16) * 256)), 0)
+        self.assertLessEqual(hamming_distance(perceptual_hash(img), perceptual_hash(resized)), 3)
+        self.assertGreater(hamming_distance(perceptual_hash(img), perceptual_hash(img.T[::-1])), 3)
+
+    def test_exact_duplicates(self):
+        index = DedupeIndex()
+        img = gradient()
+        self.assertIsNone(index.check_and_add(image_hashes(b"a", img)))
+        self.assertEqual(index.check_and_add(image_hashes(b"a", img)), "content")
+        self.assertEqual(index.check_and_add(image_hashes(b"b", img)), "pixel")
+        self.assertEqual(index.check_and_add(image_hashes(b"c", img + 1, "1.2")), None)
+        self.assertEqual(index.check_and_add(image_hashes(b"d", img + 2, "1.2")), "sop")
+
+    def test_near_duplicates(self):
+        img = gradient()
+        near = image_hashes(b"b", np.clip(img.astype(int) + 3, 0, 255).astype(np.uint8))
+        index = DedupeIndex()
+        index.add(image_hashes(b"a", img))
+        self.assertIsNone(index.find(near))
+        index = DedupeIndex(phash_distance=3)
+        index.add(image_hashes(b"a", img))
+        self.assertEqual(index.find(near), "phash")
+
+    def test_persisted_on_commit(self):
+        state = InMemoryState()
+        index = DedupeIndex(state, "lungs-xray", 3)
+        hashes = image_hashes(b"a", gradient())
+        index.add(hashes)
+        self.assertEqual(DedupeIndex(state, "lungs-xray", 3).find(hashes), None)
+        index.commit()
+        self.assertEqual(DedupeIndex(state, "lungs-xray", 3).find(hashes), "content")
+        self.assertIsNone(DedupeIndex(state, "other", 3).find(hashes))
+
+    def test_concurrent_commits_keep_both_hashes(self):
+        state = InMemoryState()
+        first, second = {"phash": "0123456789abcdef"}, {"phash": "0123456789abcdee"}  # same bands 0-2
+        upload_a, upload_b = DedupeIndex(state, "lungs-xray", 0), DedupeIndex(state, "lungs-xray", 0)
+        upload_a.add(first)
+        upload_b.add(second)
+        upload_b.commit()
+        upload_a.commit()
+        index = DedupeIndex(state, "lungs-xray", 0)
+        self.assertEqual(index.find(first), "phash")
+        self.assertEqual(index.find(second), "phash")
+        self.assertIsNone(index.find({"phash": "0123456789abcded"}))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+import unittest
+import os
+import tempfile
+import time
+from utils.disk_cache import DiskCache
+
+
+class TestDiskCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.directory = os.path.join(self.tmp.name, "previews")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_put_get(self):
+        cache = DiskCache(self.directory, max_bytes=100)
+        self.assertIsNone(cache.get("1.2.3/256.jpeg"))
+        self.assertFalse(os.path.exists(self.directory))
+        cache.put("1.2.3/256.jpeg", b"thumbnail")
+        self.assertEqual(cache.get("1.2.3/256.jpeg"), b"thumbnail")
+        cache.put("1.2.3/256.jpeg", b"thumb")
+        self.assertEqual(cache.stats()["size_bytes"], 5)
+
+        # A second worker sees the same entries.
+        self.assertEqual(DiskCache(self.directory, max_bytes=100).get("1.2.3/256.jpeg"), b"thumb")
+
+    def test_lru_eviction(self):
+        cache = DiskCache(self.directory, max_bytes=100)
+        cache.put("a", b"x" * 40)
+        time.sleep(0.01)
+        cache.put("b", b"x" * 40)
+        time.sleep(0.01)
+        cache.get("a")  # 'b' is now the least recently used entry
+        time.sleep(0.01)
+        cache.put("c", b"x" * 40)
+        self.assertIsNone(cache.get("b"))
+        self.assertIsNotNone(cache.get("a"))
+        self.assertIsNotNone(cache.get("c"))
+        self.assertLessEqual(cache.stats()["size_bytes"], 100)
+
+    def test_entry_larger_than_cache(self):
+        cache = DiskCache(self.directory, max_bytes=10)
+        cache.put("a", b"x" * 20)
+        self.assertIsNone(cache.get("a"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import unittest
+from utils.http_client import ServiceSession, SessionRegistry
+from utils.config import Config
+from unittest.mock import patch
+from idiagnose_common.tracing import TRACER, REQUEST_ID_HEADER, PARENT_SPAN_HEADER
+
+
+class TestServiceSession(unittest.TestCase):
+
+    def test_default_conf(self):
+        session = ServiceSession()
+        self.assertEqual(session.timeout, (5, 120))
+        adapter = session.get_adapter("http://localhost:5000")
+        self.assertEqual(adapter._pool_maxsize, 16)
+        self.assertEqual(adapter.max_retries.total, 3)
+
+    def test_conf_override(self):
+        session = ServiceSession({"pool_maxsize": 4, "read_timeout": 300, "retries": 0})
+        self.assertEqual(session.timeout, (5, 300))
+        adapter = session.get_adapter("https://localhost:5000")
+        self.assertEqual(adapter._pool_maxsize, 4)
+        self.assertEqual(adapter.max_retries.total, 0)
+
+    def test_post_not_retried_on_read(self):
+        session = ServiceSession()
+        retry = session.get_adapter("http://localhost:5000").max_retries
+        self.assertNotIn("POST", retry.allowed_methods)
+        self.assertIn("GET", retry.allowed_methods)
+
+    def test_not_retried_on_read_timeout(self):
+        retry = ServiceSession({"retries": 3}).get_adapter("http://localhost:5000").max_retries
+        self.assertEqual(retry.read, 0)
+        self.assertEqual(retry.connect, 3)
+
+    @patch('requests.Session.request')
+    def test_default_timeout_applied(self, mock_request):
+        session = ServiceSession({"connect_timeout": 1, "read_timeout": 2})
+        session.get("http://localhost:5000/api/query")
+        self.assertEqual(mock_request.call_args.kwargs["timeout"], (1, 2))
+
+        session.get("http://localhost:5000/api/query", timeout=10)
+        self.assertEqual(mock_request.call_args.kwargs["timeout"], 10)
+
+    @patch('requests.Session.request')
+    def test_correlation_headers(self, mock_request):
+        session = ServiceSession(name="dicom_server")
+        with TRACER.span("search") as parent:
+            session.get("http://localhost:5000/api/query", headers={"Authorization": "Bearer token"})
+        headers = mock_request.call_args.kwargs["headers"]
+        self.assertEqual(headers["Authorization"], "Bearer token")
+        self.assertEqual(headers[REQUEST_ID_HEADER], parent.trace_id)
+        self.assertNotEqual(headers[PARENT_SPAN_HEADER], parent.span_id)
+
+
+class TestSessionRegistry(unittest.TestCase):
+
+    def test_session_reused(self):
+        registry = SessionRegistry({"dicom_server": {"read_timeout": 300}})
+        dicom = registry.session("dicom_server")
+        self.assertIs(dicom, registry.session("dicom_server"))
+        self.assertIsNot(dicom, registry.session("cloud_server"))
+        self.assertEqual(dicom.timeout, (5, 300))
+        registry.close()
+
+    def test_http_client_conf(self):
+        http_conf = Config("./config/microservice_conf.json").get_http_client_conf()
+        self.assertEqual(http_conf["dicom_server"]["read_timeout"], 300)
+        self.assertEqual(http_conf["cloud_server"]["pool_maxsize"], 16)
+        self.assertNotIn("http_client", http_conf)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import unittest
+from collection.schedule_store import InMemoryScheduleStore
+from utils.infer_scheduler import InferenceScheduler
+
+class TestInferenceScheduler(unittest.TestCase):
+    def setUp(self):
+        self.store = InMemoryScheduleStore()
+        self.scheduler = InferenceScheduler(self.store, interval_minutes=60, jitter=0)
+
+    def tearDown(self):
+        self.scheduler.shutdown()
+
+    def test_same_context_replaces_job(self):
+        tags = {"Modality": "CR", "BodyPartExamined": "CHEST"}
+        first = self.scheduler.schedule("user", tags)
+        second = self.scheduler.schedule("user", {"BodyPartExamined": "CHEST", "Modality": "CR"})
+        self.assertEqual(first, second)
+        self.assertEqual(len(self.scheduler.list_jobs()), 1)
+
+        self.scheduler.schedule("user", {"Modality": "DX"})
+        self.scheduler.schedule("other", tags)
+        self.assertEqual(len(self.scheduler.list_jobs()), 3)
+        self.assertEqual(len(self.scheduler.list_jobs("user")), 2)
+
+    def test_jobs_shared_between_workers(self):
+        other_worker = InferenceScheduler(self.store, interval_minutes=60, jitter=0)
+        job_id = self.scheduler.schedule("user", {"Modality": "CR"})
+        self.assertEqual([job["job_id"] for job in other_worker.list_jobs("user")], [job_id])
+        self.assertTrue(other_worker.cancel(job_id, "user"))
+        self.assertEqual(self.scheduler.list_jobs(), [])
+
+    def test_due_job_claimed_once(self):
+        runs = []
+        workers = [InferenceScheduler(self.store, interval_minutes=0, jitter=0, lease_seconds=600) for _ in range(2)]
+        for worker in workers:
+            worker.fn = lambda tags, user: runs.append((tags, user))
+        workers[0].schedule("user", {"Modality": "CR"})
+
+        claimed = workers[0].claim_due()
+        self.assertEqual(len(claimed), 1)
+        self.assertEqual(workers[1].claim_due(), [])
+
+        workers[0].run(claimed[0])
+        self.assertEqual(runs, [({"Modality": "CR"}, "user")])
+        self.assertEqual(len(workers[1].claim_due()), 1)
+
+    def test_cancel(self):
+        job_id = self.scheduler.schedule("user", {"Modality": "CR"})
+        self.assertFalse(self.scheduler.cancel(job_id, "other"))
+        self.assertTrue(self.scheduler.cancel(job_id, "user"))
+        self.assertFalse(self.scheduler.cancel(job_id, "user"))
+        self.assertEqual(self.scheduler.list_jobs(), [])
+
+if __name__ == '__main__':
+    unittest.main()
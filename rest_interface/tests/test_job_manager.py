@@ -0,0 +1,72 @@
+import os
+import tempfile
+import time
+import unittest
+from collection.gateway_state import InMemoryState
+from utils.exceptions import InvalidImageDataset
+from utils.job_manager import JobManager
+
+class TestJobManager(unittest.TestCase):
+    def setUp(self):
+        self.jobs = JobManager(InMemoryState(), workers=1)
+
+    def tearDown(self):
+        self.jobs.shutdown()
+
+    def wait(self, job_id):
+        self.jobs.executor.submit(lambda: None).result()
+        return self.jobs.get(job_id)
+
+    def test_successful_job(self):
+        def work(progress, total):
+            for done in range(1, total + 1):
+                progress(done, total)
+            return {"train_storage_id": "abc"}
+
+        job_id = self.jobs.submit('train-data', 'user', work, 3)
+        job = self.wait(job_id)
+        self.assertEqual(job["status"], "succeeded")
+        self.assertEqual(job["owner"], "user")
+        self.assertEqual(job["progress"], {"done": 3, "total": 3})
+        self.assertEqual(job["result"], {"train_storage_id": "abc"})
+        self.assertEqual(job["removed_files"], [])
+
+    def test_failed_job(self):
+        def work(progress):
+            raise InvalidImageDataset("Half of the images failed", ["class A/1.dcm"])
+
+        job_id = self.jobs.submit('test-data', 'user', work)
+        job = self.wait(job_id)
+        self.assertEqual(job["status"], "failed")
+        self.assertEqual(job["error"], "Half of the images failed")
+        self.assertEqual(job["removed_files"], ["class A/1.dcm"])
+
+    def test_finished_job_expires(self):
+        jobs = JobManager(InMemoryState(), workers=1, retention=0)
+        job_id = jobs.submit('test-data', 'user', lambda progress: None)
+        jobs.executor.submit(lambda: None).result()
+        jobs.shutdown()
+        self.assertIsNone(jobs.get(job_id))
+
+    def test_stale_job_failed(self):
+        spool = tempfile.NamedTemporaryFile(suffix='.zip', delete=False)
+        spool.close()
+        old = time.time() - 3600
+        for job_id in ("polled", "swept"):  # left running by a worker that stopped
+            self.jobs.state.set(f"job:{job_id}", {"job_id": job_id, "status": "running", "spool": spool.name,
+                                                  "created": old, "updated": old})
+        job = self.jobs.get("polled")
+        self.assertEqual(job["status"], "failed")
+        self.assertFalse(os.path.exists(spool.name))
+        self.assertEqual(self.jobs.fail_stale(), ["swept"])
+        self.assertEqual(self.jobs.fail_stale(), [])
+
+        job_id = self.jobs.submit('test-data', 'user', lambda progress: None)
+        self.wait(job_id)
+        self.assertEqual(self.jobs.fail_stale(), [])
+
+    def test_unknown_job(self):
+        self.assertIsNone(self.jobs.get('missing'))
+
+if __name__ == '__main__':
+    unittest.main()
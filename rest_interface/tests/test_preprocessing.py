@@ -70,6 +70,28 @@ class TestImageProcessing(unittest.TestCase):
         self.assertEqual(resized_img.shape[0], shape[0])
         self.assertEqual(resized_img.shape[1], shape[1])
 
+    def test_batch_to_array(self):
+        img = (np.random.rand(600, 500) * 4000).astype(np.uint16)
+        out = np.empty((3, 224, 224), dtype=np.uint16)
+        batch, errors = self.image_processing.batch_to_array([img, ("tests/datas/IMG001.dcm", "dcm"), (b"xx", "png")], out=out)
+        self.assertIs(batch, out)
+        self.assertEqual(errors[:2], [None, None])
+        self.assertIsNotNone(errors[2])
+        self.assertTrue(np.array_equal(batch[0], self.image_processing.resize_array(img, (224, 224))))
+        self.assertFalse(batch[2].any())
+
+    def test_batch_to_array_normalize_and_dtype(self):
+        img = (np.random.rand(300, 300) * 4000).astype(np.uint16)
+        batch, errors = self.image_processing.batch_to_array([("tests/datas/IMG001.jpg", "jpg"), img], normalize=True)
+        self.assertEqual(batch.dtype, np.float32)
+        self.assertTrue(batch.flags['C_CONTIGUOUS'])
+        self.assertEqual(errors, [None, None])
+        self.assertAlmostEqual(float(batch[1].max()), 1.0)
+
+        batch, errors = self.image_processing.batch_to_array([("tests/datas/IMG001.jpg", "jpg"), img])
+        self.assertEqual(batch.dtype, np.uint8)
+        self.assertIn("cannot be stored", errors[1])
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,39 @@
+import unittest
+import io
+from PIL import Image
+from utils.image_utils.preview import render_previews, PREVIEW_SIZES
+
+
+class TestPreview(unittest.TestCase):
+
+    def setUp(self):
+        with open("tests/datas/I10", "rb") as f:
+            self.dicom_bytes = f.read()
+
+    def test_render_previews(self):
+        previews = render_previews(self.dicom_bytes, PREVIEW_SIZES, "jpeg")
+        self.assertEqual(sorted(previews), sorted(PREVIEW_SIZES))
+        for size, data in previews.items():
+            image = Image.open(io.BytesIO(data))
+            self.assertEqual(image.format, "JPEG")
+            self.assertLessEqual(max(image.size), size)
+        self.assertLess(len(previews[128]), len(previews[512]))
+
+    def test_render_png(self):
+        previews = render_previews(self.dicom_bytes, (128,), "png")
+        self.assertEqual(Image.open(io.BytesIO(previews[128])).format, "PNG")
+
+    def test_render_multi_frame(self):
+        with open("tests/datas/blank3.dcm", "rb") as f:
+            previews = render_previews(f.read(), (128,), "png")  # 4 grayscale frames
+        image = Image.open(io.BytesIO(previews[128]))
+        self.assertEqual(image.mode, "L")
+        self.assertEqual(image.size, (128, 128))
+
+    def test_invalid_format(self):
+        with self.assertRaises(ValueError):
+            render_previews(self.dicom_bytes, (128,), "gif")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,8 +1,17 @@
+import tracemalloc
 import unittest
 from unittest.mock import patch
-from utils.image_utils.image_validator import ImageQualityValidation, FileFormatError
+from utils.image_utils.image_validator import ImageQualityValidation, FileFormatError, ScreeningCache, read_image_size, screen_image, is_blank
 import numpy as np
 import pydicom
+import io
+import zipfile
+import os
+import shutil
+import tempfile
+from utils.worker_pool import CpuWorkerPool
+from utils.image_utils.dedupe import DedupeIndex
+from collection.gateway_state import InMemoryState
 
 
 
@@ -91,28 +100,34 @@ class TestImageQualityValidation(unittest.TestCase):
         result = self.image_quality_validation.check_image_resolution_file("tests/datas/IMG002.jpg")
         self.assertFalse(result)
 
-    def test_check_image_training_successful(self):
-        with patch('os.walk') as mock_walk:
-            folder_path = "tests/datas/validation_successful"
-            mock_walk.return_value = [(folder_path, [],[])]
-            with patch.object(self.image_quality_validation, 'remove_low_res_image_folder', return_value=[]):
-                with patch.object(self.image_quality_validation, 'remove_blank_image_folder', return_value=[]):
-                    with patch.object(self.image_quality_validation, 'remove_duplicate_dicom_images', return_value=[]):
-                        result = self.image_quality_validation.quality_validation_screening_training_dataset(folder_path)
-                        expected_result = {"status": 200, "message": "Image Quality validation successful. All images passed image quality validation"}
-                        self.assertEqual(result, expected_result)
+    def copy_dataset(self, name):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        folder_path = os.path.join(tmp_dir, name)
+        shutil.copytree(os.path.join("tests/datas", name), folder_path)
+        return folder_path
 
+    def test_check_image_training_successful(self):
+        folder_path = self.copy_dataset("validation_successful")
+        result = self.image_quality_validation.quality_validation_screening_training_dataset(folder_path, CpuWorkerPool(0))
+        expected_result = {"status": 200, "message": "Image Quality validation successful. All images passed image quality validation"}
+        self.assertEqual(result, expected_result)
 
     def test_check_image_training_half_failed(self):
-        with patch('os.walk') as mock_walk:
-            folder_path = "tests/datas/validation_failed"
-            mock_walk.return_value = [(folder_path, [],[])]
-            with patch.object(self.image_quality_validation, 'remove_low_res_image_folder', return_value=["tests/datas/validation_failed/class A/IMG03.jpg","tests/datas/validation_failed/class A/IMG01.png"]):
-                with patch.object(self.image_quality_validation, 'remove_blank_image_folder', return_value=["tests/datas/validation_failed/class B/blank3.dcm"]):
-                    with patch.object(self.image_quality_validation, 'remove_duplicate_dicom_images', return_value=[]):
-                        result = self.image_quality_validation.quality_validation_screening_training_dataset(folder_path)
-                        expected_result = {"status": 401, "message": "Warning. Half of the images did not satisfy image quality validation and were removed from the dataset.", "removed_files": ["tests/datas/validation_failed/class A/IMG03.jpg","tests/datas/validation_failed/class A/IMG01.png","tests/datas/validation_failed/class B/blank3.dcm"]}
-                        self.assertEqual(result, expected_result)
+        folder_path = self.copy_dataset("validation_failed")
+        pool = CpuWorkerPool(2)
+        self.addCleanup(pool.shutdown)
+        progress = []
+        result = self.image_quality_validation.quality_validation_screening_training_dataset(
+            folder_path, pool, lambda done, total: progress.append((done, total)))
+        removed = [os.path.join(folder_path, "class A", "IMG03.jpg"), os.path.join(folder_path, "class A", "IMG01.png"),
+                   os.path.join(folder_path, "class B", "blank3.dcm"), os.path.join(folder_path, "class B", "ct.dcm")]
+        self.assertEqual(result["status"], 401)
+        self.assertCountEqual(result["removed_files"], removed)
+        for file_path in removed:
+            self.assertFalse(os.path.exists(file_path))
+        self.assertTrue(os.path.exists(os.path.join(folder_path, "class A", "IMG02.jpg")))
+        self.assertEqual(progress[-1], (7, 7))
 
     @patch('utils.image_utils.image_validator.ImageQualityValidation.convert_dcm_to_numpy')
     def test_blank_image_screening_file_dicom_blank(self, mock_convert_dcm):
@@ -171,7 +186,7 @@ class TestImageQualityValidation(unittest.TestCase):
     def test_check_image_resolution_non_dicom_file_fail(self, mock_check_resolution, mock_convert_dcm):
         mock_convert_dcm.return_value = np.array([[1, 2], [3, 4]]) 
         mock_check_resolution.return_value = False
-        result = self.image_quality_validation.check_image_res_non_dicom_file("tests/datas/IM002.jpg")
+        result = self.image_quality_validation.check_image_res_non_dicom_file("tests/datas/IMG002.jpg")
         self.assertFalse(result)
 
     def test_check_image_resolution_file_invalid_format(self):
@@ -229,3 +244,89 @@ class TestImageQualityValidation(unittest.TestCase):
         path = "tests/datas/blank3.dcm"
         byte_data = open(path, "rb").read()
         self.assertFalse(self.image_quality_validation.blank_image_screening_dicom_inferencing(byte_data))
+
+    def test_quality_validation_screening_zip(self):
+        upload = io.BytesIO()
+        with zipfile.ZipFile(upload, 'w') as zipf:
+            zipf.write("tests/datas/IMG001.dcm", "class A/IMG001.dcm")
+            zipf.write("tests/datas/IMG001.dcm", "class A/IMG001_copy.dcm")  # same SOPInstanceUID
+            zipf.write("tests/datas/IMG001.jpg", "class B/IMG001.jpg")
+            zipf.write("tests/datas/IMG003.jpg", "class B/IMG003.jpg")  # low resolution
+        result = self.image_quality_validation.quality_validation_screening_zip(upload)
+        self.assertEqual(result["status"], 401)
+        self.assertEqual(result["removed_files"], ["class A/IMG001_copy.dcm", "class B/IMG003.jpg"])
+
+        progress = []
+        self.image_quality_validation.quality_validation_screening_zip(upload, lambda done, total: progress.append((done, total)))
+        self.assertEqual(progress, [(4, 4)])
+
+    def test_quality_validation_screening_zip_dedupe(self):
+        first, second = io.BytesIO(), io.BytesIO()
+        with zipfile.ZipFile(first, 'w') as zipf:
+            zipf.write("tests/datas/IMG001.jpg", "class A/IMG001.jpg")
+            zipf.write("tests/datas/IMG001.jpg", "class A/copy.jpg")  # same file bytes
+        with zipfile.ZipFile(second, 'w') as zipf:
+            zipf.write("tests/datas/IMG001.jpg", "class B/IMG001.jpg")  # uploaded before
+            zipf.write("tests/datas/IMG001.dcm", "class B/IMG001.dcm")
+        dedupe = DedupeIndex(InMemoryState(), "lungs-xray")
+        result = self.image_quality_validation.quality_validation_screening_zip(first, dedupe=dedupe)
+        self.assertEqual(result["removed_files"], ["class A/copy.jpg"])
+        dedupe.commit()
+        result = self.image_quality_validation.quality_validation_screening_zip(second, dedupe=DedupeIndex(dedupe.state, "lungs-xray"))
+        self.assertEqual(result["removed_files"], ["class B/IMG001.jpg"])
+
+    def test_screening_status(self):
+        self.assertEqual(self.image_quality_validation.screening_status([], 4)["status"], 200)
+        self.assertEqual(self.image_quality_validation.screening_status(["a"], 4)["status"], 201)
+        self.assertEqual(self.image_quality_validation.screening_status(["a", "b"], 4)["status"], 401)
+        self.assertEqual(self.image_quality_validation.screening_status(["a", "b"], 2)["status"], 400)
+
+    def test_read_image_size(self):
+        self.assertEqual(read_image_size("tests/datas/IMG001.dcm", "dcm"), (1024, 1024))
+        self.assertEqual(read_image_size(open("tests/datas/IMG001.jpg", "rb").read(), "jpg"), (808, 742))
+        self.assertEqual(read_image_size("tests/datas/IMG003.jpg", "jpg"), (199, 253))
+        with self.assertRaises(FileFormatError):
+            read_image_size(b"", "gif")
+
+    @patch('utils.image_utils.image_validator.DecodedImage.from_data')
+    def test_screen_image_low_resolution_not_decoded(self, mock_from_data):
+        self.assertEqual(screen_image("tests/datas/IMG003.jpg", None)["reason"], "resolution")
+        mock_from_data.assert_not_called()
+
+    def test_is_blank(self):
+        self.assertTrue(is_blank(np.zeros((300, 300), dtype=np.uint16)))
+        self.assertTrue(is_blank(np.full((30, 30, 3), (255, 0, 0), dtype=np.uint8)))  # one colour
+        self.assertFalse(is_blank(np.tile(np.arange(300, dtype=np.uint16), (300, 1))))  # identical rows
+        image = np.zeros((300, 300), dtype=np.uint16)
+        image[-1, -1] = 1  # missed by the sample, found by the chunked pass
+        self.assertFalse(is_blank(image, sample_size=16, chunk_size=1000))
+        self.assertFalse(is_blank(np.zeros((300, 300), dtype=np.uint8)[:, ::2] + np.eye(300, dtype=np.uint8)[:, ::2]))
+
+    def test_is_blank_view_not_copied(self):
+        image = np.zeros((2000, 2000), dtype=np.uint16)
+        for view in (image.T, image[100:, 100:], image[:, ::2]):
+            tracemalloc.start()
+            try:
+                self.assertTrue(is_blank(view))
+                peak = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+            self.assertLess(peak, image.nbytes // 8)
+        image[-1, 0] = 1
+        self.assertFalse(is_blank(image.T, sample_size=16))
+
+    def test_quality_validation_screening_zip_cache(self):
+        upload = io.BytesIO()
+        with zipfile.ZipFile(upload, 'w') as zipf:
+            zipf.write("tests/datas/IMG001.jpg", "class A/IMG001.jpg")
+            zipf.write("tests/datas/IMG003.jpg", "class B/IMG003.jpg")  # low resolution
+        cache = ScreeningCache(InMemoryState())
+        first = self.image_quality_validation.quality_validation_screening_zip(upload, cache=cache)
+        self.assertEqual(first["removed_files"], ["class B/IMG003.jpg"])
+        with patch('utils.image_utils.image_validator.screen_image') as mock_screen_image:
+            second = self.image_quality_validation.quality_validation_screening_zip(upload, cache=cache)
+            mock_screen_image.assert_not_called()
+        self.assertEqual(second, first)
+        with patch('utils.image_utils.image_validator.screen_image') as mock_screen_image:
+            self.image_quality_validation.quality_validation_screening_zip(upload, cache=ScreeningCache(cache.store, version=0))
+            self.assertEqual(mock_screen_image.call_count, 2)
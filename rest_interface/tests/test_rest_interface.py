@@ -3,7 +3,8 @@ import tempfile
 import os
 from flask import Flask
 from flask.testing import FlaskClient
-from rest_interface import app ,infer_lungs
+from rest_interface import app ,infer_lungs, rest
+from flask_jwt_extended import create_access_token
 from unittest.mock import patch
 
 
@@ -45,5 +46,16 @@ class TestFlaskApp(unittest.TestCase):
         response = self.client.post('/api/ai-feedback/lungs-xray', json={})
         self.assertEqual(response.status_code, 404)
 
+    def test_search_preview_from_url(self):
+        with app.app_context():
+            token = create_access_token('user')
+        with patch.object(rest, 'get_preview', return_value=b'\xff\xd8preview') as mock_preview:
+            response = app.test_client().get('/api/search/preview/1.2/1.2.3?size=128',
+                                             headers={'Authorization': 'Bearer ' + token})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, b'\xff\xd8preview')
+        self.assertEqual(response.headers['Cache-Control'], 'private, max-age=3600')
+        mock_preview.assert_called_once_with({"StudyInstanceUID": "1.2", "SeriesInstanceUID": "1.2.3"}, 128, "jpeg")
+
 if __name__ == '__main__':
     unittest.main()
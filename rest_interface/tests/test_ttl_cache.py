@@ -0,0 +1,51 @@
+import unittest
+import time
+from utils.ttl_cache import TTLCache
+
+
+class TestTTLCache(unittest.TestCase):
+
+    def test_hit_and_miss(self):
+        cache = TTLCache(ttl=30, max_bytes=100)
+        self.assertIsNone(cache.get("P1"))
+        cache.put("P1", {"PACS_RESPONSE": []}, 10)
+        self.assertEqual(cache.get("P1"), {"PACS_RESPONSE": []})
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["entries"], stats["size_bytes"]), (1, 1, 1, 10))
+
+    def test_expiry(self):
+        cache = TTLCache(ttl=0.01, max_bytes=100)
+        cache.put("P1", "value", 10)
+        time.sleep(0.02)
+        self.assertIsNone(cache.get("P1"))
+        self.assertEqual(cache.stats()["size_bytes"], 0)
+
+    def test_lru_eviction_by_size(self):
+        cache = TTLCache(ttl=30, max_bytes=25)
+        cache.put("P1", "a", 10)
+        cache.put("P2", "b", 10)
+        cache.get("P1")  # P2 becomes least recently used
+        cache.put("P3", "c", 10)
+        self.assertIsNone(cache.get("P2"))
+        self.assertEqual(cache.get("P1"), "a")
+        self.assertEqual(cache.get("P3"), "c")
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+        cache.put("P4", "too large", 26)
+        self.assertIsNone(cache.get("P4"))
+
+    def test_invalidate_and_disabled(self):
+        cache = TTLCache(ttl=30, max_bytes=100)
+        cache.put("P1", "a", 10)
+        cache.invalidate("P1")
+        cache.invalidate("unknown")
+        self.assertIsNone(cache.get("P1"))
+        self.assertEqual(cache.stats()["invalidations"], 1)
+
+        disabled = TTLCache(ttl=0)
+        disabled.put("P1", "a", 10)
+        self.assertIsNone(disabled.get("P1"))
+
+
+if __name__ == '__main__':
+    unittest.main()
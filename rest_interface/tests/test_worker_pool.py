@@ -0,0 +1,62 @@
+import io
+import unittest
+import zipfile
+import numpy as np
+from utils.worker_pool import CpuWorkerPool
+from utils.zip_utils import iter_zip_members
+from rest.api import prepare_image
+
+
+def to_array(data, dtype):
+    return np.frombuffer(data, dtype=dtype).reshape((2, -1))
+
+def byte_length(data):
+    return len(data)
+
+
+class TestCpuWorkerPool(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = CpuWorkerPool(2)
+
+    def tearDown(self):
+        self.pool.shutdown()
+
+    def test_array_result_through_shared_memory(self):
+        data = np.arange(8, dtype=np.uint16).tobytes()
+        result = self.pool.run(to_array, data, "uint16")
+        self.assertEqual(result.shape, (2, 4))
+        self.assertEqual(result.dtype, np.uint16)
+        self.assertTrue(np.array_equal(result.ravel(), np.arange(8)))
+
+    def test_plain_result(self):
+        self.assertEqual(self.pool.run(byte_length, b"12345"), 5)
+        self.assertEqual(self.pool.run(byte_length, b""), 0)
+
+    def test_prepare_image(self):
+        with open("tests/datas/IMG001.dcm", "rb") as f:
+            img_npy = self.pool.run(prepare_image, f, "dcm")
+        self.assertEqual(img_npy.shape, (224, 224))
+        with self.assertRaises(ValueError):
+            self.pool.run(prepare_image, open("tests/datas/IMG003.jpg", "rb").read(), "jpg")
+
+    def test_map(self):
+        self.assertEqual(list(self.pool.map(byte_length, [b"1", b"123", b""])), [1, 3, 0])
+        self.assertEqual(list(CpuWorkerPool(0).map(byte_length, [b"12"])), [2])
+
+    def test_zip_member_inflated_on_worker(self):
+        upload = io.BytesIO()
+        with zipfile.ZipFile(upload, 'w', zipfile.ZIP_DEFLATED) as zipf:
+            zipf.write("tests/datas/IMG001.dcm", "class A/IMG001.dcm")
+        [(_, member)] = list(iter_zip_members(upload))
+        img_npy = self.pool.run(prepare_image, member, "dcm")
+        self.assertEqual(img_npy.shape, (224, 224))
+
+    def test_inline(self):
+        pool = CpuWorkerPool(0)
+        self.assertEqual(pool.run(byte_length, b"123"), 3)
+        self.assertIsNone(pool._executor)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,8 +1,13 @@
-from utils.zip_utils import ZipManager
+from utils.zip_utils import ZipManager, stream_zip, iter_zip_members
+from utils.worker_pool import CpuWorkerPool
 import unittest
 import zipfile
+import zlib
+import hashlib
 import os
-from unittest.mock import Mock
+import io
+import shutil
+from unittest.mock import Mock, patch
 
 class TestZipManager(unittest.TestCase):
     def setUp(self):
@@ -31,14 +36,169 @@ class TestZipManager(unittest.TestCase):
         self.assertEqual(file_list, ['valid.jpg', 'valid.png'])
 
     def test_extract(self):
+        with zipfile.ZipFile(self.sample_zip_path, 'w') as zipf:
+            zipf.writestr('class A/valid.jpg', b'Sample JPEG content')
+            zipf.writestr('class A/valid.png', b'Sample PNG content')
         data = Mock()  # Mocking the data object
         zip_manager = ZipManager(data)
         zip_manager.write(self.sample_zip_path)
         extract_path = 'extracted'
         zip_manager.extract(extract_path)
         self.assertTrue(os.path.exists(extract_path))
-        self.assertTrue(os.path.exists(os.path.join(extract_path, 'valid.jpg')))
-        self.assertTrue(os.path.exists(os.path.join(extract_path, 'valid.png')))
+        self.assertTrue(os.path.exists(os.path.join(extract_path, 'class A', 'valid.jpg')))
+        self.assertTrue(os.path.exists(os.path.join(extract_path, 'class A', 'valid.png')))
+
+    def test_extract_rejects_before_extraction(self):
+        data = Mock()
+        zip_manager = ZipManager(data)
+        zip_manager.write(self.sample_zip_path)  # files at the root
+        with self.assertRaises(ValueError):
+            zip_manager.extract('rejected')
+        self.assertFalse(os.path.exists('rejected'))
+
+    def test_stream_zip(self):
+        entries = [('a.dcm', io.BytesIO(b'A' * 2500)), ('b.dcm', io.BytesIO(b'')), ('c.dcm', io.BytesIO(b'C' * 10))]
+        chunks = list(stream_zip(entries, chunk_size=1000))
+        self.assertGreater(len(chunks), 1)
+        with zipfile.ZipFile(io.BytesIO(b''.join(chunks))) as zipf:
+            self.assertEqual(zipf.namelist(), ['a.dcm', 'b.dcm', 'c.dcm'])
+            self.assertEqual(zipf.read('a.dcm'), b'A' * 2500)
+            self.assertEqual(zipf.read('b.dcm'), b'')
+            self.assertEqual(zipf.read('c.dcm'), b'C' * 10)
+
+    def test_stream_zip_large_member(self):
+        with patch('zipfile.ZIP64_LIMIT', 1000):  # stands in for the 4 GiB limit
+            chunks = list(stream_zip([('a.dcm', io.BytesIO(b'A' * 2500))], chunk_size=1000))
+        with zipfile.ZipFile(io.BytesIO(b''.join(chunks))) as zipf:
+            self.assertEqual(zipf.read('a.dcm'), b'A' * 2500)
+
+    def test_iter_zip_members(self):
+        upload = io.BytesIO()
+        with zipfile.ZipFile(upload, 'w') as zipf:
+            zipf.writestr('class A/1.dcm', b'A' * 5000, compress_type=zipfile.ZIP_DEFLATED)
+            zipf.writestr('class A/2.dcm', b'stored', compress_type=zipfile.ZIP_STORED)
+        members = list(iter_zip_members(upload))
+        self.assertEqual([name for (name, _) in members], ['class A/1.dcm', 'class A/2.dcm'])
+        self.assertLess(len(members[0][1].raw), 5000)  # read compressed
+        self.assertEqual([member.read() for (_, member) in members], [b'A' * 5000, b'stored'])
+        self.assertNotEqual(members[0][1].digest, members[1][1].digest)
+        self.assertEqual(members[1][1].digest, hashlib.sha256(b'stored').hexdigest())
+
+        members[0][1].raw = members[0][1].raw[:-1] + b'\0'
+        with self.assertRaises(zipfile.BadZipFile):
+            members[0][1].read()
+
+    def test_member_digest_independent_of_compression(self):
+        digests = []
+        for (compress_type, level) in [(zipfile.ZIP_STORED, None), (zipfile.ZIP_DEFLATED, 1), (zipfile.ZIP_DEFLATED, 9)]:
+            upload = io.BytesIO()
+            with zipfile.ZipFile(upload, 'w') as zipf:
+                zipf.writestr('class A/1.dcm', b'A' * 5000 + b'B' * 5000, compress_type=compress_type, compresslevel=level)
+            digests.append(next(iter_zip_members(upload))[1].digest)
+        self.assertEqual(set(digests), {hashlib.sha256(b'A' * 5000 + b'B' * 5000).hexdigest()})
+
+    def test_member_not_inflated_past_declared_size(self):
+        upload = io.BytesIO()
+        with zipfile.ZipFile(upload, 'w', zipfile.ZIP_DEFLATED) as zipf:
+            zipf.writestr('class A/1.dcm', b'\0' * 2048)
+        (_, member) = next(iter_zip_members(upload))
+        compressor = zlib.compressobj(9, zlib.DEFLATED, -zlib.MAX_WBITS)
+        member.raw = compressor.compress(b'\0' * 10 * 1024 * 1024) + compressor.flush()
+        with self.assertRaises(zipfile.BadZipFile):
+            member.read()
+
+    def test_extract_parallel(self):
+        with zipfile.ZipFile(self.sample_zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
+            for name in ['class A/1.jpg', 'class A/2.jpg', 'class B/1.png', 'class B/2.png']:
+                zipf.writestr(name, name.encode() * 100)
+        pool = CpuWorkerPool(2)
+        self.addCleanup(pool.shutdown)
+        zip_manager = ZipManager(Mock())
+        zip_manager.write(self.sample_zip_path)
+        extract_path = 'extracted_parallel'
+        self.addCleanup(shutil.rmtree, extract_path, True)
+        zip_manager.extract(extract_path, pool)
+        with open(os.path.join(extract_path, 'class B', '2.png'), 'rb') as f:
+            self.assertEqual(f.read(), b'class B/2.png' * 100)
+        self.assertEqual(zip_manager.NUM_CLASSES, 2)
+
+    def make_upload(self, members, content=b'content', **limits):
+        upload = io.BytesIO()
+        with zipfile.ZipFile(upload, 'w', zipfile.ZIP_DEFLATED) as zipf:
+            for name in members:
+                zipf.writestr(name, content)
+        data = Mock()
+        data.stream = upload
+        return ZipManager(data, **limits)
+
+    def test_validate_members(self):
+        zip_manager = self.make_upload(['class A/1.dcm', 'class A/2.JPG', 'class B/1.png', 'class B/2.bmp'])
+        zip_manager.validate_members()  # This should not raise any errors
+        self.assertEqual(zip_manager.list_classes(), ['class A', 'class B'])
+
+        invalid_uploads = [['root.jpg', 'class A/1.dcm', 'class A/2.dcm'],
+                           ['class A/1.dcm', 'class A/2.txt'],
+                           ['class A/1.dcm'],
+                           ['class A/1.dcm', 'class A/2.dcm', 'class A/sub/1.dcm', 'class A/sub/2.dcm'],
+                           ['class A/1.dcm', 'class A/../../2.dcm'],
+                           ['/class A/1.dcm', '/class A/2.dcm']]
+        for members in invalid_uploads:
+            with self.assertRaises(ValueError):
+                self.make_upload(members).validate_members()
+
+    def test_validate_members_limits(self):
+        members = ['class A/1.dcm', 'class A/2.dcm', 'class B/1.dcm', 'class B/2.dcm']
+        self.make_upload(members, max_members=4).validate_members()
+        with self.assertRaises(ValueError):
+            self.make_upload(members, max_members=3).validate_members()
+        with self.assertRaises(ValueError):
+            self.make_upload(members, max_uncompressed_size=4 * len(b'content') - 1).validate_members()
+        zip_bomb = self.make_upload(members, content=b'\0' * 1024 * 1024)
+        with self.assertRaises(ValueError):
+            zip_bomb.validate_members()
+
+    def test_validate_limits(self):
+        # no data set structure is required, e.g. for a batch of images to infer
+        self.assertEqual(len(self.make_upload(['1.jpg']).validate_limits()), 1)
+        with self.assertRaises(ValueError):
+            self.make_upload(['1.jpg', '2.jpg'], max_members=1).validate_limits()
+        with self.assertRaises(ValueError):
+            self.make_upload(['1.jpg'], content=b'\0' * 1024 * 1024).validate_limits()
+
+    def test_validate_limits_members(self):
+        members = ['class A/1.dcm', 'class A/2.dcm']
+        bzip2 = self.make_upload(members)
+        with zipfile.ZipFile(bzip2.data.stream, 'a') as zipf:
+            zipf.writestr('class A/3.dcm', b'content', compress_type=zipfile.ZIP_BZIP2)
+        with self.assertRaises(ValueError):
+            bzip2.validate_members()
+        with self.assertRaises(zipfile.BadZipFile):
+            list(iter_zip_members(bzip2.data.stream))
+
+        encrypted = self.make_upload(members)
+        with zipfile.ZipFile(encrypted.data.stream, 'r') as zipf:
+            infos = zipf.infolist()
+        infos[0].flag_bits |= 0x1
+        with self.assertRaises(ValueError):
+            encrypted.check_limits(infos)
+
+        # one highly compressed member among normal ones
+        upload = self.make_upload([])
+        with zipfile.ZipFile(upload.data.stream, 'w', zipfile.ZIP_DEFLATED) as zipf:
+            zipf.writestr('class A/bomb.dcm', b'\0' * 16 * 1024 * 1024)
+            for i in range(8):
+                zipf.writestr(f'class A/{i}.dcm', os.urandom(1024 * 1024))
+        with zipfile.ZipFile(upload.data.stream, 'r') as zipf:
+            infos = zipf.infolist()
+        upload.check_limits(infos[1:])
+        with self.assertRaises(ValueError):
+            upload.check_limits(infos)
+
+    def test_iter_chunks(self):
+        zip_manager = self.make_upload(['class A/1.dcm', 'class A/2.dcm'])
+        chunks = list(zip_manager.iter_chunks(chunk_size=64))
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(b''.join(chunks), zip_manager.data.stream.getvalue())
 
     def test_validate_dataset(self):
         # Create a sample directory structure for testing
@@ -68,4 +228,18 @@ class TestZipManager(unittest.TestCase):
         os.remove(os.path.join('tests/datas/test_dataset', 'class1', 'invalid.txt'))
         os.remove(os.path.join('tests/datas/test_dataset', 'class1', 'valid.jpg'))
         os.rmdir(os.path.join('tests/datas/test_dataset', 'class1'))
-        os.rmdir('tests/datas/test_dataset')
\ No newline at end of file
+        os.rmdir('tests/datas/test_dataset')
+
+    def test_validate_dataset_root_file(self):
+        root = 'tests/datas/test_dataset_root'
+        for name in ['class1', 'class2']:
+            os.makedirs(os.path.join(root, 'dataset', name))
+        open(os.path.join(root, 'dataset', 'root.jpg'), 'w').close()
+        try:
+            zip_manager = ZipManager(Mock())
+            zip_manager.path = root
+            zip_manager.NUM_CLASSES = 2
+            with self.assertRaises(ValueError):
+                zip_manager.validate_dataset()
+        finally:
+            shutil.rmtree(root)
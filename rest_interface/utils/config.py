@@ -20,4 +20,27 @@ class Config:
         except Exception as e:
             raise ValueError
 
-        return ip, port
\ No newline at end of file
+        return ip, port
+    def get_http_client_conf(self):
+        """
+        Returns the HTTP client settings per server name. The top-level
+        'http_client' section holds the defaults, which an optional 'http'
+        section inside each server entry can override.
+        """
+        conf = self.get_server_conf()
+        defaults = conf.get('http_client', {})
+        http_conf = {}
+        for server_name, data in conf.items():
+            if isinstance(data, dict) and 'ip' in data:
+                server_conf = dict(defaults)
+                server_conf.update(data.get('http', {}))
+                http_conf[server_name] = server_conf
+        return http_conf
+
+    def get_gateway_conf(self):
+        """
+        Returns the tuning settings of the gateway itself from the optional
+        'gateway' section, e.g. per-request fan-out limits.
+        """
+        conf = self.get_server_conf()
+        return conf.get('gateway', {})
@@ -0,0 +1,70 @@
+import hashlib
+import os
+import tempfile
+import threading
+
+class DiskCache:
+    """
+    Byte-bounded cache of small files (e.g. image previews) in 'directory'.
+
+    Entries are written atomically, so several gateway workers can share the
+    directory. Reads refresh the modification time and the least recently used
+    files are removed once the total size exceeds 'max_bytes'.
+    """
+    def __init__(self, directory, max_bytes=256 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._size = 0
+        if os.path.isdir(directory):
+            self._size = sum(entry.stat().st_size for entry in os.scandir(directory) if entry.is_file())
+
+    def path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode()).hexdigest())
+
+    def get(self, key):
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return data
+
+    def put(self, key, data):
+        if len(data) > self.max_bytes:
+            return
+        path = self.path(key)
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        with self._lock:
+            try:
+                self._size -= os.path.getsize(path)
+            except FileNotFoundError:
+                pass
+            os.replace(tmp_path, path)
+            self._size += len(data)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        entries = sorted((entry for entry in os.scandir(self.directory)
+                          if entry.is_file() and not entry.name.endswith('.tmp')),
+                         key=lambda entry: entry.stat().st_mtime)
+        self._size = sum(entry.stat().st_size for entry in entries)
+        for entry in entries:
+            if self._size <= self.max_bytes * 0.9:
+                break
+            try:
+                size = entry.stat().st_size
+                os.remove(entry.path)
+                self._size -= size
+            except FileNotFoundError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            return {"size_bytes": self._size, "max_bytes": self.max_bytes, "directory": self.directory}
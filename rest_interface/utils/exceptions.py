@@ -12,4 +12,9 @@ class InvalidImageDataError(Exception):
     pass
 
 class InvalidImageDataset(Exception):
-    pass
\ No newline at end of file
+    def __init__(self, message, removed_files=None):
+        super().__init__(message)
+        self.removed_files = removed_files or []
+
+class DatasetUploadError(Exception):
+    pass
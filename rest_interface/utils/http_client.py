@@ -0,0 +1,84 @@
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from idiagnose_common.metrics import track_dependency
+from idiagnose_common.tracing import client_span
+
+DEFAULT_HTTP_CONF = {
+    "pool_connections": 4,
+    "pool_maxsize": 16,
+    "connect_timeout": 5,
+    "read_timeout": 120,
+    "retries": 3,
+    "backoff_factor": 0.3,
+    "status_forcelist": [502, 503, 504]
+}
+
+class ServiceSession(requests.Session):
+    """
+    requests.Session bound to one downstream service.
+
+    Keeps a pool of keep-alive connections to the service, applies a default
+    (connect, read) timeout to every call and retries idempotent requests
+    (GET, HEAD, PUT, DELETE, OPTIONS) on connection errors and gateway errors.
+    POST requests are only retried when the connection could not be opened.
+    No request is re-sent after a read timeout: the service may still be
+    working on it, and some GETs have side effects (e.g. the inference sweep
+    of /api/infer-new-data).
+    Every call is timed in the dependency metrics under 'name', recorded as a
+    client span and carries the correlation id of the current request.
+    """
+    def __init__(self, conf=None, name="http"):
+        super().__init__()
+        self.name = name
+        self.conf = dict(DEFAULT_HTTP_CONF)
+        self.conf.update(conf or {})
+        self.timeout = (self.conf["connect_timeout"], self.conf["read_timeout"])
+
+        retry = Retry(total=self.conf["retries"],
+                      connect=self.conf["retries"],
+                      read=0,
+                      status=self.conf["retries"],
+                      backoff_factor=self.conf["backoff_factor"],
+                      status_forcelist=self.conf["status_forcelist"],
+                      allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,
+                      raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=self.conf["pool_connections"],
+                              pool_maxsize=self.conf["pool_maxsize"],
+                              max_retries=retry)
+        self.mount("http://", adapter)
+        self.mount("https://", adapter)
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        with track_dependency(self.name, method.upper()) as call, \
+             client_span(f"{method.upper()} {self.name}", {"http.url": url}) as span:
+            kwargs["headers"] = span.headers(kwargs.get("headers"))
+            response = super().request(method, url, **kwargs)
+            span.attributes["http.status_code"] = response.status_code
+            call.record_status(response.status_code)
+            return response
+
+class SessionRegistry:
+    """
+    Holds one ServiceSession per downstream service, keyed by the server name
+    used in microservice_conf.json (e.g. 'dicom_server', 'cloud_server').
+    Sessions are created lazily on first use and reused afterwards.
+    """
+    def __init__(self, http_conf=None):
+        self.http_conf = http_conf or {}
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def session(self, server_name):
+        with self._lock:
+            if server_name not in self._sessions:
+                self._sessions[server_name] = ServiceSession(self.http_conf.get(server_name), server_name)
+            return self._sessions[server_name]
+
+    def close(self):
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions = {}
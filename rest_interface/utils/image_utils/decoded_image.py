@@ -0,0 +1,83 @@
+import io
+import cv2
+import numpy as np
+import pydicom
+from utils.exceptions import *
+
+class DecodedImage():
+    """
+    An image decoded exactly once, shared by the validator and the preprocessor.
+
+    Attributes:
+    - header: pydicom Dataset of a DICOM image, None for raster formats.
+    - pixel_array: NumPy array with the decoded pixel data, (rows, cols) for
+      DICOM and (height, width[, channels]) for raster formats (RGB order).
+    - dtype: dtype of 'pixel_array'.
+    - source_format: 'dcm', 'jpg', 'png' or 'bmp'.
+    """
+    def __init__(self, pixel_array, source_format, header=None):
+        self.pixel_array = pixel_array
+        self.dtype = pixel_array.dtype
+        self.source_format = source_format
+        self.header = header
+
+    @property
+    def shape(self):
+        return self.pixel_array.shape
+
+    @property
+    def height(self):
+        return self.pixel_array.shape[0]
+
+    @property
+    def width(self):
+        return self.pixel_array.shape[1]
+
+    @classmethod
+    def from_data(cls, image_data, img_type="dcm"):
+        """
+        Decode an image from bytes, a file path or a file-like object
+        (e.g. an uploaded werkzeug FileStorage).
+
+        Raises:
+        - FileFormatError: If 'img_type' is not DICOM, JPG, PNG or BMP.
+        - DicomNumpyConversionError: If the DICOM pixel data cannot be decoded.
+        - ImageNumpyConversionError: If the raster image cannot be decoded.
+        """
+        if isinstance(image_data, str):
+            with open(image_data, 'rb') as f:
+                image_data = f.read()
+        elif hasattr(image_data, 'read'):
+            image_data = image_data.read()
+        if not isinstance(image_data, (bytes, bytearray, memoryview)):
+            raise ValueError("Unsupported image data")
+
+        if img_type == "dcm":
+            return cls.from_dicom_bytes(image_data)
+        elif img_type in ['jpg', 'png', 'bmp']:
+            return cls.from_raster_bytes(image_data, img_type)
+        else:
+            raise FileFormatError("File format is not valid.")
+
+    @classmethod
+    def from_dicom_bytes(cls, image_bytes):
+        try:
+            ds = pydicom.dcmread(io.BytesIO(image_bytes), force=True)
+            pixel_data = ds.pixel_array
+            rows, cols = int(ds.Rows), int(ds.Columns)
+            pixel_array = np.reshape(pixel_data, (rows, cols))
+        except Exception as e:
+            raise DicomNumpyConversionError(f"Error converting DICOM to NumPy array: {e}")
+        return cls(pixel_array, "dcm", header=ds)
+
+    @classmethod
+    def from_raster_bytes(cls, image_bytes, img_type):
+        img_bytes = np.frombuffer(image_bytes, dtype=np.uint8)
+        pixel_array = cv2.imdecode(img_bytes, cv2.IMREAD_UNCHANGED)
+        if pixel_array is None:
+            raise ImageNumpyConversionError("Error converting image to NumPy array or image array is None.")
+        if pixel_array.ndim == 3 and pixel_array.shape[2] == 3:
+            pixel_array = cv2.cvtColor(pixel_array, cv2.COLOR_BGR2RGB)
+        elif pixel_array.ndim == 3 and pixel_array.shape[2] == 4:
+            pixel_array = cv2.cvtColor(pixel_array, cv2.COLOR_BGRA2RGB)
+        return cls(pixel_array, img_type)
@@ -0,0 +1,130 @@
+import hashlib
+import threading
+import cv2
+import numpy as np
+
+PHASH_BANDS = 4 # the 64 bit perceptual hash is indexed in 4 bands of 16 bits
+
+def content_hash(data):
+    """ SHA-256 of the file bytes: catches byte identical copies. """
+    return hashlib.sha256(data).hexdigest()
+
+def pixel_hash(pixel_array):
+    """
+    SHA-256 of the decoded pixels, shape and dtype: catches the same image
+    stored in another lossless container (e.g. a PNG and a BMP, or a DICOM
+    re-written with other tags).
+    """
+    pixel_array = np.ascontiguousarray(pixel_array)
+    digest = hashlib.sha256(f"{pixel_array.shape}{pixel_array.dtype}".encode())
+    digest.update(memoryview(pixel_array).cast('B'))
+    return digest.hexdigest()
+
+def perceptual_hash(pixel_array):
+    """
+    64 bit difference hash (dHash) of the image as 16 hex digits. It only
+    compares neighbouring pixels of a 9x8 thumbnail, so re-encoding, resizing
+    and a different bit depth (e.g. a 16 bit DICOM exported to an 8 bit JPG)
+    change only a few bits.
+    """
+    img = np.asarray(pixel_array, dtype=np.float32)
+    if img.ndim == 3:
+        img = img.mean(axis=2)
+    thumbnail = cv2.resize(img, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (thumbnail[:, 1:] > thumbnail[:, :-1]).ravel()
+    return f"{int(np.packbits(bits).view('>u8')[0]):016x}"
+
+def image_hashes(data, pixel_array, sop_instance_uid=None):
+    """ The fingerprint of one image used by DedupeIndex. """
+    hashes = {"content": content_hash(data), "pixel": pixel_hash(pixel_array),
+              "phash": perceptual_hash(pixel_array)}
+    if sop_instance_uid is not None:
+        hashes["sop"] = sop_instance_uid
+    return hashes
+
+def hamming_distance(hash1, hash2):
+    return bin(int(hash1, 16) ^ int(hash2, 16)).count("1")
+
+class DedupeIndex:
+    """
+    Hash index of the images of a project, used to reject duplicates within
+    an upload and against the data sets uploaded before.
+
+    Every hash is one key of 'state' ('dedupe:<project>:<kind>:<hash>'), so a
+    lookup is one query per file whatever the number of images already indexed.
+    Near duplicates are found from the perceptual hash: it is split into 4
+    bands of 16 bits and only the hashes sharing a band are compared, which
+    finds every match up to a Hamming distance of 3. Each (band, hash) pair is
+    a key of its own ('dedupe:<project>:phash<i>:<band>:<hash>'), so uploads
+    committed at the same time never overwrite each other's hashes. A
+    'phash_distance' of None disables the near duplicate check.
+
+    Hashes added during an upload are kept in the index object and only
+    written to the state by commit(), once the data set was accepted.
+    """
+    def __init__(self, state=None, project="default", phash_distance=None):
+        self.state = state
+        self.project = project
+        self.phash_distance = phash_distance
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def find(self, hashes):
+        """ Returns the kind of hash ('content', 'pixel', 'sop', 'phash') matching an indexed image, or None. """
+        exact = {self._key(kind, hashes[kind]): kind for kind in ("content", "pixel", "sop") if hashes.get(kind) is not None}
+        found = self._get_many(list(exact))
+        for (key, kind) in exact.items():
+            if found.get(key) is not None:
+                return kind
+        if self.phash_distance is not None and hashes.get("phash") is not None:
+            for candidate in self._band_candidates(hashes["phash"]):
+                if hamming_distance(candidate, hashes["phash"]) <= self.phash_distance:
+                    return "phash"
+        return None
+
+    def add(self, hashes):
+        with self._lock:
+            for kind in ("content", "pixel", "sop"):
+                if hashes.get(kind) is not None:
+                    self._pending[self._key(kind, hashes[kind])] = True
+            if hashes.get("phash") is not None:
+                for prefix in self._band_prefixes(hashes["phash"]):
+                    self._pending[prefix + hashes["phash"]] = True
+
+    def check_and_add(self, hashes):
+        """ Adds the image unless it duplicates an indexed one. Returns the matching kind, or None. """
+        kind = self.find(hashes)
+        if kind is None:
+            self.add(hashes)
+        return kind
+
+    def commit(self):
+        """ Persists the hashes added since the last commit. """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if self.state is not None:
+            self.state.set_many(pending)
+
+    def _get_many(self, keys):
+        with self._lock:
+            values = {key: self._pending[key] for key in keys if key in self._pending}
+        missing = [key for key in keys if key not in values]
+        if missing and self.state is not None:
+            values.update(self.state.get_many(missing))
+        return values
+
+    def _band_candidates(self, phash):
+        """ The indexed perceptual hashes sharing a band with 'phash', found in one query. """
+        prefixes = tuple(self._band_prefixes(phash))
+        with self._lock:
+            keys = [key for key in self._pending if key.startswith(prefixes)]
+        if self.state is not None:
+            keys += self.state.find_keys(prefixes)
+        return {key.rsplit(":", 1)[1] for key in keys}
+
+    def _key(self, kind, value):
+        return f"dedupe:{self.project}:{kind}:{value}"
+
+    def _band_prefixes(self, phash):
+        width = len(phash) // PHASH_BANDS
+        return [self._key(f"phash{i}", phash[i * width:(i + 1) * width]) + ":" for i in range(PHASH_BANDS)]
@@ -1,13 +1,16 @@
 import io
-import os
-import numpy as np
+import itertools
 import pydicom
-from pydicom.pixel_data_handlers.util import apply_windowing
 from PIL import Image
 from reportlab.lib.pagesizes import letter
 from reportlab.pdfgen import canvas
 from reportlab.lib import colors
+from reportlab.lib.utils import ImageReader
 from reportlab.platypus import Table, TableStyle
+from idiagnose_common.windowing import to_uint8
+
+PIXEL_DATA_TAG = 0x7FE00010
+BULK_DATA_VRS = ('OB', 'OW', 'OF', 'OD', 'OL', 'OV', 'UN')
 
 class PdfGeneration():
     def __init__(self):
@@ -15,26 +18,31 @@ class PdfGeneration():
 
     def dicom_to_numpy(self, byte_data):
         """
-        Converts DICOM data to a NumPy array.
+        Converts DICOM data to an 8-bit NumPy array for display, with the
+        rescale, window and photometric interpretation of the data set.
 
         Args:
         - byte_data (bytes): Byte data of the DICOM file.
         
         Returns:
-        - NumPy array: Pixel data of the DICOM file.
+        - NumPy array: Windowed uint8 pixel data of the DICOM file.
     
         Raises:
         - ValueError: byte_data is none.
         """
         if byte_data is not None:
             ds = pydicom.dcmread(io.BytesIO(byte_data), force=True)
-            return apply_windowing(ds.pixel_array, ds)
+            return to_uint8(ds.pixel_array, ds)
         else:
             raise ValueError("No file data or filename provided.")
 
     def byte_to_pdf(self, byte_data):
         """
         Generates a PDF document from DICOM byte data or a file.
+        The image is drawn from memory, so concurrent calls do not share any
+        temporary file, and the DICOM data is parsed only once. The document
+        is written without timestamps or random IDs, so the same input always
+        gives the same bytes.
 
         Args:
         - byte_data (bytes): Byte data of the DICOM file.
@@ -45,30 +53,18 @@ class PdfGeneration():
         Raises:
         - ValueError: If byte_data is none.
         """
-        if byte_data is not None:
-            pixel_array = self.dicom_to_numpy(byte_data)
-        else:
+        if byte_data is None:
             raise ValueError("No file data or filename provided.")
-        # Normalize pixel values for proper image display
-        pixel_array = ((pixel_array - pixel_array.min()) / 
-                        (pixel_array.max() - pixel_array.min()) * 255.0).astype(np.uint8)
-        image = Image.fromarray(pixel_array)  # numpy array to image
+        ds = pydicom.dcmread(io.BytesIO(byte_data), force=True)
+        image = Image.fromarray(to_uint8(ds.pixel_array, ds))  # windowed 8-bit image
         # Create PDF
         pdf_buffer = io.BytesIO()
-        c = canvas.Canvas(pdf_buffer, pagesize=letter)                
-        image.save("temp.png")  # save image temporarily
-        c.drawImage("temp.png", 50, 50, width=500, height=600)
+        c = canvas.Canvas(pdf_buffer, pagesize=letter, invariant=1)
+        c.drawImage(ImageReader(image), 50, 50, width=500, height=600)
         c.showPage()
 
         # Adding tag information 
-        ds = pydicom.dcmread(io.BytesIO(byte_data))
-        tag_data = [['Tag', 'Tag Description', 'Value']]
-        for elem in ds.file_meta:
-            tag_info = [f"({elem.tag.group:04x}, {elem.tag.element:04x})", elem.description(), str(elem.value)]
-            tag_data.append(tag_info)
-        for elem in ds:
-            tag_info = [f"({elem.tag.group:04x}, {elem.tag.element:04x})", elem.description(), str(elem.value)]
-            tag_data.append(tag_info)            
+        tag_data = [['Tag', 'Tag Description', 'Value']] + self.tag_rows(ds)
             
         table_style = TableStyle([
             ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
@@ -89,5 +85,41 @@ class PdfGeneration():
             c.showPage()
             start_row = end_row
         c.save()
-        os.remove("temp.png")     # Clean temporary file
         return pdf_buffer.getvalue()  # Return PDF as bytes
+
+    def tag_rows(self, ds):
+        """
+        Builds the (tag, description, value) rows of the tag table.
+        Bulk data elements (pixel data, other-byte/word values, unknown VR)
+        are skipped and sequences are summarized, so no multi-megabyte value
+        is ever converted to a string.
+
+        Args:
+        - ds (pydicom.Dataset): Parsed DICOM data set.
+
+        Returns:
+        - list: One [tag, description, value] row per element.
+        """
+        rows = []
+        for elem in itertools.chain(getattr(ds, 'file_meta', []), ds):
+            if elem.tag == PIXEL_DATA_TAG or elem.VR in BULK_DATA_VRS:
+                continue
+            if elem.VR == 'SQ':
+                value = f"<sequence of {len(elem.value)} item(s)>"
+            else:
+                value = str(elem.value)
+            rows.append([f"({elem.tag.group:04x}, {elem.tag.element:04x})", elem.name, value])
+        return rows
+
+    @staticmethod
+    def cache_key(byte_data):
+        """
+        Key of the rendered PDF of a DICOM file: (SOPInstanceUID, TransferSyntaxUID),
+        read from the header only. Returns None when the file has no SOPInstanceUID.
+        """
+        ds = pydicom.dcmread(io.BytesIO(byte_data), force=True, stop_before_pixels=True)
+        sop_instance_uid = ds.get('SOPInstanceUID')
+        if not sop_instance_uid:
+            return None
+        transfer_syntax = getattr(getattr(ds, 'file_meta', None), 'TransferSyntaxUID', None)
+        return (str(sop_instance_uid), str(transfer_syntax))
@@ -5,6 +5,14 @@ import cv2
 from PIL import Image
 from io import BytesIO
 from utils.exceptions import *
+from utils.image_utils.decoded_image import DecodedImage
+from utils.image_utils.dedupe import DedupeIndex, image_hashes, content_hash
+from utils.zip_utils import iter_zip_members, count_zip_members
+import zipfile
+from utils.worker_pool import CpuWorkerPool
+import itertools
+
+VALIDATOR_VERSION = 1 # version of the screening checks, part of the ScreeningCache keys
 
 class ImageQualityValidation:
     def __init__(self):
@@ -43,18 +51,138 @@ class ImageQualityValidation:
         else:
             return {"status": 400, "message":"Error. Image quality validation is not successful"}
 
-    def quality_validation_screening_training_dataset(self,folder_path):
+    def quality_validation_screening_training_dataset(self, folder_path, pool=None, progress=None, dedupe=None, cache=None):
         """
-        Performs image quality validation on the training data set.
+        Performs image quality validation on the training data set in a single walk.
+        Every file is decoded once, on the worker processes of 'pool', and the
+        resolution, blank and duplicate checks all run on that decode. The
+        files that fail are removed from the folder.
         Arguments:folder_path (str): The path to the folder containing training data set.
+                  pool (CpuWorkerPool): Optional, pool to decode on. A pool with one process
+                                        per CPU is used for this call when not given.
+                  progress (callable): Optional, called as progress(done, total).
+                  dedupe (DedupeIndex): Optional, hash index of the project, see screen_images.
+                  cache (ScreeningCache): Optional, results of the files screened before.
         Returns:(dict): A dictionary containing the result of the image quality validation on the training data set
                     which includes a status code , message, and list of removed file path.
         """
-        total_files=sum([len(files) for root, _, files in os.walk(folder_path)])
-        files_low_resolution= self.remove_low_res_image_folder(folder_path)
-        files_blank=self.remove_blank_image_folder(folder_path)
-        files_duplicates =self.remove_duplicate_dicom_images(folder_path)
-        removed_files = files_low_resolution + files_blank + files_duplicates
+        file_paths = [os.path.join(root, file) for root, _, files in os.walk(folder_path) for file in files]
+        own_pool = pool is None
+        if own_pool:
+            pool = CpuWorkerPool(os.cpu_count() or 1)
+        try:
+            items = ((file_path, None) for file_path in file_paths)
+            removed_files = self.screen_images(items, pool, progress, len(file_paths), dedupe, cache)
+        finally:
+            if own_pool:
+                pool.shutdown()
+        for file_path in removed_files:
+            os.remove(file_path)
+        return self.screening_status(removed_files, len(file_paths))
+
+    def quality_validation_screening_zip(self, fileobj, progress=None, pool=None, dedupe=None, cache=None):
+        """
+        Performs image quality validation on a zipped training data set without
+        extracting it. Members are read compressed in small batches, then
+        inflated and decoded on the worker processes of 'pool' (inline when
+        not given), so memory use is bounded by the batch and not by the size
+        of the data set.
+        Arguments: fileobj: Path or file object of the zip archive.
+                   progress (callable): Optional, called as progress(done, total) after each batch.
+                   pool (CpuWorkerPool): Optional, pool to decode on.
+                   dedupe (DedupeIndex): Optional, hash index of the project, see screen_images.
+                   cache (ScreeningCache): Optional, results of the members screened before.
+        Returns:(dict): Same result as quality_validation_screening_training_dataset,
+                    with the member names of the images that failed the screening.
+        """
+        total_files = count_zip_members(fileobj)
+        items = iter_zip_members(fileobj)
+        removed_files = self.screen_images(items, pool or CpuWorkerPool(0), progress, total_files, dedupe, cache)
+        return self.screening_status(removed_files, total_files)
+
+    def screen_images(self, items, pool, progress=None, total=None, dedupe=None, cache=None):
+        """
+        Screens the images of a data set on 'pool' in batches and returns the
+        names of the images to remove. Duplicates (same file bytes, pixels,
+        SOPInstanceUID or, optionally, perceptual hash) are resolved in input
+        order, among the images that passed the other checks: the first one
+        is kept.
+        Arguments: items (iterable): (name, data) pairs; 'data' is the image bytes, a ZipMember
+                                     inflated on the worker, or None to read the file 'name'
+                                     on the worker.
+                   pool (CpuWorkerPool): Pool to decode on.
+                   progress (callable): Optional, called as progress(done, total) after each batch.
+                   total (int): Number of items, reported to 'progress'.
+                   dedupe (DedupeIndex): Optional, index of the project to check the images against;
+                                         the kept images are added to it. Only the duplicates within
+                                         'items' are found when not given.
+                   cache (ScreeningCache): Optional, results of the images screened before; only the
+                                           images missing from it are decoded.
+        Returns(list): Names of the images that failed the screening.
+        """
+        removed_files = []
+        if dedupe is None:
+            dedupe = DedupeIndex()
+        done = 0
+        batch_size = max(1, pool.processes) * 8
+        items = iter(items)
+        while True:
+            batch = list(itertools.islice(items, batch_size))
+            if not batch:
+                break
+            names = [name for (name, _) in batch]
+            results = self.screen_batch(batch, pool, cache)
+            for name, result in zip(names, results):
+                passed = result["passed"]
+                if passed and dedupe.check_and_add(result["hashes"]) is not None:
+                    passed = False
+                if not passed:
+                    removed_files.append(name)
+            done += len(batch)
+            if progress is not None:
+                progress(done, total)
+        return removed_files
+
+    def screen_batch(self, batch, pool, cache=None):
+        """
+        Returns the screen_image results of a batch of (name, data) pairs,
+        taken from 'cache' when possible and computed on 'pool' otherwise.
+        """
+        results = [None] * len(batch)
+        digests = [None] * len(batch)
+        if cache is not None:
+            batch = list(batch)
+            for i, (name, data) in enumerate(batch):
+                if data is None:
+                    try:
+                        with open(name, 'rb') as f:
+                            data = f.read()
+                    except OSError:
+                        continue # reported as failed by screen_image
+                    batch[i] = (name, data)
+                digests[i] = data.digest if hasattr(data, 'digest') else content_hash(data)
+            hashed = [i for i in range(len(batch)) if digests[i] is not None]
+            cached = cache.get_many([(digests[i], batch[i][0]) for i in hashed], self.accepted_height, self.accepted_width)
+            for i, result in zip(hashed, cached):
+                results[i] = result
+        todo = [i for i in range(len(batch)) if results[i] is None]
+        if todo:
+            screened = pool.map(screen_image, [batch[i][0] for i in todo], [batch[i][1] for i in todo],
+                                itertools.repeat(self.accepted_height), itertools.repeat(self.accepted_width),
+                                chunksize=max(1, len(todo) // max(1, pool.processes)))
+            for i, result in zip(todo, screened):
+                results[i] = result
+                if cache is not None and digests[i] is not None:
+                    cache.put(digests[i], batch[i][0], self.accepted_height, self.accepted_width, result)
+        return results
+
+    def screening_status(self, removed_files, total_files):
+        """
+        Builds the result of a training data set screening from the removed files.
+        Arguments: removed_files (list): Files that failed the image quality validation.
+                   total_files (int): Number of files in the data set.
+        Returns:(dict): Status code, message and list of removed files.
+        """
         if not(removed_files):
             return {"status": 200, "message":"Image Quality validation successful. All images passed image quality validation"}
         elif (len(removed_files) == total_files):
@@ -71,7 +199,6 @@ class ImageQualityValidation:
         Function to check duplicate dicom images in the training dataset and removes it 
         Arguments: folder_path (str): The path to the folder containing training dataset.
         Returns: duplicates(list): A list of file paths for the removed duplicate DICOM images.
-        Raises: Exception: If there is an error reading the DICOM file.
         """
         sop_instance_uids = {}
         duplicates = []
@@ -87,8 +214,8 @@ class ImageQualityValidation:
                             os.remove(file_path)
                         else:
                             sop_instance_uids[sop_instance_uid] = file_path  
-                except Exception as e:
-                    return f"Error reading: {e}"
+                except Exception:
+                    continue # unreadable files are left to the resolution screening
         return duplicates
     
     def remove_blank_image_folder(self, folder_path):
@@ -147,14 +274,9 @@ class ImageQualityValidation:
         Returns(bool): return True if image passed the resolution screening, false if it failed.                            
         """
         try:
-            ds = pydicom.dcmread(BytesIO(image_bytes), force=True)
-            pixel_data = ds.pixel_array
-            width, height = pixel_data.shape
-            result = self.check_resolution(height, width)
-            return result
-        except AttributeError:
-            # Handle the case where 'TransferSyntaxUID' attribute is not present
-            # You can choose to log a warning or handle it differently based on your needs
+            height, width = read_image_size(image_bytes, "dcm") # header only, the pixel data is not decoded
+            return self.check_resolution(height, width)
+        except DicomNumpyConversionError:
             return False     
          
     def image_resolution_screening_non_dicom(self,image_bytes):
@@ -163,8 +285,7 @@ class ImageQualityValidation:
         Arguments: image_bytes: non dicom image data in bytes format.
         Returns(bool): return True if image passed the resolution screening, false if it fails.                             
         """
-        img = Image.open(BytesIO(image_bytes))
-        width, height = img.size
+        height, width = read_image_size(image_bytes, "png") # PIL detects the raster format from the content
         return self.check_resolution(height, width)
                  
     def blank_image_screening_dicom_inferencing(self,image_bytes):
@@ -174,7 +295,7 @@ class ImageQualityValidation:
         Returns(bool): True if imageis not blank, false if it is blank.                      
         """
         dicom_array = self.convert_dicom_bytes_to_numpy(image_bytes)
-        return not np.all(dicom_array == dicom_array[0])
+        return not is_blank(dicom_array)
                
     def blank_image_screening_non_dicom_inferencing(self,image_bytes):
         """
@@ -185,8 +306,29 @@ class ImageQualityValidation:
         Returns(bool): return True if imageis not blank, false if it is blank.      
         """
         image_array = self.convert_non_dicom_bytes_to_numpy(image_bytes)
-        return not(np.all(image_array == image_array[0]))
+        return not is_blank(image_array)
            
+    def check_image_resolution_decoded(self, decoded_image):
+        """
+        Performs image resolution screening on an already decoded image.
+
+        Arguments: decoded_image (DecodedImage): Image decoded once by the caller.
+
+        Returns(bool): True if the image passed the resolution screening, False if it failed.
+        """
+        return self.check_resolution(decoded_image.height, decoded_image.width)
+
+    def blank_image_screening_decoded(self, decoded_image):
+        """
+        Performs blank image screening on an already decoded image.
+
+        Arguments: decoded_image (DecodedImage): Image decoded once by the caller.
+
+        Returns(bool): True if image is not blank, False if it is blank.
+        """
+        image_array = decoded_image.pixel_array
+        return not is_blank(image_array)
+
     def check_image_resolution_file(self, file_path):
         """
         Function to perform image resolution screening for inference data .
@@ -219,18 +361,12 @@ class ImageQualityValidation:
         Returns: True, if the DICOM image resolution is greater than or equal to the stated resolution
                 False , if the DICOM image resolution is less than the stated resolution
     
-        Raises: DicomNumpyConversionError: If there is an error converting the DICOM file to a NumPy array or if
-                                       the DICOM array is None.
+        Raises: DicomNumpyConversionError: If the DICOM header has no Rows/Columns.
                 Exception: If any other unexpected error occurs during the process.
         """ 
         try:
-            dicom_array = self.convert_dcm_to_numpy(file_path)# calls the convert_dcm_to_numpy function
-            if dicom_array is not None:
-                height = dicom_array.shape[0]
-                width = dicom_array.shape[1]
-                return self.check_resolution(height,width) # calls the check_resolution function to check the input image passed the resolution criteria.
-            else:
-                raise DicomNumpyConversionError("Error converting DICOM to NumPy array or DICOM array is None.")
+            height, width = read_image_size(file_path, "dcm") # reads Rows/Columns from the header, the pixel data is not decoded
+            return self.check_resolution(height,width) # calls the check_resolution function to check the input image passed the resolution criteria.
         except Exception as e:
             return f"Error: {e}"
             
@@ -243,19 +379,13 @@ class ImageQualityValidation:
         Returns:True, if the image resolution is greater than or equal to the stated resolution
                 False , if the image resolution is less than the stated resolution
     
-        Raises: ImageNumpyConversionError: If there is an error converting the non-DICOM file to a NumPy array or if
-                            the image array is None.
+        Raises: ImageNumpyConversionError: If the image header cannot be read.
                 Exception: If any other unexpected error occurs during the process.
         """
         try:
             extension = file_path.split(".")[-1]
-            image_array =self.convert_nondcm_to_numpy(file_path,file_type=extension)# call the convert_nondcm_to_numpy function
-            if image_array is not None:
-                height = image_array.shape[0]
-                width = image_array.shape[1]
-                return self.check_resolution(height,width)  # calls the check_resolution function to check the input image passed the resolution criteria.
-            else:
-                raise ImageNumpyConversionError("Error converting image to NumPy array or image array is None.")
+            height, width = read_image_size(file_path, extension) # lazy open, only the image header is read
+            return self.check_resolution(height,width)  # calls the check_resolution function to check the input image passed the resolution criteria.
         except Exception as e:
             return (f"Error: {e}")
               
@@ -274,12 +404,12 @@ class ImageQualityValidation:
             #Check the input dicom image is blank or not
             if pydicom.misc.is_dicom(file_path):
                 dicom_array = self.convert_dcm_to_numpy(file_path)# call the convert_dcm_to_numpy function
-                return not(np.all(dicom_array == dicom_array[0]))    
+                return not is_blank(dicom_array)
             else:
                 #Check the input image is blank or not for non-dicom images(jpg,png,bmp)
                 extension = file_path.split(".")[-1]
                 image_array =self.convert_nondcm_to_numpy(file_path,file_type=extension)# call the convert_nondcm_to_numpy function
-                return not(np.all(image_array == image_array[0]))
+                return not is_blank(image_array)
         except Exception as e:
             return f"Error reading {file_path} : {e}"
 
@@ -344,3 +474,138 @@ class ImageQualityValidation:
         rows, cols = int(dcm_ds.Rows), int(dcm_ds.Columns)
         image_arr = np.reshape(pixel_data, (rows, cols))     
         return image_arr
+
+def is_blank(pixel_array, sample_size=4096, chunk_size=65536):
+    """
+    Checks if every pixel of an image has the value of the first pixel (the
+    same colour for (height, width, channels) arrays).
+    A strided sample of about 'sample_size' pixels is compared first, which
+    is enough to reject almost any real image; only a blank candidate is
+    confirmed on all pixels, 'chunk_size' pixels at a time, stopping at the
+    first chunk that differs. The pixels are compared slice by slice of the
+    first axis of the original array, so no full size temporary is allocated
+    even for a non-contiguous view (a cropped or transposed image, or one
+    frame of a series).
+    Arguments: pixel_array (numpy.ndarray): Decoded image.
+    Returns(bool): True if the image is blank.
+    """
+    if pixel_array.size == 0 or pixel_array.ndim == 0:
+        return True
+    if pixel_array.ndim == 3 and pixel_array.shape[-1] <= 4:
+        value = pixel_array[0, 0] # one colour, compared on the channel axis
+    else:
+        value = pixel_array[(0,) * pixel_array.ndim]
+    sampled_axes = min(2, pixel_array.ndim)
+    step = max(1, int((pixel_array.size / sample_size) ** (1 / sampled_axes)))
+    if (pixel_array[(slice(None, None, step),) * sampled_axes] != value).any():
+        return False
+    rows = max(1, chunk_size * pixel_array.shape[0] // pixel_array.size)
+    for start in range(0, pixel_array.shape[0], rows):
+        if (pixel_array[start:start + rows] != value).any():
+            return False
+    return True
+
+def read_image_size(image_data, img_type="dcm"):
+    """
+    Reads the resolution of an image from its header, without decoding the
+    pixel data: Rows/Columns of a DICOM file read with stop_before_pixels, or
+    the size of a lazily opened PIL image for raster formats.
+    Arguments: image_data (bytes or str): Image data, or the path of the image file.
+               img_type (str): 'dcm', or a raster format ('jpg', 'png', 'bmp').
+    Returns(tuple): (height, width).
+    Raises: DicomNumpyConversionError: If the DICOM header cannot be read or has no Rows/Columns.
+            ImageNumpyConversionError: If the raster image header cannot be read.
+            FileFormatError: If the format is not DICOM, JPG, PNG or BMP.
+    """
+    source = image_data if isinstance(image_data, str) else BytesIO(image_data)
+    if img_type == "dcm":
+        try:
+            ds = pydicom.dcmread(source, force=True, stop_before_pixels=True, specific_tags=['Rows', 'Columns'])
+            return int(ds.Rows), int(ds.Columns)
+        except Exception as e:
+            raise DicomNumpyConversionError(f"Error reading the DICOM image size: {e}")
+    elif img_type in ['jpg', 'jpeg', 'png', 'bmp']:
+        try:
+            with Image.open(source) as img:
+                (width, height) = img.size
+            return height, width
+        except Exception as e:
+            raise ImageNumpyConversionError(f"Error reading the image size: {e}")
+    else:
+        raise FileFormatError("File format is not valid.")
+
+def screen_image(file_name, data, accepted_height=512, accepted_width=512):
+    """
+    Decodes one image of a data set, runs the resolution and blank checks on
+    that single decode and computes the hashes used to find duplicates.
+    Module level so that it can run on a CpuWorkerPool.
+    Arguments: file_name (str): Name of the image, its extension gives the format. When
+                                'data' is None it is the path of the file to read.
+                                DICOM files are recognised by content as well.
+               data (bytes): Image data, an object with a read() method (e.g. a ZipMember), or None.
+               accepted_height (int), accepted_width (int): Minimum resolution.
+    Returns(dict): 'passed' (bool), 'reason' the image failed ('format', 'resolution',
+                   'blank' or None), 'size' ([height, width] or None), 'sop_instance_uid'
+                   and 'hashes' (see image_hashes, None if the image failed).
+    """
+    result = {"passed": False, "reason": "format", "size": None, "sop_instance_uid": None, "hashes": None}
+    extension = file_name.split(".")[-1].lower()
+    iv = ImageQualityValidation()
+    iv.accepted_height, iv.accepted_width = accepted_height, accepted_width
+    try:
+        if data is None:
+            with open(file_name, 'rb') as f:
+                data = f.read()
+        elif hasattr(data, 'read'):
+            data = data.read()
+        if extension not in ['jpg', 'png', 'bmp'] and data[128:132] == b"DICM":
+            extension = "dcm"
+        # Low resolution images are rejected from the header, without decoding the pixel data
+        result["size"] = list(read_image_size(data, extension))
+        if not iv.check_resolution(*result["size"]):
+            result["reason"] = "resolution"
+            return result
+        decoded_image = DecodedImage.from_data(data, extension)
+    except (OSError, ValueError, zipfile.BadZipFile, FileFormatError, DicomNumpyConversionError, ImageNumpyConversionError):
+        return result
+    if not iv.check_image_resolution_decoded(decoded_image):
+        result["reason"] = "resolution"
+        return result
+    if not iv.blank_image_screening_decoded(decoded_image):
+        result["reason"] = "blank"
+        return result
+    if decoded_image.header is not None and decoded_image.header.get('SOPInstanceUID') is not None:
+        result["sop_instance_uid"] = str(decoded_image.header.SOPInstanceUID)
+    result.update(passed=True, reason=None,
+                  hashes=image_hashes(data, decoded_image.pixel_array, result["sop_instance_uid"]))
+    return result
+
+class ScreeningCache:
+    """
+    Screening results of single images, keyed by the SHA-256 of the file and
+    the validator version, so that a data set uploaded again only decodes the
+    files that changed. The results are kept in 'store' (a namespace of the
+    gateway state, shared by the workers) and expire after 'ttl' seconds.
+    Bump VALIDATOR_VERSION whenever screen_image changes its checks, which
+    invalidates every cached result.
+    """
+    def __init__(self, store, version=None, ttl=None):
+        self.store = store
+        self.version = VALIDATOR_VERSION if version is None else version
+        self.ttl = ttl
+
+    def key(self, digest, file_name, accepted_height, accepted_width):
+        extension = file_name.split(".")[-1].lower() # raster formats are told apart by extension
+        return f"screen:{self.version}:{accepted_height}x{accepted_width}:{extension}:{digest}"
+
+    def get(self, digest, file_name, accepted_height, accepted_width):
+        return self.store.get(self.key(digest, file_name, accepted_height, accepted_width))
+
+    def get_many(self, files, accepted_height, accepted_width):
+        """ Returns the cached results of (digest, file_name) pairs, None where missing, in one store lookup. """
+        keys = [self.key(digest, file_name, accepted_height, accepted_width) for (digest, file_name) in files]
+        results = self.store.get_many(keys)
+        return [results.get(key) for key in keys]
+
+    def put(self, digest, file_name, accepted_height, accepted_width, result):
+        self.store.set(self.key(digest, file_name, accepted_height, accepted_width), result, self.ttl)
@@ -3,6 +3,7 @@ import numpy as np
 import pydicom
 import io
 from PIL import Image
+from utils.image_utils.decoded_image import DecodedImage
 
 class InvalidFileFormatError(Exception):
     pass
@@ -157,6 +158,102 @@ class ImageProcessing():
             else:
                 raise ValueError("Unsupported image data")
 
+    def decoded_to_array(self, decoded_image):
+        """
+        Get the single channel pixel array of an already decoded image.
+
+        Parameters:
+        - decoded_image: DecodedImage shared with the image validator.
+
+        Returns:
+        - img_array: NumPy array of shape (height, width) in the source dtype.
+
+        Notes:
+        - DICOM pixel data is returned as decoded, without another 'pydicom.dcmread'.
+        - RGB raster images are converted to grayscale, as the model input has one channel.
+        """
+        img_array = decoded_image.pixel_array
+        if img_array.ndim == 3:
+            img_array = cv2.cvtColor(img_array, cv2.COLOR_RGB2GRAY)
+        return img_array
+
+    def batch_to_array(self, images, shape=(224, 224), dtype=None, normalize=False, out=None, check=None):
+        """
+        Fill one contiguous (N, height, width) array with a batch of images.
+
+        Parameters:
+        - images: List of images; each a DecodedImage, a NumPy array or an (image data, image type)
+          pair decoded with 'DecodedImage.from_data'.
+        - shape: Tuple (height, width) of the output images.
+        - dtype: dtype of the output array. Defaults to float32 with 'normalize', otherwise to the
+          dtype of the first image that decodes.
+        - normalize: If True, every image is scaled to the [0, 1] range in place.
+        - out: Optional preallocated array of shape (N, height, width), e.g. reused across batches.
+        - check: Optional callable run on each DecodedImage; raising rejects the image.
+
+        Returns:
+        - (batch, errors): 'batch' is the filled array. 'errors' has one entry per image: None if the
+          image was written, else the error message; the rows of failed images are zero.
+
+        Notes:
+        - Each image is resized straight into its row of 'batch', through a reused (height, width)
+          buffer when the dtype has to be converted, so no array is allocated per image.
+        - An image whose dtype cannot be safely cast to the output dtype (e.g. uint16 into uint8)
+          is reported as failed.
+        """
+        (height, width) = shape
+        if dtype is None and normalize:
+            dtype = np.float32
+        batch = out
+        if batch is not None and (batch.shape != (len(images), height, width) or not batch.flags['C_CONTIGUOUS']):
+            raise ValueError(f"'out' must be a contiguous array of shape {(len(images), height, width)}")
+        if batch is None and dtype is not None:
+            batch = np.empty((len(images), height, width), dtype=dtype)
+        errors = [None] * len(images)
+        scratch = {}
+        for (index, image) in enumerate(images):
+            try:
+                img_array = self._batch_item_array(image, check)
+                if batch is None:
+                    batch = np.empty((len(images), height, width), dtype=img_array.dtype)
+                if not np.can_cast(img_array.dtype, batch.dtype):
+                    raise ValueError(f"Image dtype {img_array.dtype} cannot be stored as {batch.dtype}")
+                self._resize_into(img_array, batch[index], scratch)
+                if normalize:
+                    max_value = batch[index].max()
+                    if max_value > 0:
+                        np.divide(batch[index], max_value, out=batch[index])
+            except Exception as e:
+                errors[index] = str(e)
+        if batch is None:
+            batch = np.zeros((len(images), height, width), dtype=np.float32)
+        for (index, error) in enumerate(errors):
+            if error is not None:
+                batch[index] = 0
+        return batch, errors
+
+    def _batch_item_array(self, image, check=None):
+        if isinstance(image, np.ndarray):
+            return image
+        if not isinstance(image, DecodedImage):
+            image = DecodedImage.from_data(*image)
+        if check is not None:
+            check(image)
+        return self.decoded_to_array(image)
+
+    def _resize_into(self, img_array, row, scratch):
+        """ Resize 'img_array' into the (height, width) array 'row', converting to its dtype. """
+        if img_array.shape[:2] == row.shape:
+            np.copyto(row, img_array, casting='safe')
+        elif img_array.dtype == row.dtype:
+            cv2.resize(img_array, (row.shape[1], row.shape[0]), dst=row)
+        else:
+            buffer = scratch.get(img_array.dtype)
+            if buffer is None:
+                buffer = scratch[img_array.dtype] = np.empty(row.shape, dtype=img_array.dtype)
+            cv2.resize(img_array, (row.shape[1], row.shape[0]), dst=buffer)
+            np.copyto(row, buffer, casting='safe')
+
     def normalize_img(self, img_array):
          """
          Normalize a NumPy array representing image data to the [0, 1] range.
@@ -0,0 +1,60 @@
+import io
+import pydicom
+from PIL import Image
+from idiagnose_common.windowing import to_uint8
+
+PREVIEW_SIZES = (128, 256, 512)
+PREVIEW_FORMATS = {"jpeg": ("JPEG", "image/jpeg"), "png": ("PNG", "image/png")}
+
+def windowed_image(ds):
+    """
+    Converts the pixel data of a DICOM data set into an 8-bit PIL image,
+    applying the VOI window of the data set and inverting MONOCHROME1 images.
+    Only the first frame of a multi-frame data set is used.
+
+    Args:
+    - ds (pydicom.Dataset): DICOM data set with pixel data.
+
+    Returns:
+    - PIL.Image: Grayscale ('L') or RGB image.
+    """
+    pixel_array = ds.pixel_array
+    colour = int(ds.get("SamplesPerPixel", 1)) > 1
+    if pixel_array.ndim == (4 if colour else 3):
+        pixel_array = pixel_array[0]
+    if colour:
+        return Image.fromarray(to_uint8(pixel_array, ds)).convert("RGB")
+    return Image.fromarray(to_uint8(pixel_array, ds), mode="L")
+
+def render_previews(byte_data, sizes=PREVIEW_SIZES, fmt="jpeg"):
+    """
+    Renders thumbnails of a DICOM image at several sizes from one decode.
+    Each thumbnail fits in a size x size box and keeps the aspect ratio.
+
+    Args:
+    - byte_data (bytes): Byte data of the DICOM file.
+    - sizes (tuple): Edge lengths of the bounding boxes, in pixels.
+    - fmt (str): 'jpeg' or 'png'.
+
+    Returns:
+    - dict: Encoded thumbnail bytes per size.
+
+    Raises:
+    - ValueError: If the format is not supported.
+    """
+    if fmt not in PREVIEW_FORMATS:
+        raise ValueError(f"Unsupported preview format: {fmt}")
+    pil_format = PREVIEW_FORMATS[fmt][0]
+    image = windowed_image(pydicom.dcmread(io.BytesIO(byte_data), force=True))
+    previews = {}
+    for size in sorted(sizes, reverse=True):
+        # Downscale from the previous (larger) thumbnail, not from the full image.
+        image = image.copy()
+        image.thumbnail((size, size), Image.LANCZOS)
+        buffer = io.BytesIO()
+        if pil_format == "JPEG":
+            image.save(buffer, pil_format, quality=85, optimize=True)
+        else:
+            image.save(buffer, pil_format, optimize=True)
+        previews[size] = buffer.getvalue()
+    return previews
@@ -0,0 +1,107 @@
+import hashlib
+import json
+import logging
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from apscheduler.schedulers.background import BackgroundScheduler
+from collection.schedule_store import InMemoryScheduleStore
+
+logger = logging.getLogger(__name__)
+
+class InferenceScheduler:
+    """
+    Periodic auto-inferencing sweeps shared by every gateway worker process.
+
+    Job definitions live in 'store' (MongoScheduleStore in production), so a
+    job configured on one worker can be listed or cancelled on any other and
+    survives restarts. Every (user, tag set) pair maps to one job, so
+    configuring the same context again replaces it instead of starting another
+    sweep.
+
+    Each worker polls the store every 'poll_seconds' and claims the due jobs
+    atomically: a run is started by exactly one worker, which holds a lease on
+    the job for at most 'lease_seconds' so the next run cannot overlap it.
+    Missed runs are coalesced into one, and 'jitter' seconds of random delay
+    spread the sweeps of different users over the interval.
+    """
+    def __init__(self, store=None, interval_minutes=60, jitter=300, poll_seconds=30, lease_seconds=3600):
+        self.store = store if store is not None else InMemoryScheduleStore()
+        self.interval_minutes = interval_minutes
+        self.jitter = jitter
+        self.poll_seconds = poll_seconds
+        self.lease_seconds = lease_seconds
+        self.fn = None
+        self._scheduler = None
+        self._lock = threading.Lock()
+
+    @property
+    def scheduler(self):
+        with self._lock:
+            if self._scheduler is None:
+                self._scheduler = BackgroundScheduler(job_defaults={"coalesce": True, "max_instances": 1})
+                self._scheduler.start()
+            return self._scheduler
+
+    def start(self, fn):
+        """ Starts polling the store on this worker; due jobs run fn(tags, user). """
+        self.fn = fn
+        self.scheduler.add_job(self.poll, 'interval', seconds=self.poll_seconds,
+                               id='auto-infer-poll', replace_existing=True)
+
+    @staticmethod
+    def job_id(user, tags):
+        digest = hashlib.sha1(json.dumps(tags, sort_keys=True, default=str).encode()).hexdigest()[:16]
+        return f"auto-infer:{user}:{digest}"
+
+    def schedule(self, user, tags):
+        """ Adds, or replaces, the sweep of 'user' for 'tags'. Returns its job id. """
+        job_id = self.job_id(user, tags)
+        self.store.put(job_id, user, tags, self._next_run(time.time()))
+        return job_id
+
+    def list_jobs(self, user=None):
+        jobs = []
+        for job in self.store.find(user):
+            next_run = datetime.fromtimestamp(job["next_run"], timezone.utc).isoformat()
+            jobs.append({"job_id": job["_id"], "user": job["user"], "tags": job["tags"], "next_run_time": next_run})
+        return jobs
+
+    def cancel(self, job_id, user=None):
+        """ Removes a job. Returns False if it does not exist or belongs to another user. """
+        return self.store.delete(job_id, user)
+
+    def claim_due(self):
+        """ Claims, for this worker, every job that is due and not running elsewhere. """
+        now = time.time()
+        claimed = []
+        while True:
+            job = self.store.claim_due(now, now + self.lease_seconds, self._next_run(now))
+            if job is None:
+                return claimed
+            claimed.append(job)
+
+    def poll(self):
+        try:
+            claimed = self.claim_due()
+        except Exception:
+            logger.exception("Could not read the auto-inferencing jobs")
+            return
+        for job in claimed:
+            self.scheduler.add_job(self.run, args=[job])
+
+    def run(self, job):
+        try:
+            self.fn(job["tags"], job["user"])
+        finally:
+            self.store.release(job["_id"])
+
+    def shutdown(self):
+        with self._lock:
+            if self._scheduler is not None:
+                self._scheduler.shutdown(wait=False)
+                self._scheduler = None
+
+    def _next_run(self, now):
+        return now + self.interval_minutes * 60 + random.uniform(0, self.jitter)
@@ -0,0 +1,164 @@
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from idiagnose_common.tracing import bind_context
+
+logger = logging.getLogger(__name__)
+
+class JobProgress:
+    """
+    Handle given to a running job to report its progress. Updates are written
+    to the job record at most every 'interval' seconds so that a long screening
+    does not turn into one state write per image.
+    """
+    def __init__(self, manager, job_id, interval=1.0):
+        self.manager = manager
+        self.job_id = job_id
+        self.interval = interval
+        self._last_update = 0.0
+
+    def __call__(self, done, total):
+        now = time.monotonic()
+        if done < total and now - self._last_update < self.interval:
+            return
+        self._last_update = now
+        self.manager.update(self.job_id, progress={"done": done, "total": total})
+
+class JobManager:
+    """
+    Runs long gateway operations (data set validation and upload) on a
+    background worker pool so that the request returns right away with a job
+    id, which the caller polls for status, progress and result.
+
+    Job records are kept in the gateway state ('job:<id>' keys), so with
+    GatewayState any worker process can answer the status poll. A record
+    expires 'retention' seconds after its last update.
+
+    A job runs on the worker process that accepted it, which refreshes the
+    record every 'stale_after' / 3 seconds while the job is queued or running.
+    A queued or running record not refreshed for 'stale_after' seconds was
+    left by a worker that stopped: it is marked failed, and its spool file
+    removed, when it is polled or by the periodic sweep of start().
+    """
+    def __init__(self, state, workers=2, retention=7 * 24 * 3600, stale_after=600):
+        self.state = state
+        self.workers = workers
+        self.retention = retention
+        self.stale_after = stale_after
+        self._executor = None
+        self._active = set()
+        self._lock = threading.Lock()
+        self._update_lock = threading.RLock()
+        self._stop = threading.Event()
+        self._heartbeat = None
+
+    @property
+    def executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers)
+            return self._executor
+
+    def start(self):
+        """ Starts refreshing the records of this worker's jobs and failing the stale jobs of stopped workers. """
+        with self._lock:
+            if self._heartbeat is None:
+                self._stop.clear()
+                self._heartbeat = threading.Thread(target=self._beat, daemon=True)
+                self._heartbeat.start()
+
+    def submit(self, kind, owner, fn, *args, spool=None):
+        """
+        Queues fn(progress, *args) and returns the job id. The return value of
+        'fn' is stored as the job result; if it is a dict with 'removed_files'
+        they are also exposed on the job record. 'spool' is the temporary file
+        of the job, removed if the job is failed as stale.
+        """
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        self._active.add(job_id)
+        self.state.set(self._key(job_id), {"job_id": job_id, "kind": kind, "owner": owner,
+                                           "status": "queued", "progress": {"done": 0, "total": None},
+                                           "removed_files": [], "result": None, "error": None,
+                                           "spool": spool, "created": now, "updated": now}, self.retention)
+        self.executor.submit(bind_context(self._run), job_id, fn, args)
+        return job_id
+
+    def get(self, job_id):
+        record = self.state.get(self._key(job_id))
+        if self._is_stale(record, time.time()):
+            record = self._fail_stale(record)
+        return record
+
+    def update(self, job_id, **fields):
+        with self._update_lock:
+            record = self.state.get(self._key(job_id))
+            if record is None:
+                return
+            record = dict(record)
+            record.update(fields)
+            record["updated"] = time.time()
+            self.state.set(self._key(job_id), record, self.retention)
+
+    def fail_stale(self):
+        """ Marks failed the queued or running jobs left by stopped workers. Returns their ids. """
+        now = time.time()
+        failed = []
+        for key in self.state.find_keys([self._key("")]):
+            record = self.state.get(key)
+            if self._is_stale(record, now):
+                self._fail_stale(record)
+                failed.append(record["job_id"])
+        return failed
+
+    def shutdown(self):
+        with self._lock:
+            self._stop.set()
+            if self._heartbeat is not None:
+                self._heartbeat.join()
+                self._heartbeat = None
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+    def _run(self, job_id, fn, args):
+        try:
+            self.update(job_id, status="running")
+            try:
+                result = fn(JobProgress(self, job_id), *args)
+            except Exception as e:
+                self.update(job_id, status="failed", error=str(e),
+                            removed_files=getattr(e, 'removed_files', []))
+                return
+            removed_files = result.get("removed_files", []) if isinstance(result, dict) else []
+            self.update(job_id, status="succeeded", result=result, removed_files=removed_files)
+        finally:
+            self._active.discard(job_id)
+
+    def _beat(self):
+        while not self._stop.wait(self.stale_after / 3):
+            try:
+                for job_id in list(self._active):
+                    self.update(job_id)
+                self.fail_stale()
+            except Exception:
+                logger.exception("Could not refresh the job records")
+
+    def _is_stale(self, record, now):
+        return (record is not None and record["status"] in ("queued", "running")
+                and record["job_id"] not in self._active and now - record["updated"] > self.stale_after)
+
+    def _fail_stale(self, record):
+        if record.get("spool"):
+            try:
+                os.remove(record["spool"])
+            except FileNotFoundError:
+                pass
+        self.update(record["job_id"], status="failed", error="The gateway worker running the job stopped")
+        return self.state.get(self._key(record["job_id"]))
+
+    def _key(self, job_id):
+        return f"job:{job_id}"
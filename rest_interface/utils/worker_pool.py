@@ -0,0 +1,108 @@
+import multiprocessing
+import threading
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+from utils.zip_utils import ZipMember
+
+class _SharedArray:
+    """ Reference to a NumPy array a worker process left in shared memory. """
+    def __init__(self, name, shape, dtype):
+        self.name = name
+        self.shape = shape
+        self.dtype = dtype
+
+def _run_shared(fn, in_name, in_size, args):
+    """
+    Worker side of CpuWorkerPool.run: reads the input bytes from shared memory,
+    calls 'fn' and hands NumPy results back through a new shared memory block.
+    """
+    shm = SharedMemory(name=in_name)
+    try:
+        data = bytes(shm.buf[:in_size])
+    finally:
+        shm.close()
+
+    result = fn(data, *args)
+    if isinstance(result, np.ndarray):
+        result = np.ascontiguousarray(result)
+        out = SharedMemory(create=True, size=max(1, result.nbytes))
+        try:
+            np.ndarray(result.shape, dtype=result.dtype, buffer=out.buf)[...] = result
+            return _SharedArray(out.name, result.shape, result.dtype.str)
+        finally:
+            out.close()
+    return result
+
+class CpuWorkerPool:
+    """
+    Process pool for CPU-bound gateway work (DICOM decoding, resizing, image
+    screening, PDF rendering) so that it does not hold the GIL of the
+    request threads.
+
+    Input bytes are passed to the workers through shared memory instead of
+    being pickled over the pool pipe, and NumPy results come back the same
+    way. With 'processes' set to 0 the work runs inline in the calling thread.
+
+    Workers are started by a fork server rather than forked from the gateway,
+    whose MongoDB, scheduler and request threads may hold locks at that time.
+    """
+    def __init__(self, processes=0):
+        self.processes = processes
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.processes,
+                                                     mp_context=multiprocessing.get_context("forkserver"))
+            return self._executor
+
+    def run(self, fn, data, *args):
+        """
+        Calls fn(data, *args) on a worker process and returns its result.
+        'data' can be bytes, a file-like object, a ZipMember (sent compressed
+        and inflated by 'fn' on the worker) or a file path; 'fn' and 'args'
+        must be picklable.
+        """
+        if hasattr(data, 'read') and not isinstance(data, ZipMember):
+            data = data.read()
+        if self.processes <= 0:
+            return fn(data, *args)
+        if not isinstance(data, (bytes, bytearray, memoryview)):
+            return self.executor.submit(fn, data, *args).result()
+
+        shm = SharedMemory(create=True, size=max(1, len(data)))
+        try:
+            shm.buf[:len(data)] = data
+            result = self.executor.submit(_run_shared, fn, shm.name, len(data), args).result()
+        finally:
+            shm.close()
+            shm.unlink()
+
+        if isinstance(result, _SharedArray):
+            out = SharedMemory(name=result.name)
+            try:
+                result = np.ndarray(result.shape, dtype=np.dtype(result.dtype), buffer=out.buf).copy()
+            finally:
+                out.close()
+                out.unlink()
+        return result
+
+    def map(self, fn, *iterables, chunksize=1):
+        """
+        Calls fn on the items of 'iterables' on the worker processes, like
+        Executor.map, and returns the results in order. Arguments are
+        pickled, so pass file paths rather than large buffers when possible.
+        """
+        if self.processes <= 0:
+            return list(map(fn, *iterables))
+        return list(self.executor.map(fn, *iterables, chunksize=chunksize))
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
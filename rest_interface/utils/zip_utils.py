@@ -1,30 +1,309 @@
 import zipfile
 import os
+import io
+import hashlib
+import struct
+import zlib
+
+STREAM_CHUNK_SIZE = 1024 * 1024
+IMAGE_EXTENSIONS = ('.jpg', '.png', '.bmp', '.dcm')
+MAX_MEMBERS = 100000 # file members of an uploaded data set
+MAX_UNCOMPRESSED_SIZE = 16 * 1024 ** 3 # declared total size of the members, in bytes
+MAX_COMPRESSION_RATIO = 100 # declared size / compressed size of the whole archive and of each large member
+MEMBER_RATIO_MIN_SIZE = 8 * 1024 * 1024 # smaller members are not ratio checked one by one, e.g. a blank image compresses past the limit
+SUPPORTED_COMPRESSION = (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED)
+LOCAL_HEADER_SIZE = 30
+LOCAL_HEADER_SIGNATURE = b'PK\x03\x04'
+
+class _ZipStreamBuffer(io.RawIOBase):
+    """
+    Write-only, non-seekable sink for ZipFile. Collects the bytes written
+    since the last drain so they can be sent to the client right away.
+    """
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self.chunks.append(bytes(b))
+        return len(b)
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+def stream_zip(entries, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Builds a zip archive on the fly from (filename, fileobj) pairs and yields
+    it chunk by chunk, e.g. for a streamed Flask response. Only one chunk of
+    each member is held in memory at a time and nothing is written to disk.
+    Member sizes are not known up front, so every member is written with
+    ZIP64 headers and may exceed 4 GiB.
+    """
+    buffer = _ZipStreamBuffer()
+    with zipfile.ZipFile(buffer, 'w') as zip_file:
+        for filename, fileobj in entries:
+            with zip_file.open(filename, 'w', force_zip64=True) as member:
+                while True:
+                    chunk = fileobj.read(chunk_size)
+                    if not chunk:
+                        break
+                    member.write(chunk)
+                    data = buffer.drain()
+                    if data:
+                        yield data
+            data = buffer.drain()
+            if data:
+                yield data
+    data = buffer.drain()
+    if data:
+        yield data
+
+class ZipMember:
+    """
+    Compressed payload of one archive member. It is read from the archive
+    without inflating it and is small to pickle, so the member is inflated
+    where it is consumed, e.g. on a CpuWorkerPool process. read() returns the
+    member bytes like a file object, so decoders accept it as image data.
+    """
+    def __init__(self, raw, compress_type, crc, file_size):
+        self.raw = raw
+        self.compress_type = compress_type
+        self.crc = crc
+        self.file_size = file_size
+
+    @property
+    def digest(self):
+        """
+        SHA-256 of the inflated member bytes, the same as content_hash of the
+        file, so it does not depend on the tool or level that compressed it.
+        Inflating is cheap next to decoding the image.
+        """
+        return hashlib.sha256(self.read()).hexdigest()
+
+    def read(self):
+        if self.compress_type == zipfile.ZIP_STORED:
+            data = self.raw
+        else:
+            # never inflate past the declared size: the archive limits only check declared sizes
+            inflater = zlib.decompressobj(-zlib.MAX_WBITS)
+            try:
+                data = inflater.decompress(self.raw, self.file_size + 1)
+            except zlib.error as e:
+                raise zipfile.BadZipFile(f"Corrupt member data: {e}")
+            if len(data) > self.file_size or inflater.unconsumed_tail:
+                raise zipfile.BadZipFile("Member data larger than its declared size")
+        if len(data) != self.file_size or zlib.crc32(data) != self.crc:
+            raise zipfile.BadZipFile("Bad CRC-32 or size of a member")
+        return data
+
+def _read_raw(fp, info):
+    fp.seek(info.header_offset)
+    header = fp.read(LOCAL_HEADER_SIZE)
+    if len(header) != LOCAL_HEADER_SIZE or header[:4] != LOCAL_HEADER_SIGNATURE:
+        raise zipfile.BadZipFile(f"Bad local file header of {info.filename}")
+    (name_length, extra_length) = struct.unpack('<HH', header[26:30])
+    fp.seek(info.header_offset + LOCAL_HEADER_SIZE + name_length + extra_length)
+    return fp.read(info.compress_size)
+
+def iter_zip_members(fileobj):
+    """
+    Yields (member name, ZipMember) for every file member of a zip archive.
+    Members are read raw and inflated by the consumer. Raises BadZipFile on
+    encrypted members and compression methods other than stored and deflate,
+    which ZipManager.check_limits rejects beforehand.
+    """
+    fp = open(fileobj, 'rb') if isinstance(fileobj, str) else fileobj
+    try:
+        with zipfile.ZipFile(fileobj, 'r') as zip:
+            for info in zip.infolist():
+                if info.is_dir():
+                    continue
+                if info.flag_bits & 0x1 or info.compress_type not in SUPPORTED_COMPRESSION:
+                    raise zipfile.BadZipFile(f"Encrypted or unsupported compression method: {info.filename}")
+                yield info.filename, ZipMember(_read_raw(fp, info), info.compress_type, info.CRC, info.file_size)
+    finally:
+        if fp is not fileobj:
+            fp.close()
+
+def extract_member(member, dest):
+    """ Inflates 'member' to the file 'dest'. Module level so it can run on a CpuWorkerPool. """
+    with open(dest, 'wb') as f:
+        f.write(member.read())
+    return dest
+
+def count_zip_members(fileobj):
+    """ Number of file members (directories excluded) of a zip archive. """
+    with zipfile.ZipFile(fileobj, 'r') as zip:
+        return sum(1 for info in zip.infolist() if not info.is_dir())
 
 class ZipManager:
-    def __init__(self, data):
+    def __init__(self, data, max_members=MAX_MEMBERS, max_uncompressed_size=MAX_UNCOMPRESSED_SIZE,
+                 max_compression_ratio=MAX_COMPRESSION_RATIO):
         self.data = data
         self.filename = None
         self.path = None
+        self.max_members = max_members
+        self.max_uncompressed_size = max_uncompressed_size
+        self.max_compression_ratio = max_compression_ratio
         
     def write(self, filename):
         self.filename = filename
         self.data.save(filename)
+
+    def open_zip(self):
+        """
+        Opens the archive from the written file, or directly from the uploaded
+        stream when it was not written to disk.
+        """
+        if self.filename is not None:
+            return zipfile.ZipFile(self.filename, 'r')
+        self.data.stream.seek(0)
+        return zipfile.ZipFile(self.data.stream, 'r')
                 
+    def source(self):
+        """ Path of the written archive, or the uploaded stream. """
+        if self.filename is not None:
+            return self.filename
+        self.data.stream.seek(0)
+        return self.data.stream
+
     def list_zip_data(self):
-        with zipfile.ZipFile(self.filename, 'r') as zip:
+        with self.open_zip() as zip:
             file_list = zip.namelist()
         return file_list
 
-    def extract(self, path):
+    def list_classes(self):
+        """ Returns the top-level entries of the archive, i.e. the class folders. """
+        classes = []
+        for name in self.list_zip_data():
+            top = name.split('/')[0]
+            if top and top not in classes:
+                classes.append(top)
+        return classes
+
+    def validate_members(self):
+        """
+        Validates the dataset from the central directory of the archive,
+        before anything is decompressed or extracted:
+        - limits: number of file members, declared uncompressed size and
+          compression ratio, which reject zip bombs from their metadata
+          (neither zipfile nor ZipMember inflates past the declared size),
+          and no encrypted members or compression methods other than stored
+          and deflate;
+        - member names: no absolute paths or '..' components;
+        - directory structure, same rules as validate_dataset: no file at the
+          root, image files only in leaf folders, at least two images per
+          folder and only JPG, PNG, BMP or DCM files.
+        Raises: ValueError: If the archive is rejected.
+        """
+        infos = self.validate_limits()
+
+        files_per_dir = {}
+        dirs = set()
+        for info in infos:
+            name = info.filename
+            parts = name.split('/')
+            if name.startswith('/') or '..' in parts or '\\' in name or ':' in parts[0]:
+                raise ValueError(f"Invalid member name: {name}")
+            if len(parts) == 1:
+                raise ValueError("Root folder should not consist of any file.")
+            if not name.lower().endswith(IMAGE_EXTENSIONS):
+                raise ValueError("Wrong data format")
+            parent = '/'.join(parts[:-1])
+            files_per_dir[parent] = files_per_dir.get(parent, 0) + 1
+            for i in range(1, len(parts) - 1):
+                dirs.add('/'.join(parts[:i]))
+        for parent, count in files_per_dir.items():
+            if parent in dirs:
+                raise ValueError("Wrong dataset directory structure!")
+            if count < 2:
+                raise ValueError("Wrong data format")
+
+    def validate_limits(self):
+        """
+        Checks the limits of the archive from its central directory, for
+        uploads with no data set structure (e.g. a batch of images to infer).
+        Returns the file members. Raises: ValueError: If the archive is rejected.
+        """
+        with self.open_zip() as zip:
+            infos = [info for info in zip.infolist() if not info.is_dir()]
+        self.check_limits(infos)
+        return infos
+
+    def check_limits(self, infos):
+        """
+        Checks the member count, declared sizes and compression ratios of the
+        archive entries, and that every member is unencrypted and stored or
+        deflated, so it can be inflated with a bounded size by ZipMember.
+        """
+        if len(infos) > self.max_members:
+            raise ValueError(f"Too many files in the archive: {len(infos)} (limit {self.max_members})")
+        total_size = 0
+        total_compressed = 0
+        for info in infos:
+            if info.flag_bits & 0x1:
+                raise ValueError(f"Encrypted files are not supported: {info.filename}")
+            if info.compress_type not in SUPPORTED_COMPRESSION:
+                raise ValueError(f"Unsupported compression method of {info.filename}")
+            if info.file_size > MEMBER_RATIO_MIN_SIZE and info.file_size > self.max_compression_ratio * max(info.compress_size, 1):
+                raise ValueError(f"Compression ratio of {info.filename} exceeds {self.max_compression_ratio}")
+            total_size += info.file_size
+            total_compressed += info.compress_size
+        if total_size > self.max_uncompressed_size:
+            raise ValueError(f"Uncompressed size of the archive exceeds {self.max_uncompressed_size} bytes")
+        if total_size > self.max_compression_ratio * max(total_compressed, 1):
+            raise ValueError(f"Compression ratio of the archive exceeds {self.max_compression_ratio}")
+
+    def iter_chunks(self, chunk_size=STREAM_CHUNK_SIZE):
+        """ Yields the raw archive bytes in chunks, e.g. to forward the upload. """
+        if self.filename is not None:
+            with open(self.filename, 'rb') as f:
+                yield from iter(lambda: f.read(chunk_size), b'')
+        else:
+            self.data.stream.seek(0)
+            yield from iter(lambda: self.data.stream.read(chunk_size), b'')
+
+    def iter_members(self):
+        """ Yields (member name, ZipMember) for the file members of the archive, see iter_zip_members. """
+        yield from iter_zip_members(self.source())
+
+    def extract(self, path, pool=None):
+        """
+        Extracts the archive to 'path' once validate_members accepted it.
+        With a CpuWorkerPool the members are inflated and written by its
+        worker processes, in batches, instead of one by one in this thread;
+        'path' can be on a tmpfs (e.g. /dev/shm) to keep the data set in memory.
+        """
+        self.validate_members()
         self.path = path
         try:
-            with zipfile.ZipFile(self.filename, 'r') as zip:
-                zip.extractall(path)
-                self.set_num_classes(path)
+            if pool is None or pool.processes <= 0:
+                with zipfile.ZipFile(self.filename, 'r') as zip:
+                    zip.extractall(path)
+            else:
+                os.makedirs(path, exist_ok=True)
+                batch = []
+                for name, member in self.iter_members():
+                    dest = os.path.join(path, *name.split('/'))
+                    os.makedirs(os.path.dirname(dest), exist_ok=True)
+                    batch.append((member, dest))
+                    if len(batch) >= pool.processes * 8:
+                        self._extract_batch(batch, pool)
+                        batch = []
+                if batch:
+                    self._extract_batch(batch, pool)
+            self.set_num_classes(path)
         except Exception as e:
             print("Error:",e)
         
+    def _extract_batch(self, batch, pool):
+        pool.map(extract_member, [member for (member, _) in batch], [dest for (_, dest) in batch],
+                 chunksize=max(1, len(batch) // pool.processes))
+
     def set_num_classes(self, path):
         self.NUM_CLASSES = len(os.listdir(path))
             
@@ -45,7 +324,7 @@ class ZipManager:
                 if len(i[2]) == 0:
                     print("Class Folders are validated.")
                 else:
-                    ValueError("Root folder should not consist of any file.")
+                    raise ValueError("Root folder should not consist of any file.")
             elif len(i[1]) == 0:
                 if len(i[2]) >= 2:
                     for name in i[2]: